@@ -0,0 +1,181 @@
+"""
+Cost-weighted admission control.
+
+Every job is charged its estimated CPU-seconds (see cost_model) against:
+  - the fleet backlog, a leaky bucket drained at the workers' throughput;
+    jobs that would push it past capacity get 503 + Retry-After
+  - a per-user token bucket refilled at a fixed CPU-seconds rate; users who
+    exhaust it get 429 + Retry-After
+
+Both are kept in Redis and updated in WATCH/MULTI transactions, so every
+API replica charges the same backlog and buckets. If Redis is unreachable,
+each process falls back to its own in-memory state.
+"""
+import math
+import os
+import time
+from threading import Lock
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+
+# CPU-seconds of queued work the fleet accepts before deferring new jobs
+QUEUE_CAPACITY_SECONDS = float(os.environ.get("QUEUE_CAPACITY_SECONDS", 3600))
+# CPU-seconds of work the fleet completes per second (total worker concurrency)
+WORKER_THROUGHPUT = float(os.environ.get("WORKER_THROUGHPUT", 4))
+# Per-user budget: refill rate and burst size, in CPU-seconds
+USER_CPU_SECONDS_PER_MINUTE = float(os.environ.get("USER_CPU_SECONDS_PER_MINUTE", 300))
+USER_BURST_SECONDS = float(os.environ.get("USER_BURST_SECONDS", 900))
+
+KEY_PREFIX = "pdfsimple:admission:"
+BACKLOG_KEY = KEY_PREFIX + "backlog"   # hash: seconds, at
+BUCKET_PREFIX = KEY_PREFIX + "user:"   # hash per user: tokens, at
+
+
+class AdmissionRejected(Exception):
+    """Raised when a job can't be admitted now (or ever)."""
+
+    def __init__(self, status_code, detail, retry_after=None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def headers(self):
+        if self.retry_after is None:
+            return None
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class AdmissionController:
+    def __init__(self, capacity=QUEUE_CAPACITY_SECONDS, throughput=WORKER_THROUGHPUT,
+                 user_rate_per_minute=USER_CPU_SECONDS_PER_MINUTE, user_burst=USER_BURST_SECONDS,
+                 clock=time.time, redis_url=REDIS_URL):
+        self.capacity = capacity
+        self.throughput = throughput
+        self.user_rate = user_rate_per_minute / 60.0
+        self.user_burst = user_burst
+        self.redis_url = redis_url
+        # Wall time: shared by every replica reading the Redis state
+        self._clock = clock
+        self._client = None
+        self._lock = Lock()
+        # In-memory fallback: [backlog, updated at] and user -> [tokens, updated at]
+        self._backlog = [0.0, clock()]
+        self._buckets = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=1)
+        return self._client
+
+    def _drain(self, backlog, at, now):
+        return max(0.0, backlog - max(0.0, now - at) * self.throughput)
+
+    def _refill(self, tokens, at, now):
+        return min(self.user_burst, tokens + max(0.0, now - at) * self.user_rate)
+
+    def _charge(self, backlog, tokens, cost):
+        """
+        (backlog, tokens) after charging `cost`, both already drained/refilled
+        to now, or raise AdmissionRejected.
+        """
+        # A job larger than the burst is allowed once the bucket is full
+        needed = min(cost, self.user_burst)
+        if tokens < needed:
+            raise AdmissionRejected(
+                429, "Processing budget exhausted, retry later",
+                (needed - tokens) / self.user_rate,
+            )
+        if backlog + cost > self.capacity:
+            raise AdmissionRejected(
+                503, "Workers are at capacity, retry later",
+                (backlog + cost - self.capacity) / self.throughput,
+            )
+        return backlog + cost, tokens - cost
+
+    def _read(self, pipe, key, default):
+        value, at = pipe.hmget(key, "value", "at")
+        if value is None or at is None:
+            return default, self._clock()
+        return float(value), float(at)
+
+    def backlog_seconds(self):
+        """Estimated CPU-seconds of admitted work not yet processed."""
+        try:
+            backlog, at = self._read(self.client, BACKLOG_KEY, 0.0)
+        except Exception:
+            with self._lock:
+                backlog, at = self._backlog
+        return self._drain(backlog, at, self._clock())
+
+    def _update_redis(self, user, update):
+        import redis
+
+        bucket_key = BUCKET_PREFIX + user
+        # A bucket left alone this long is full again
+        bucket_ttl = int(self.user_burst / self.user_rate) + 60
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(BACKLOG_KEY, bucket_key)
+                    now = self._clock()
+                    backlog = self._drain(*self._read(pipe, BACKLOG_KEY, 0.0), now)
+                    tokens = self._refill(*self._read(pipe, bucket_key, self.user_burst), now)
+                    backlog, tokens = update(backlog, tokens)
+                    pipe.multi()
+                    pipe.hset(BACKLOG_KEY, mapping={"value": backlog, "at": now})
+                    pipe.hset(bucket_key, mapping={"value": tokens, "at": now})
+                    pipe.expire(bucket_key, bucket_ttl)
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    # Another replica admitted a job in between: recompute
+                    continue
+
+    def _update_local(self, user, update):
+        with self._lock:
+            now = self._clock()
+            backlog = self._drain(*self._backlog, now)
+            tokens, at = self._buckets.get(user, (self.user_burst, now))
+            backlog, tokens = update(backlog, self._refill(tokens, at, now))
+            self._backlog = [backlog, now]
+            self._buckets[user] = [tokens, now]
+
+    def _update(self, user, update):
+        """
+        Apply update(backlog, tokens) -> (backlog, tokens) to the fleet backlog
+        and the user's bucket, in Redis or, if it is unreachable, locally.
+        """
+        try:
+            self._update_redis(user, update)
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"Admission state unavailable in Redis, using this process's: {str(e)}")
+            self._update_local(user, update)
+
+    def admit(self, user, cost):
+        """
+        Charge `cost` CPU-seconds to `user` and the fleet backlog, or raise AdmissionRejected.
+
+        Blocks on Redis round trips: call it from a worker thread.
+        """
+        if cost > self.capacity:
+            raise AdmissionRejected(
+                413, f"Job too expensive: estimated {cost:.0f} CPU-seconds exceeds the {self.capacity:.0f}s limit"
+            )
+        self._update(user, lambda backlog, tokens: self._charge(backlog, tokens, cost))
+
+    def refund(self, user, cost):
+        """
+        Give back an admitted job's charge when it never reached the workers.
+        """
+        self._update(user, lambda backlog, tokens: (
+            max(0.0, backlog - cost), min(self.user_burst, tokens + cost)
+        ))
+
+
+admission = AdmissionController()
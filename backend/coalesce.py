@@ -0,0 +1,136 @@
+"""
+Single-flight coalescing of identical jobs.
+
+A double-click or a client retry submits the same job twice. Jobs are keyed
+by (user, tool, SHA-256 of each input in order, normalized params); while a
+job with the same key is queued or running, a new submission attaches to
+its Celery task instead of enqueuing another, so both job ids resolve to the
+same result and the duplicate costs no worker time. Only a user's own jobs
+are joined: nobody gets another user's work (or its result) for free.
+
+The first request for a key claims it before its slow steps (quota,
+admission, publishing inputs) and settles it however the request ends
+(also on errors); identical requests arriving in between wait for that. Like jobs, flights are kept in
+memory per API replica.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from prometheus_client import Counter
+
+ENABLED = os.environ.get("JOB_COALESCING", "1") != "0"
+# How long a duplicate waits for the first request to be dispatched
+WAIT_SECONDS = float(os.environ.get("JOB_COALESCING_WAIT", 10))
+HASH_BUFFER = 1024 * 1024
+
+COALESCED = Counter("pdfsimple_jobs_coalesced", "Job submissions attached to an identical in-flight job", ["tool"])
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def job_key(tool, paths, params, owner=""):
+    """
+    Identity of a job: its owner, its tool, the content of its inputs and its params.
+
+    Args:
+        tool: Tool name
+        paths: Input paths, in the order the tool receives them
+        params: Job parameters; key order and null values are ignored
+        owner: User submitting the job
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(owner.encode() + b"\0" + tool.encode())
+    for path in paths:
+        file_digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BUFFER), b""):
+                file_digest.update(block)
+        digest.update(b"\0" + file_digest.digest())
+    digest.update(b"\0" + json.dumps(_normalize(params or {}), sort_keys=True, separators=(",", ":")).encode())
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, wait=WAIT_SECONDS, expire_every=60):
+        self.wait = wait
+        self.expire_every = expire_every
+        self.last_expired = time.monotonic()
+        # key -> (claimed at, claiming job id, future resolving to the dispatched job id or None)
+        self.flights = {}
+
+    async def join(self, key, job_id, is_active):
+        """
+        Find the in-flight job for `key`, or claim the key for `job_id`.
+
+        Args:
+            key: job_key() of the submission
+            job_id: Id of the submitting job
+            is_active: Callable(job_id) -> True while the job is queued or running;
+                it may block and is called from a worker thread
+
+        Returns:
+            Job id to attach to, or None when the caller must run the job
+            itself (and then call settle).
+        """
+        if time.monotonic() - self.last_expired > self.expire_every:
+            await self.expire(is_active)
+        while True:
+            flight = self.flights.get(key)
+            if flight is None:
+                self.flights[key] = (time.monotonic(), job_id, asyncio.get_running_loop().create_future())
+                return None
+            claimed_at, _, future = flight
+            try:
+                remaining = max(0.0, claimed_at + self.wait - time.monotonic())
+                leader = await asyncio.wait_for(asyncio.shield(future), remaining)
+            except asyncio.TimeoutError:
+                leader = None
+            # is_active asks the result backend: keep it off the event loop
+            if leader and await asyncio.to_thread(is_active, leader):
+                return leader
+            # The leader failed, finished or never settled: the key is free again
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def settle(self, key, job_id, dispatched):
+        """
+        Publish the outcome of `job_id`'s claim on `key`: whether its task was
+        queued, or not (rejected, failed or run inline).
+        """
+        flight = self.flights.get(key)
+        if flight is None or flight[1] != job_id:
+            return
+        future = flight[2]
+        if not future.done():
+            future.set_result(job_id if dispatched else None)
+        if not dispatched:
+            del self.flights[key]
+
+    async def expire(self, is_active):
+        """Forget settled flights whose job is no longer queued or running."""
+        self.last_expired = time.monotonic()
+        settled = [(key, flight) for key, flight in self.flights.items() if flight[2].done()]
+
+        def inactive():
+            return [(key, flight) for key, flight in settled
+                    if not (flight[2].result() and is_active(flight[1]))]
+
+        # One worker thread checks every settled flight's job state
+        for key, flight in await asyncio.to_thread(inactive):
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+
+single_flight = SingleFlight()
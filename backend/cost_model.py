@@ -0,0 +1,149 @@
+"""
+Job cost estimation.
+
+Estimates how many worker CPU-seconds a job will take from the tool, the
+page count (read cheaply through pdf_inspect), render DPI, image count and
+input size. Default per-page timings are refined with observed timings
+reported by the workers.
+"""
+import os
+from threading import Lock
+
+from pdf_inspect import inspect_pdf
+
+# tool -> (base seconds, seconds per page at reference DPI, reference DPI, DPI param default)
+# Raster tools scale with pixel count, i.e. with (dpi / reference dpi) ** 2.
+TOOL_COSTS = {
+    "merge": (0.2, 0.002, None, None),
+    "split": (0.2, 0.01, None, None),
+    "compress": (0.5, 0.15, None, None),
+    "convert": (2.0, 0.3, None, None),
+    "ocr": (0.5, 2.5, 300, 300),
+    "pdf_to_pptx": (1.0, 0.25, 150, 150),
+    "pdf_to_xlsx": (0.5, 0.15, None, None),
+    "pdf_to_html": (0.3, 0.05, None, None),
+    "images_to_pdf": (0.2, 0.05, None, None),
+    "watermark": (0.5, 0.3, 150, 150),
+    "page_numbers": (0.5, 0.25, 150, 150),
+    "rotate": (0.1, 0.001, None, None),
+    "metadata": (0.1, 0.001, None, None),
+    "protect": (0.1, 0.002, None, None),
+    "unlock": (0.1, 0.002, None, None),
+}
+
+DEFAULT_COST = (1.0, 0.2, None, None)
+
+# Seconds per MB for inputs whose pages can't be counted (office documents, damaged files)
+SECONDS_PER_MB = 0.5
+
+# Observed timings replace the defaults after this many samples
+MIN_SAMPLES = 5
+EWMA_ALPHA = 0.2
+
+
+class CostModel:
+    """Per-tool cost estimates, refined by observed per-page timings."""
+
+    def __init__(self):
+        self._lock = Lock()
+        # tool -> [samples, ewma seconds per page at reference DPI]
+        self._observed = {}
+
+    def _per_page(self, tool):
+        base, per_page, _, _ = TOOL_COSTS.get(tool, DEFAULT_COST)
+        with self._lock:
+            observed = self._observed.get(tool)
+        if observed and observed[0] >= MIN_SAMPLES:
+            return observed[1]
+        return per_page
+
+    @staticmethod
+    def _dpi_factor(tool, params):
+        _, _, ref_dpi, default_dpi = TOOL_COSTS.get(tool, DEFAULT_COST)
+        if tool == "pdf_to_html" and params.get("mode") == "images":
+            ref_dpi, default_dpi = 150, 150
+        if tool == "convert" and params.get("target_format") == "jpg":
+            ref_dpi, default_dpi = 150, 150
+        if not ref_dpi:
+            return 1.0
+        try:
+            dpi = float(params.get("dpi", default_dpi))
+        except (TypeError, ValueError):
+            dpi = default_dpi
+        return (dpi / ref_dpi) ** 2
+
+    @staticmethod
+    def _passes(tool, params):
+        """How many times the tool may process the document."""
+        if tool == "compress" and params.get("target_kb"):
+            # Up to three Ghostscript passes plus forced and rasterised fallbacks
+            return 4
+        return 1
+
+    def estimate(self, tool, pages, params=None, input_bytes=0):
+        """
+        Estimated CPU-seconds for a job.
+
+        Args:
+            tool: Tool name as accepted by /jobs
+            pages: Pages (or images) to process, None if unknown
+            params: Job params (dpi, mode, target_kb...)
+            input_bytes: Total input size
+        """
+        params = params or {}
+        if tool == "pipeline":
+            # One task running every step; native steps share a single parse
+            steps = [step for step in params.get("steps") or [] if isinstance(step, dict)]
+            if steps:
+                return sum(self.estimate(step.get("tool"), pages, step.get("params"), input_bytes) for step in steps)
+        base = TOOL_COSTS.get(tool, DEFAULT_COST)[0]
+        if pages is None:
+            return base + SECONDS_PER_MB * input_bytes / (1024 * 1024)
+
+        cost = base + pages * self._per_page(tool) * self._dpi_factor(tool, params)
+        return cost * self._passes(tool, params)
+
+    def observe(self, tool, pages, seconds, params=None):
+        """Record a finished job's measured duration."""
+        if not pages or seconds is None or seconds <= 0:
+            return
+        params = params or {}
+        # Normalised like estimate() scales it: one pass at the reference DPI
+        per_page = seconds / self._passes(tool, params) / pages / self._dpi_factor(tool, params)
+        with self._lock:
+            observed = self._observed.setdefault(tool, [0, per_page])
+            observed[0] += 1
+            observed[1] += EWMA_ALPHA * (per_page - observed[1])
+
+
+def count_units(tool, input_paths):
+    """
+    Pages (or images) a job will process, or None if they can't be counted cheaply.
+    """
+    if tool == "images_to_pdf":
+        return len(input_paths)
+
+    pages = 0
+    for path in input_paths:
+        if not path.lower().endswith(".pdf"):
+            return None
+        try:
+            info = inspect_pdf(path)
+        except Exception:
+            return None
+        if info.get("needs_password"):
+            return None
+        pages += info.get("page_count", 0)
+    return pages
+
+
+def estimate_job(tool, input_paths, params=None):
+    """
+    Returns (estimated CPU-seconds, counted pages or None) for a job.
+    """
+    pages = count_units(tool, input_paths)
+    input_bytes = sum(os.path.getsize(path) for path in input_paths)
+    return cost_model.estimate(tool, pages, params, input_bytes), pages
+
+
+cost_model = CostModel()
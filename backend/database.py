@@ -11,9 +11,11 @@ POSTGRES_DB = os.environ.get("POSTGRES_DB", "pdfsimple")
 POSTGRES_HOST = "postgres"
 POSTGRES_PORT = "5432"
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+# DATABASE_URL overrides the Postgres settings (e.g. sqlite:// for the load-test harness)
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL") or f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+connect_args = {"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -24,3 +26,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def init_db():
+    """
+    Create missing tables. Called from the app's startup, never at import time,
+    so importing the API does not need a database round-trip.
+    """
+    import models  # noqa: F401 - registers the tables on Base
+    Base.metadata.create_all(bind=engine)
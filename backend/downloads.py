@@ -0,0 +1,314 @@
+"""
+Result downloads with byte ranges, strong ETags and conditional requests.
+
+The ETag is the SHA-256 of the result file, cached per (path, size, mtime).
+Requests are answered with 304 when If-None-Match matches, 206 for a single
+satisfiable byte range (subject to If-Range) and 416 for unsatisfiable ones.
+Multi-range requests get the whole file, as RFC 9110 allows.
+
+With DOWNLOAD_ACCEL_REDIRECT set (e.g. "/protected-results/"), the body is
+handed to nginx through X-Accel-Redirect, which serves it with sendfile and
+handles ranges itself, so the API process never streams result bytes. The
+nginx location turns off its own ETag and forwards this one (see
+nginx/default.conf), so If-None-Match and If-Range keep working across both
+paths.
+Otherwise the body is sent with the ASGI zero-copy extension when the server
+supports it, and read in chunks from a worker thread when it does not.
+
+Multi-file results (a directory of per-part outputs) are zipped on the fly
+with ZIP_STORED while the client downloads, so workers never write a second
+copy of their outputs and PDFs/JPEGs are not recompressed.
+
+With object storage (workers/storage.py, STORAGE_BACKEND=s3) results are
+either redirected to a presigned URL (the default) or proxied with ranged
+GETs when STORAGE_REDIRECT_DOWNLOADS=0.
+"""
+import mimetypes
+import os
+import time
+import zipfile
+from collections import OrderedDict
+from email.utils import formatdate
+from threading import Lock
+from urllib.parse import quote
+
+import anyio
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+
+from pdf_inspect import file_sha256
+
+DATA_DIR = os.environ.get("DATA_DIR", "/data")
+ACCEL_REDIRECT_PREFIX = os.environ.get("DOWNLOAD_ACCEL_REDIRECT", "")
+CHUNK_SIZE = 256 * 1024
+ETAG_CACHE_SIZE = 4096
+REDIRECT_DOWNLOADS = os.environ.get("STORAGE_REDIRECT_DOWNLOADS", "1") != "0"
+
+_etags = OrderedDict()
+_etags_lock = Lock()
+
+
+def file_etag(path, stat=None):
+    """Strong ETag for a file's content, cached until the file changes."""
+    stat = stat or os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _etags_lock:
+        etag = _etags.get(key)
+        if etag is not None:
+            _etags.move_to_end(key)
+            return etag
+
+    etag = f'"{file_sha256(path)}"'
+    with _etags_lock:
+        _etags[key] = etag
+        while len(_etags) > ETAG_CACHE_SIZE:
+            _etags.popitem(last=False)
+    return etag
+
+
+def _etag_list(header):
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def _none_match(header, etag):
+    """If-None-Match uses weak comparison."""
+    tags = _etag_list(header)
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def parse_range(header, size):
+    """
+    Parse a Range header for a file of `size` bytes.
+
+    Returns:
+        (start, end) inclusive for a single satisfiable range, None when the
+        header should be ignored (absent, malformed or multiple ranges), or
+        False when the range is unsatisfiable.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+    first, sep, last = spec.partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return False
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """Send bytes [start, start + length) of a file, or only headers for HEAD."""
+
+    def __init__(self, path, start, length, status_code, headers, media_type, send_body=True):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.length = length
+        self.send_body = send_body
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or not self.length:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if "http.response.zerocopy" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopy", "file": f,
+                    "offset": self.start, "count": self.length, "more_body": False,
+                })
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = self.length
+            while remaining:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining:
+                # File shrank underneath us; close the body so the client sees a short read
+                await send({"type": "http.response.body", "body": b""})
+
+
+def _accel_path(path):
+    relative = os.path.relpath(os.path.realpath(path), os.path.realpath(DATA_DIR))
+    if relative.startswith(".."):
+        return None
+    return ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(relative)
+
+
+def _headers(etag, mtime, filename):
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+    }
+
+
+def _conditional(request, headers, size):
+    """
+    Apply If-None-Match, Range and If-Range.
+
+    Returns:
+        (response, None) when the request is answered without a body (304, 416),
+        otherwise (None, byte_range) with byte_range None for the whole file
+    """
+    etag = headers["ETag"]
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _none_match(if_none_match, etag):
+        return Response(status_code=304, headers={k: headers[k] for k in ("ETag", "Last-Modified", "Cache-Control")}), None
+
+    byte_range = parse_range(request.headers.get("range"), size)
+    if_range = request.headers.get("if-range")
+    if byte_range is not None and if_range and if_range.strip() not in (etag, headers["Last-Modified"]):
+        # The client's partial copy is stale: send the whole file
+        byte_range = None
+    if byte_range is False:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", "ETag": etag}), None
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+    else:
+        headers["Content-Length"] = str(size)
+    return None, byte_range
+
+
+async def file_download(request, path, filename=None):
+    """
+    Build the response for downloading `path` honouring Range, If-Range and If-None-Match.
+    """
+    stat = await run_in_threadpool(os.stat, path)
+    etag = await run_in_threadpool(file_etag, path, stat)
+    filename = filename or os.path.basename(path)
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = _headers(etag, stat.st_mtime, filename)
+
+    if ACCEL_REDIRECT_PREFIX:
+        accel = _accel_path(path)
+        if accel and not _none_match(request.headers.get("if-none-match") or "", etag):
+            # nginx serves the file (ranges included) from its internal location
+            headers["X-Accel-Redirect"] = accel
+            headers["X-Accel-Buffering"] = "no"
+            return Response(status_code=200, headers=headers, media_type=media_type)
+
+    size = stat.st_size
+    response, byte_range = _conditional(request, headers, size)
+    if response is not None:
+        return response
+
+    send_body = request.method != "HEAD"
+    if byte_range:
+        start, end = byte_range
+        return FileRangeResponse(path, start, end - start + 1, 206, headers, media_type, send_body)
+    return FileRangeResponse(path, 0, size, 200, headers, media_type, send_body)
+
+
+async def object_download(request, storage, path, filename=None):
+    """
+    Download a result from object storage: a redirect to a presigned URL,
+    or a proxied ranged GET with the object's ETag.
+    """
+    filename = filename or os.path.basename(path)
+    if REDIRECT_DOWNLOADS:
+        url = await run_in_threadpool(storage.presigned_url, path, "GET", None, filename)
+        return Response(status_code=307, headers={"Location": url, "Cache-Control": "no-store"})
+
+    stat = await run_in_threadpool(storage.stat, path)
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = _headers(stat["etag"], stat["mtime"], filename)
+    size = stat["size"]
+    response, byte_range = _conditional(request, headers, size)
+    if response is not None:
+        return response
+    if request.method == "HEAD":
+        return Response(status_code=206 if byte_range else 200, headers=headers, media_type=media_type)
+
+    start, end = byte_range or (0, size - 1)
+    # A sync iterator runs in the threadpool, keeping the S3 reads off the event loop
+    return StreamingResponse(
+        storage.iter_range(path, start, end), status_code=206 if byte_range else 200,
+        headers=headers, media_type=media_type,
+    )
+
+
+class _ZipSink:
+    """Write-only, unseekable file object that hands zipfile's output to a generator."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_zip(storage, directory, chunk_size=CHUNK_SIZE):
+    """
+    Yield a ZIP_STORED archive of every file under `directory`, built as it is read.
+
+    Entries use data descriptors (the output is not seekable), and ZIP64 is
+    enabled per entry for files over 2 GiB.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, size, mtime in storage.list(directory):
+            info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+            info.external_attr = 0o644 << 16
+            with archive.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as dst:
+                for chunk in storage.iter_range(os.path.join(directory, name), chunk_size=chunk_size):
+                    dst.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    # Central directory
+    yield sink.drain()
+
+
+async def zip_download(request, storage, directory, filename=None):
+    """
+    Stream the files under `directory` as a zip archive.
+
+    There is no Content-Length or Range support: the archive is generated
+    on the fly and never exists on disk.
+    """
+    filename = filename or os.path.basename(os.path.normpath(directory)) + ".zip"
+    headers = {
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+        "Accept-Ranges": "none",
+    }
+    if request.method == "HEAD":
+        return Response(status_code=200, headers=headers, media_type="application/zip")
+    # A sync iterator runs in the threadpool, keeping file reads off the event loop
+    return StreamingResponse(
+        (chunk for chunk in iter_zip(storage, directory) if chunk), headers=headers, media_type="application/zip"
+    )
@@ -0,0 +1,295 @@
+"""
+Fair-share dispatch of jobs to the workers.
+
+Without it, a 500-file batch from one user fills the Celery queue and every
+other user's job waits behind all of it. Instead, jobs wait in per-user
+virtual queues in Redis and are released into the broker only as fast as
+the workers take them (keeping about FAIR_SHARE_QUEUE_TARGET messages
+queued), picking the next user by start-time fair queuing on estimated
+cost: each user advances a virtual clock by cost / weight for every job
+released, and the user with the lowest start time goes next. A user who
+just arrived starts at the current virtual time, so their job is next in
+line rather than behind the whole batch.
+
+Users with FAIR_SHARE_USER_CAP jobs in flight are passed over while anyone
+else is waiting; alone, a bulk user gets the whole fleet.
+
+Consecutive held jobs of one user for the same light tool (rotate,
+metadata, protect, unlock: milliseconds of work each) are released as one
+run_batch task of up to FAIR_SHARE_BATCH_MAX jobs, so broker round-trips
+and per-task overhead are paid once per batch; each job still gets its own
+result under its own task id.
+
+Held jobs count toward queue depth and backlog in queue_metrics, so load
+shedding and the worker autoscaler still see them. Every API replica can
+submit and release (under a Redis lock). If Redis is unreachable, or
+FAIR_SHARE=0, jobs go straight to the broker as before.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from fastapi.concurrency import run_in_threadpool
+
+from admission import WORKER_THROUGHPUT
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+ENABLED = os.environ.get("FAIR_SHARE", "1") != "0"
+# Messages kept waiting in the broker: enough that workers never idle between releases
+QUEUE_TARGET = int(os.environ.get("FAIR_SHARE_QUEUE_TARGET", max(2, int(2 * WORKER_THROUGHPUT))))
+USER_CAP = int(os.environ.get("FAIR_SHARE_USER_CAP", 4))
+INTERVAL = float(os.environ.get("FAIR_SHARE_INTERVAL", 0.25))
+# "user=weight,user=weight"; everyone else weighs 1
+WEIGHTS = {
+    user.strip(): float(weight)
+    for user, _, weight in (item.partition("=") for item in os.environ.get("FAIR_SHARE_WEIGHTS", "").split(","))
+    if user.strip() and weight
+}
+DEFAULT_COST = 1.0
+# Light tasks released together as one run_batch task (keep in sync with workers/batch_worker.py)
+BATCHABLE_TASKS = {"rotate_pages", "edit_metadata", "protect_pdf", "unlock_pdf"}
+BATCH_MAX = int(os.environ.get("FAIR_SHARE_BATCH_MAX", 32))
+# Estimated CPU-seconds per batch, so a batch of large files doesn't hold a worker for long
+BATCH_MAX_COST = float(os.environ.get("FAIR_SHARE_BATCH_MAX_COST", 5))
+
+KEY_PREFIX = "pdfsimple:fair:"
+LOCK_KEY = KEY_PREFIX + "lock"
+READY_KEY = KEY_PREFIX + "ready"      # zset: backlogged user -> start tag of their next job
+VTIME_KEY = KEY_PREFIX + "vtime"      # hash: user -> finish tag of their last released job
+CLOCK_KEY = KEY_PREFIX + "clock"      # system virtual time
+HELD_KEY = KEY_PREFIX + "held"        # hash: "<queue>:depth" / "<queue>:cost" of held jobs
+QUEUE_PREFIX = KEY_PREFIX + "q:"      # list per user of held jobs
+# Keep in sync with workers/celery_app.py
+RUNNING_PREFIX = KEY_PREFIX + "running:"  # set per user of released task ids
+RUNNING_TTL = 6 * 3600
+LOCK_TTL_MS = 10000
+
+
+class FairShare:
+    def __init__(self, celery_app, redis_url=REDIS_URL, queue_target=QUEUE_TARGET, user_cap=USER_CAP,
+                 weights=None, enabled=ENABLED, batch_max=BATCH_MAX):
+        """
+        Args:
+            celery_app: App jobs are sent with
+            queue_target: Messages to keep waiting in the broker
+            user_cap: In-flight tasks per user while other users are waiting
+            weights: {user: weight}; a weight of 2 gets twice the share
+            batch_max: Most light jobs released as one task (1 disables batching)
+        """
+        self.celery_app = celery_app
+        self.redis_url = redis_url
+        self.queue_target = queue_target
+        self.user_cap = user_cap
+        self.batch_max = batch_max
+        self.weights = WEIGHTS if weights is None else weights
+        self.enabled = enabled and celery_app is not None
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=1)
+        return self._client
+
+    @property
+    def queue(self):
+        return self.celery_app.conf.task_default_queue
+
+    def _lock(self, blocking_timeout):
+        """Token for the dispatch lock, or None if it wasn't free in time."""
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + blocking_timeout
+        while not self.client.set(LOCK_KEY, token, nx=True, px=LOCK_TTL_MS):
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.005)
+        return token
+
+    def _unlock(self, token):
+        import redis
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(LOCK_KEY)
+                if pipe.get(LOCK_KEY) == token.encode():
+                    pipe.multi()
+                    pipe.delete(LOCK_KEY)
+                    pipe.execute()
+            except redis.WatchError:
+                pass
+
+    def send_task(self, user, name, args=None, headers=None, release=True):
+        """
+        Queue task `name` for `user` behind their earlier jobs.
+
+        Same call shape as celery_app.send_task; the returned AsyncResult's
+        id is fixed now and stays PENDING until the task is released.
+
+        Args:
+            release: Release jobs right away; callers queueing many jobs pass
+                False and call pump() once, so light jobs can go out as batches
+        """
+        import redis
+
+        if not self.enabled:
+            return self.celery_app.send_task(name, args=args, headers=headers)
+        headers = dict(headers or {})
+        entry = {
+            "id": str(uuid.uuid4()), "task": name, "args": args or [], "headers": headers,
+            "cost": float(headers.get("cost") or DEFAULT_COST), "at": time.time(),
+        }
+        try:
+            token = self._lock(blocking_timeout=1)
+            if token is None:
+                raise redis.RedisError("dispatch lock busy")
+            try:
+                self._hold(user, entry)
+            finally:
+                self._unlock(token)
+        except redis.RedisError:
+            # Never lose a job to the dispatcher: go straight to the broker
+            return self.celery_app.send_task(name, args=args, headers=headers)
+        if release:
+            try:
+                self.pump()
+            except Exception as e:
+                # The job is held (or back in its queue): the next pump releases it
+                print(f"Fair-share release failed: {str(e)}")
+        return self.celery_app.AsyncResult(entry["id"])
+
+    def _hold(self, user, entry):
+        client = self.client
+        if client.rpush(QUEUE_PREFIX + user, json.dumps(entry)) == 1:
+            # Newly backlogged: start at the current virtual time, without
+            # credit for the time spent idle
+            start = max(float(client.hget(VTIME_KEY, user) or 0), float(client.get(CLOCK_KEY) or 0))
+            client.zadd(READY_KEY, {user: start})
+        client.hincrby(HELD_KEY, f"{self.queue}:depth", 1)
+        client.hincrbyfloat(HELD_KEY, f"{self.queue}:cost", entry["cost"])
+
+    def _broker_depth(self):
+        try:
+            return self.client.llen(self.queue)
+        except Exception:
+            return 0
+
+    def _running(self, user):
+        """In-flight task count for `user`, dropping ids that have finished."""
+        key = RUNNING_PREFIX + user
+        task_ids = [task_id.decode() for task_id in self.client.smembers(key)]
+        if len(task_ids) >= self.user_cap:
+            # Workers remove ids when tasks finish; this catches ones they missed
+            finished = [task_id for task_id in task_ids if self.celery_app.AsyncResult(task_id).ready()]
+            if finished:
+                self.client.srem(key, *finished)
+            return len(task_ids) - len(finished)
+        return len(task_ids)
+
+    def pump(self):
+        """
+        Release held jobs into the broker, fairly, until it holds queue_target messages.
+
+        Returns:
+            Number of jobs released
+        """
+        token = self._lock(blocking_timeout=0)
+        if token is None:
+            return 0  # Another replica is releasing
+        try:
+            client = self.client
+            free = self.queue_target - self._broker_depth()
+            running = {}
+            released = 0
+            while free > 0:
+                ready = [(user.decode(), start) for user, start in client.zrange(READY_KEY, 0, -1, withscores=True)]
+                if not ready:
+                    break
+                for user, _ in ready:
+                    if user not in running:
+                        running[user] = self._running(user)
+                # Lowest start tag under its cap; if everyone is capped, the fleet
+                # would otherwise idle, so the lowest start tag anyway
+                user, start = next(((u, s) for u, s in ready if running[u] < self.user_cap), ready[0])
+                entries = self._take(user)
+                if not entries:
+                    client.zrem(READY_KEY, user)
+                    continue
+                try:
+                    self._release(user, entries)
+                except Exception:
+                    # Broker unreachable: the jobs are back at the head of the
+                    # user's queue, with the user's start tag unchanged
+                    client.lpush(QUEUE_PREFIX + user, *[json.dumps(entry) for entry in reversed(entries)])
+                    raise
+                running[user] += 1
+                released += len(entries)
+                free -= 1
+
+                finish = start + sum(entry["cost"] for entry in entries) / self.weights.get(user, 1.0)
+                client.hset(VTIME_KEY, user, finish)
+                # Virtual time never goes backwards (a capped user's lower tag can be passed over)
+                client.set(CLOCK_KEY, max(start, float(client.get(CLOCK_KEY) or 0)))
+                if client.llen(QUEUE_PREFIX + user):
+                    client.zadd(READY_KEY, {user: finish})
+                else:
+                    client.zrem(READY_KEY, user)
+            return released
+        finally:
+            self._unlock(token)
+
+    def _take(self, user):
+        """
+        Pop `user`'s next job, plus the light jobs for the same task queued
+        right behind it. Only called under the lock; if releasing them fails
+        the caller pushes them back.
+        """
+        client = self.client
+        key = QUEUE_PREFIX + user
+        raw = client.lpop(key)
+        if raw is None:
+            return []
+        entries = [json.loads(raw)]
+        name = entries[0]["task"]
+        cost = entries[0]["cost"]
+        while name in BATCHABLE_TASKS and len(entries) < self.batch_max:
+            raw = client.lindex(key, 0)
+            if raw is None:
+                break
+            entry = json.loads(raw)
+            if entry["task"] != name or cost + entry["cost"] > BATCH_MAX_COST:
+                break
+            client.lpop(key)
+            entries.append(entry)
+            cost += entry["cost"]
+        return entries
+
+    def _release(self, user, entries):
+        client = self.client
+        cost = sum(entry["cost"] for entry in entries)
+        if len(entries) == 1:
+            entry = entries[0]
+            # sent_at: queue age metrics count the time held here too
+            headers = dict(entry["headers"], fair_user=user, sent_at=entry["at"])
+            task_id = entry["id"]
+            self.celery_app.send_task(entry["task"], args=entry["args"], headers=headers, task_id=task_id)
+        else:
+            headers = {"cost": round(cost, 4), "fair_user": user, "sent_at": min(entry["at"] for entry in entries)}
+            task_id = str(uuid.uuid4())
+            items = [{"id": entry["id"], "args": entry["args"]} for entry in entries]
+            self.celery_app.send_task("run_batch", args=[entries[0]["task"], items], headers=headers, task_id=task_id)
+        # A batch takes one worker slot, so it counts once toward the user's cap
+        client.sadd(RUNNING_PREFIX + user, task_id)
+        client.expire(RUNNING_PREFIX + user, RUNNING_TTL)
+        client.hincrby(HELD_KEY, f"{self.queue}:depth", -len(entries))
+        client.hincrbyfloat(HELD_KEY, f"{self.queue}:cost", -cost)
+
+    async def run(self, interval=INTERVAL):
+        """Release jobs as workers free up, every `interval` seconds until cancelled."""
+        while True:
+            try:
+                await run_in_threadpool(self.pump)
+            except Exception as e:
+                print(f"Fair-share release failed: {str(e)}")
+            await asyncio.sleep(interval)
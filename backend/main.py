@@ -1,6 +1,6 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
+import asyncio
 import uuid
 import os
 import sys
@@ -16,13 +16,12 @@ except ImportError:
     celery_app = None
 
 # DB Imports
-from database import engine, get_db
+from database import get_db, init_db
 import models
 from sqlalchemy.orm import Session
 from fastapi import Depends
-
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+from contextlib import asynccontextmanager
+from fastapi.concurrency import run_in_threadpool
 
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -30,9 +29,24 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
+from retention import Retention, ENABLED as GC_ENABLED
+from fair_share import FairShare
+
+@asynccontextmanager
+async def lifespan(app):
+    # Schema setup runs at startup rather than import; replicas added by the
+    # autoscaler can skip it entirely with DB_CREATE_SCHEMA=0
+    if os.environ.get("DB_CREATE_SCHEMA", "1") != "0":
+        await run_in_threadpool(init_db)
+    sweeper = asyncio.create_task(retention.run()) if GC_ENABLED else None
+    releaser = asyncio.create_task(fair_share.run()) if fair_share.enabled else None
+    yield
+    for task in (sweeper, releaser):
+        if task:
+            task.cancel()
 
 limiter = Limiter(key_func=get_remote_address)
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 Instrumentator().instrument(app).expose(app)
 
 app.state.limiter = limiter
@@ -59,9 +73,206 @@ class JobCreate(BaseModel):
 
 # In-memory store for demo (replace with DB or Redis in production)
 jobs = {}
+# Direct uploads issued by /uploads, waiting to be used by a job
+pending_uploads = {}
 
 from fastapi import Form, Request
 import json
+import hashlib
+import tempfile
+from pdf_inspect import inspect_pdf, METADATA_KEYS
+from cost_model import cost_model, estimate_job
+from admission import admission, AdmissionRejected
+from queue_metrics import queue_monitor, queue_registry
+from downloads import file_download, object_download, zip_download
+from workers.storage import storage
+from uploads import SESSION_TTL, UploadError, receive_chunk, upload_sessions
+from pdf_validate import InvalidPDF, validate_inputs
+from workers.pipeline_worker import parse_steps
+from coalesce import COALESCED, ENABLED as COALESCING, job_key, single_flight
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from fastapi.responses import Response
+
+def _job_active(job_id):
+    """True while a job this replica queued is waiting or running."""
+    job = jobs.get(job_id)
+    if not job or not job.get("celery_id") or not celery_app:
+        return False
+    return celery_app.AsyncResult(job["celery_id"]).state in ("PENDING", "RECEIVED", "STARTED", "RETRY")
+
+def _task_finished(task_id):
+    """True once a task has a final result, whichever replica queued it."""
+    if not celery_app:
+        return True
+    return celery_app.AsyncResult(task_id).state in ("SUCCESS", "FAILURE", "REVOKED")
+
+retention = Retention(storage=storage, is_finished=_task_finished)
+# Jobs wait in per-user queues and are released to the workers fairly
+fair_share = FairShare(celery_app)
+
+def _attach(job_id, leader_id, upload_dir, input_paths):
+    """Resolve job_id to the in-flight job leader_id instead of queueing a duplicate."""
+    import shutil
+    shutil.rmtree(upload_dir, ignore_errors=True)
+    if storage.remote:
+        for path in input_paths:
+            storage.release(path)
+    leader = jobs[leader_id]
+    # observed: the leader feeds the task's timings to the cost model once
+    jobs[job_id] = {
+        "status": "queued", "celery_id": leader["celery_id"], "coalesced_with": leader_id, "observed": True,
+        "tool": leader["tool"], "params": leader["params"], "pages": leader["pages"], "cost": leader["cost"],
+    }
+    # The shared result must outlive both jobs
+    retention.register(leader_id, task_id=leader["celery_id"])
+    retention.register(job_id, task_id=leader["celery_id"])
+    COALESCED.labels(leader["tool"]).inc()
+    return {"job_id": job_id, "status": "queued", "estimated_cost": round(leader["cost"], 2), "coalesced_with": leader_id}
+
+@app.get("/metrics/queues")
+async def queue_metrics():
+    """Celery queue depth, oldest-message age, backlog and active tasks (Prometheus format)."""
+    data = await run_in_threadpool(generate_latest, queue_registry)
+    return Response(content=data, media_type=CONTENT_TYPE_LATEST)
+
+async def _check_backpressure():
+    try:
+        await run_in_threadpool(queue_monitor.check_backpressure)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+
+@app.post("/inspect")
+@limiter.limit("60/minute")
+async def inspect_document(request: Request, file: UploadFile = File(...)):
+    """
+    Synchronously describe a PDF: page count, encryption, text layer, images, metadata.
+    Only the trailer, xref, page tree and resources are read; results are cached by content hash.
+    """
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        while True:
+            chunk = await file.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+            await run_in_threadpool(tmp.write, chunk)
+        await run_in_threadpool(tmp.flush)
+        try:
+            return await run_in_threadpool(inspect_pdf, tmp.name, digest.hexdigest())
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Not a readable PDF: {e}")
+
+@app.post("/uploads")
+@limiter.limit("60/minute")
+async def create_upload(request: Request, filename: str = Form(...)):
+    """
+    Presigned URL for uploading an input straight to object storage.
+    PUT the file to `url`, then pass `upload_id` in a job's `uploads` list.
+    """
+    if not storage.remote:
+        raise HTTPException(status_code=501, detail="Direct uploads need object storage (STORAGE_BACKEND=s3)")
+    upload_id = str(uuid.uuid4())
+    path = f"/data/{upload_id}/{os.path.basename(filename)}"
+    url = await run_in_threadpool(storage.presigned_url, path, "PUT")
+    pending_uploads[upload_id] = {"path": path, "client": request.client.host}
+    retention.register(upload_id, storage.url_expires)
+    return {"upload_id": upload_id, "url": url, "method": "PUT", "expires_in": storage.url_expires}
+
+@app.post("/uploads/sessions")
+@limiter.limit("60/minute")
+async def create_upload_session(
+    request: Request,
+    filename: str = Form(...),
+    size: int = Form(...),
+    chunk_size: int = Form(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Start a resumable upload. PUT each chunk to /uploads/sessions/{upload_id}/chunks/{index}
+    (any order, in parallel) with an "Upload-Checksum: sha256 <base64>" header, then complete it.
+    """
+    client_ip = request.client.host
+    user = db.query(models.User).filter(models.User.username == client_ip).first()
+    if not user:
+        user = models.User(username=client_ip)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    try:
+        session = await run_in_threadpool(
+            upload_sessions.create, client_ip, filename, size, chunk_size, user.quota_bytes - user.usage_bytes
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    retention.register(session["upload_id"], SESSION_TTL)
+    return session
+
+@app.get("/uploads/sessions/{upload_id}")
+async def get_upload_session(request: Request, upload_id: str):
+    """Received and missing chunks, for resuming an interrupted upload."""
+    try:
+        return upload_sessions.status(upload_id, request.client.host)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.put("/uploads/sessions/{upload_id}/chunks/{index}")
+async def put_upload_chunk(request: Request, upload_id: str, index: int):
+    try:
+        return await receive_chunk(upload_sessions, request, upload_id, index)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.post("/uploads/sessions/{upload_id}/complete")
+async def complete_upload_session(request: Request, upload_id: str, checksum: str = Form(None)):
+    """
+    Assemble the upload (optionally verifying the whole file's "sha256 <base64>")
+    and make it usable as `uploads=["<upload_id>"]` in POST /jobs.
+    """
+    client_ip = request.client.host
+    try:
+        path = await run_in_threadpool(upload_sessions.complete, upload_id, client_ip, checksum)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if upload_id not in pending_uploads:
+        await run_in_threadpool(storage.publish, path)
+        pending_uploads[upload_id] = {"path": path, "client": client_ip}
+    return upload_sessions.status(upload_id, client_ip)
+
+async def _uploaded_inputs(upload_ids, client_ip):
+    """Resolve upload ids from /uploads to (local paths, total bytes), pulling the objects to local disk."""
+    paths, total = [], 0
+    for upload_id in upload_ids:
+        upload = pending_uploads.get(upload_id)
+        if not upload or upload["client"] != client_ip:
+            raise HTTPException(status_code=400, detail=f"Unknown upload: {upload_id}")
+        stat = await run_in_threadpool(storage.stat, upload["path"])
+        if not stat or stat.get("dir"):
+            raise HTTPException(status_code=400, detail=f"Upload {upload_id} has not been completed")
+        # Cost estimation reads the file; the copy comes from the node's input cache
+        await run_in_threadpool(storage.localize, upload["path"])
+        del pending_uploads[upload_id]
+        # The upload is now a job input and lives as long as the job's result
+        retention.register(upload_id)
+        paths.append(upload["path"])
+        total += stat["size"]
+    return paths, total
+
+async def _refund(client_ip, cost):
+    """Give back the admission charge of a job that never reached the workers."""
+    await run_in_threadpool(admission.refund, client_ip, cost)
+
+async def _send_task(client_ip, name, args, cost, release=True):
+    """
+    Queue a task for the user through the fair-share dispatcher, off the
+    event loop (it waits on a Redis lock and may release jobs).
+    """
+    try:
+        return await run_in_threadpool(fair_share.send_task, client_ip, name, args=args, headers={"cost": cost}, release=release)
+    except Exception as e:
+        # Neither Redis nor the broker took the job
+        await _refund(client_ip, cost)
+        raise HTTPException(status_code=503, detail=f"Job queue unavailable: {str(e)}", headers={"Retry-After": "5"})
+
 
 @app.post("/jobs")
 @limiter.limit("10/minute")
@@ -69,9 +280,13 @@ async def create_job(
     request: Request,
     tool: str = Form(...),
     params: str = Form("{}"), # JSON string
-    files: List[UploadFile] = File(...),
+    files: List[UploadFile] = File(None),
+    uploads: str = Form("[]"), # JSON list of upload ids from /uploads
     db: Session = Depends(get_db)
 ):
+    # Shed load before reading the upload when the workers are backed up
+    await _check_backpressure()
+
     # 1. Calculate size and check quota
     total_size = 0
     # We need to read file size. UploadFile has .size logic only if spooled?
@@ -101,10 +316,13 @@ async def create_job(
     except:
         job_params = {}
 
-    input_paths = []
-    job_total_bytes = 0
-    
-    for file in files:
+    try:
+        upload_ids = json.loads(uploads)
+    except:
+        upload_ids = []
+    input_paths, job_total_bytes = await _uploaded_inputs(upload_ids, client_ip)
+
+    for file in files or []:
         path = f"{upload_dir}/{file.filename}"
         with open(path, "wb") as out_file:
             content = await file.read()
@@ -112,190 +330,265 @@ async def create_job(
             job_total_bytes += size
             out_file.write(content)
         input_paths.append(path)
-        
-    # Check Quota
-    if user.usage_bytes + job_total_bytes > user.quota_bytes:
-        # Cleanup
+
+    if tool == "pipeline":
+        try:
+            parse_steps(job_params, len(input_paths))
+        except ValueError as e:
+            import shutil
+            shutil.rmtree(upload_dir)
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # Reject non-PDFs and unreadable files before they are charged or queued;
+    # recoverable damage is repaired once here rather than in every tool
+    try:
+        repaired = await run_in_threadpool(validate_inputs, tool, input_paths, job_params)
+    except InvalidPDF as e:
         import shutil
         shutil.rmtree(upload_dir)
-        return {"status": "failed", "error": "Quota exceeded. Upgrade to Premium."}
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # An identical job (same inputs, tool and params) already queued or running
+    # takes this submission along instead of computing the same thing again
+    flight = None
+    if celery_app and COALESCING and input_paths:
+        flight = await run_in_threadpool(job_key, tool, input_paths, job_params, client_ip)
+        leader_id = await single_flight.join(flight, job_id, _job_active)
+        if leader_id:
+            return _attach(job_id, leader_id, upload_dir, input_paths)
+        
+    # Settled however this ends, so identical requests waiting on the claim never hang
+    try:
+        # Check Quota
+        if user.usage_bytes + job_total_bytes > user.quota_bytes:
+            # Cleanup
+            import shutil
+            shutil.rmtree(upload_dir)
+            return {"status": "failed", "error": "Quota exceeded. Upgrade to Premium."}
     
-    # Update Usage
-    user.usage_bytes += job_total_bytes
-    db.commit()
+        # Cost-weighted admission: heavy jobs use up more of the user's and the fleet's budget
+        try:
+            cost, pages = await run_in_threadpool(estimate_job, tool, input_paths, job_params)
+            await run_in_threadpool(admission.admit, client_ip, cost)
+        except AdmissionRejected as e:
+            import shutil
+            shutil.rmtree(upload_dir)
+            raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+    
+        # Workers on other nodes read the inputs from object storage
+        await run_in_threadpool(storage.publish, upload_dir)
+        for path in repaired:
+            if not path.startswith(upload_dir + "/"):
+                await run_in_threadpool(storage.publish, path)
 
-    # Use 'tool' directly instead of job.tool
+        # Use 'tool' directly instead of job.tool
 
 
     
-    if not input_paths:
-         jobs[job_id] = {"status": "failed", "error": "No files uploaded"}
-         return {"job_id": job_id, "status": "failed"}
+        if not input_paths:
+             await _refund(client_ip, cost)
+             jobs[job_id] = {"status": "failed", "error": "No files uploaded"}
+             return {"job_id": job_id, "status": "failed"}
+
+        if tool == "merge":
+            if celery_app:
+                task = await _send_task(client_ip, "merge_pdfs", [job_id, input_paths], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+            else:
+                try:
+                    from workers.merge_worker import merge_pdfs
+                    output = merge_pdfs(job_id, input_paths)
+                    jobs[job_id] = {"status": "completed", "output": output}
+                except Exception as e:
+                    jobs[job_id] = {"status": "failed", "error": str(e)}
+
+        elif tool == "split":
+             # Use first file for now
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "split_pdf", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                try:
+                    from workers.split_worker import split_pdf
+                    output = split_pdf(job_id, input_path, job_params)
+                    jobs[job_id] = {"status": "completed", "output": output}
+                except Exception as e:
+                    jobs[job_id] = {"status": "failed", "error": str(e)}
 
-    if tool == "merge":
-        if celery_app:
-            task = celery_app.send_task("merge_pdfs", args=[job_id, input_paths])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-        else:
-            try:
-                from workers.merge_worker import merge_pdfs
-                output = merge_pdfs(job_id, input_paths)
-                jobs[job_id] = {"status": "completed", "output": output}
-            except Exception as e:
-                jobs[job_id] = {"status": "failed", "error": str(e)}
-
-    elif tool == "split":
-         # Use first file for now
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("split_pdf", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            try:
-                from workers.split_worker import split_pdf
-                output = split_pdf(job_id, input_path, job_params)
-                jobs[job_id] = {"status": "completed", "output": output}
-            except Exception as e:
-                jobs[job_id] = {"status": "failed", "error": str(e)}
-
-    elif tool == "compress":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("compress_pdf", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            try:
-                from workers.compress_worker import compress_pdf
-                output = compress_pdf(job_id, input_path, job_params)
-                jobs[job_id] = {"status": "completed", "output": output}
-            except Exception as e:
-                jobs[job_id] = {"status": "failed", "error": str(e)}
-
-    elif tool == "convert":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("convert_file", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-             # Convert requires external tools often not on Windows (LibreOffice, ImageMagick)
-             jobs[job_id] = {"status": "failed", "error": "Conversion requires Docker environment"}
+        elif tool == "compress":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "compress_pdf", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                try:
+                    from workers.compress_worker import compress_pdf
+                    output = compress_pdf(job_id, input_path, job_params)
+                    jobs[job_id] = {"status": "completed", "output": output}
+                except Exception as e:
+                    jobs[job_id] = {"status": "failed", "error": str(e)}
+
+        elif tool == "convert":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "convert_file", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                 # Convert requires external tools often not on Windows (LibreOffice, ImageMagick)
+                 jobs[job_id] = {"status": "failed", "error": "Conversion requires Docker environment"}
     
-    elif tool == "ocr":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("ocr_pdf", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            try:
-                from workers.ocr_worker import ocr_pdf
-                output = ocr_pdf(job_id, input_path, job_params)
-                jobs[job_id] = {"status": "completed", "output": output}
-            except Exception as e:
-                jobs[job_id] = {"status": "failed", "error": str(e)}
-
-    elif tool == "pdf_to_pptx":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("pdf_to_pptx", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            jobs[job_id] = {"status": "failed", "error": "PDF to PPTX requires Docker environment"}
-
-    elif tool == "pdf_to_xlsx":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("pdf_to_xlsx", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            jobs[job_id] = {"status": "failed", "error": "PDF to XLSX requires Docker environment"}
-
-    elif tool == "pdf_to_html":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("pdf_to_html", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            jobs[job_id] = {"status": "failed", "error": "PDF to HTML requires Docker environment"}
-
-    elif tool == "images_to_pdf":
-         if celery_app:
-            task = celery_app.send_task("images_to_pdf", args=[job_id, input_paths, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            jobs[job_id] = {"status": "failed", "error": "Image to PDF conversion requires Docker environment"}
-
-    elif tool == "watermark":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("add_watermark", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            jobs[job_id] = {"status": "failed", "error": "Watermark operation requires Docker environment"}
-
-    elif tool == "page_numbers":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("add_page_numbers", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            jobs[job_id] = {"status": "failed", "error": "Page numbers operation requires Docker environment"}
-
-    elif tool == "rotate":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("rotate_pages", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            try:
-                from workers.rotate_pages_worker import rotate_pages
-                output = rotate_pages(job_id, input_path, job_params)
-                jobs[job_id] = {"status": "completed", "output": output}
-            except Exception as e:
-                jobs[job_id] = {"status": "failed", "error": str(e)}
-
-    elif tool == "metadata":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("edit_metadata", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            try:
-                from workers.metadata_worker import edit_metadata
-                output = edit_metadata(job_id, input_path, job_params)
-                jobs[job_id] = {"status": "completed", "output": output}
-            except Exception as e:
-                jobs[job_id] = {"status": "failed", "error": str(e)}
-
-    elif tool == "protect":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("protect_pdf", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            try:
-                from workers.protect_pdf_worker import protect_pdf
-                output = protect_pdf(job_id, input_path, job_params)
-                jobs[job_id] = {"status": "completed", "output": output}
-            except Exception as e:
-                jobs[job_id] = {"status": "failed", "error": str(e)}
-
-    elif tool == "unlock":
-         input_path = input_paths[0]
-         if celery_app:
-            task = celery_app.send_task("unlock_pdf", args=[job_id, input_path, job_params])
-            jobs[job_id] = {"status": "queued", "celery_id": task.id}
-         else:
-            try:
-                from workers.unlock_pdf_worker import unlock_pdf
-                output = unlock_pdf(job_id, input_path, job_params)
-                jobs[job_id] = {"status": "completed", "output": output}
-            except Exception as e:
-                jobs[job_id] = {"status": "failed", "error": str(e)}
+        elif tool == "ocr":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "ocr_pdf", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                try:
+                    from workers.ocr_worker import ocr_pdf
+                    output = ocr_pdf(job_id, input_path, job_params)
+                    jobs[job_id] = {"status": "completed", "output": output}
+                except Exception as e:
+                    jobs[job_id] = {"status": "failed", "error": str(e)}
 
-    else:
-        jobs[job_id] = {"status": "failed", "error": "Tool not supported"}
+        elif tool == "pdf_to_pptx":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "pdf_to_pptx", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                jobs[job_id] = {"status": "failed", "error": "PDF to PPTX requires Docker environment"}
+
+        elif tool == "pdf_to_xlsx":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "pdf_to_xlsx", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                jobs[job_id] = {"status": "failed", "error": "PDF to XLSX requires Docker environment"}
+
+        elif tool == "pdf_to_html":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "pdf_to_html", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                jobs[job_id] = {"status": "failed", "error": "PDF to HTML requires Docker environment"}
 
-    return {"job_id": job_id, "status": jobs[job_id].get("status", "queued")}
+        elif tool == "images_to_pdf":
+             if celery_app:
+                task = await _send_task(client_ip, "images_to_pdf", [job_id, input_paths, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                jobs[job_id] = {"status": "failed", "error": "Image to PDF conversion requires Docker environment"}
+
+        elif tool == "watermark":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "add_watermark", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                jobs[job_id] = {"status": "failed", "error": "Watermark operation requires Docker environment"}
+
+        elif tool == "page_numbers":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "add_page_numbers", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                jobs[job_id] = {"status": "failed", "error": "Page numbers operation requires Docker environment"}
+
+        elif tool == "rotate":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "rotate_pages", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                try:
+                    from workers.rotate_pages_worker import rotate_pages
+                    output = rotate_pages(job_id, input_path, job_params)
+                    jobs[job_id] = {"status": "completed", "output": output}
+                except Exception as e:
+                    jobs[job_id] = {"status": "failed", "error": str(e)}
+
+        elif tool == "metadata":
+             input_path = input_paths[0]
+             if job_params.get("action") == "get":
+                # Reading metadata needs no worker: answer from the lazy inspector
+                try:
+                    info = await run_in_threadpool(inspect_pdf, input_path)
+                    metadata = {name: info.get("metadata", {}).get(name, "") for name in METADATA_KEYS.values()}
+                    jobs[job_id] = {"status": "completed", "output": {"metadata": metadata, "file_path": input_path}}
+                except Exception as e:
+                    jobs[job_id] = {"status": "failed", "error": str(e)}
+             elif celery_app:
+                task = await _send_task(client_ip, "edit_metadata", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                try:
+                    from workers.metadata_worker import edit_metadata
+                    output = edit_metadata(job_id, input_path, job_params)
+                    jobs[job_id] = {"status": "completed", "output": output}
+                except Exception as e:
+                    jobs[job_id] = {"status": "failed", "error": str(e)}
+
+        elif tool == "protect":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "protect_pdf", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                try:
+                    from workers.protect_pdf_worker import protect_pdf
+                    output = protect_pdf(job_id, input_path, job_params)
+                    jobs[job_id] = {"status": "completed", "output": output}
+                except Exception as e:
+                    jobs[job_id] = {"status": "failed", "error": str(e)}
+
+        elif tool == "unlock":
+             input_path = input_paths[0]
+             if celery_app:
+                task = await _send_task(client_ip, "unlock_pdf", [job_id, input_path, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                try:
+                    from workers.unlock_pdf_worker import unlock_pdf
+                    output = unlock_pdf(job_id, input_path, job_params)
+                    jobs[job_id] = {"status": "completed", "output": output}
+                except Exception as e:
+                    jobs[job_id] = {"status": "failed", "error": str(e)}
+
+        elif tool == "pipeline":
+             # Several steps in one task, e.g. {"steps": [{"tool": "merge"}, {"tool": "compress", "params": {...}}]}
+             if celery_app:
+                task = await _send_task(client_ip, "run_pipeline", [job_id, input_paths, job_params], cost)
+                jobs[job_id] = {"status": "queued", "celery_id": task.id}
+             else:
+                try:
+                    from workers.pipeline_worker import run_pipeline
+                    output = run_pipeline(job_id, input_paths, job_params)
+                    jobs[job_id] = {"status": "completed", "output": output}
+                except Exception as e:
+                    jobs[job_id] = {"status": "failed", "error": str(e)}
+
+        else:
+            await _refund(client_ip, cost)
+            jobs[job_id] = {"status": "failed", "error": "Tool not supported"}
+
+        if storage.remote:
+            # Inputs are in object storage now; drop this node's scratch copies
+            for path in [upload_dir] + input_paths:
+                storage.release(path)
+
+        # Update Usage (once the job is queued: a failed dispatch isn't charged)
+        user.usage_bytes += job_total_bytes
+        db.commit()
+
+        jobs[job_id].update(tool=tool, params=job_params, pages=pages, cost=cost)
+        retention.register(job_id, task_id=jobs[job_id].get("celery_id"))
+        return {"job_id": job_id, "status": jobs[job_id].get("status", "queued"), "estimated_cost": round(cost, 2)}
+    finally:
+        single_flight.settle(flight, job_id, "celery_id" in jobs.get(job_id, {}))
 
 @app.get("/jobs/{job_id}")
 async def get_job_status(job_id: str):
@@ -310,6 +603,10 @@ async def get_job_status(job_id: str):
         if res.state == 'SUCCESS':
             job["status"] = "completed"
             job["output"] = res.result
+            # Feed measured timings back into the cost model once
+            if not job.get("observed") and isinstance(res.result, dict) and "timings" in res.result:
+                cost_model.observe(job.get("tool"), job.get("pages"), res.result["timings"].get("total"), job.get("params"))
+                job["observed"] = True
         elif res.state == 'FAILURE':
             job["status"] = "failed"
             job["error"] = str(res.result)
@@ -317,6 +614,8 @@ async def get_job_status(job_id: str):
             job["status"] = "processing"
     
     response = {"job_id": job_id, "status": job["status"]}
+    if "coalesced_with" in job:
+        response["coalesced_with"] = job["coalesced_with"]
     if "output" in job:
         response["output"] = job["output"]
     if "error" in job:
@@ -324,8 +623,7 @@ async def get_job_status(job_id: str):
         
     return response
 
-@app.get("/jobs/{job_id}/result")
-async def download_result(job_id: str):
+async def _result_stat(job_id):
     job = jobs.get(job_id)
     if not job or job.get("status") != "completed":
         raise HTTPException(status_code=404, detail="Result not available")
@@ -336,10 +634,36 @@ async def download_result(job_id: str):
     else:
         result_path = output
 
-    if not result_path or not os.path.exists(result_path):
+    stat = await run_in_threadpool(storage.stat, result_path) if result_path else None
+    if not stat:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(result_path, filename=os.path.basename(result_path))
-    return FileResponse(result_path, filename=os.path.basename(result_path))
+    return result_path, stat
+
+@app.api_route("/jobs/{job_id}/result", methods=["GET", "HEAD"])
+async def download_result(request: Request, job_id: str):
+    result_path, stat = await _result_stat(job_id)
+    if stat.get("dir"):
+        # Multi-file results are zipped while the client downloads
+        return await zip_download(request, storage, result_path, f"{job_id}.zip")
+    if storage.remote:
+        # Presigned redirect, or a proxied ranged GET
+        return await object_download(request, storage, result_path)
+    # Range, ETag/If-None-Match, If-Range and optional X-Accel-Redirect to nginx
+    return await file_download(request, result_path)
+
+@app.get("/jobs/{job_id}/result/url")
+async def result_url(request: Request, job_id: str):
+    """
+    Where to fetch the result from: a presigned object-storage URL when there
+    is one, otherwise the API's own download route.
+    """
+    result_path, stat = await _result_stat(job_id)
+    url = None
+    if not stat.get("dir"):
+        url = await run_in_threadpool(storage.presigned_url, result_path, "GET", None, os.path.basename(result_path))
+    if url:
+        return {"url": url, "expires_in": storage.url_expires}
+    return {"url": str(request.url_for("download_result", job_id=job_id)), "expires_in": None}
 
 @app.post("/jobs/batch")
 @limiter.limit("5/minute")
@@ -353,6 +677,8 @@ async def create_batch_job(
     if tool == "merge":
         raise HTTPException(status_code=400, detail="Merge does not support batch mode (it is already a batch op)")
 
+    await _check_backpressure()
+
     client_ip = request.client.host
     user = db.query(models.User).filter(models.User.username == client_ip).first()
     if not user:
@@ -395,119 +721,165 @@ async def create_batch_job(
             
         with open(path, "wb") as out_file:
             out_file.write(content)
+
+        try:
+            await run_in_threadpool(validate_inputs, tool, [path], job_params)
+        except InvalidPDF as e:
+            import shutil
+            shutil.rmtree(upload_dir)
+            responses.append({"job_id": None, "status": "failed", "error": str(e), "filename": file.filename})
+            continue
+        
+        try:
+            cost, pages = await run_in_threadpool(estimate_job, tool, [path], job_params)
+            await run_in_threadpool(admission.admit, client_ip, cost)
+        except AdmissionRejected as e:
+            import shutil
+            shutil.rmtree(upload_dir)
+            responses.append({
+                "job_id": None, "status": "failed", "error": e.detail,
+                "retry_after": e.headers and e.headers["Retry-After"], "filename": file.filename
+            })
+            continue
             
-        user.usage_bytes += size
-        db.commit() # Commit usage increment immediately
+        await run_in_threadpool(storage.publish, upload_dir)
         
         # Dispatch
         if tool == "split":
              if celery_app:
-                task = celery_app.send_task("split_pdf", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "split_pdf", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                await _refund(client_ip, cost)
                 responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                 continue
 
         elif tool == "compress":
              if celery_app:
-                task = celery_app.send_task("compress_pdf", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "compress_pdf", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
 
         elif tool == "ocr":
              if celery_app:
-                task = celery_app.send_task("ocr_pdf", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "ocr_pdf", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
                  
         elif tool == "convert":
              if celery_app:
-                task = celery_app.send_task("convert_file", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "convert_file", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
 
         elif tool == "pdf_to_pptx":
              if celery_app:
-                task = celery_app.send_task("pdf_to_pptx", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "pdf_to_pptx", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
 
         elif tool == "pdf_to_xlsx":
              if celery_app:
-                task = celery_app.send_task("pdf_to_xlsx", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "pdf_to_xlsx", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
 
         elif tool == "pdf_to_html":
              if celery_app:
-                task = celery_app.send_task("pdf_to_html", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "pdf_to_html", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
 
         elif tool == "watermark":
              if celery_app:
-                task = celery_app.send_task("add_watermark", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "add_watermark", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
 
         elif tool == "page_numbers":
              if celery_app:
-                task = celery_app.send_task("add_page_numbers", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "add_page_numbers", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
 
         elif tool == "rotate":
              if celery_app:
-                task = celery_app.send_task("rotate_pages", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "rotate_pages", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
 
         elif tool == "metadata":
              if celery_app:
-                task = celery_app.send_task("edit_metadata", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "edit_metadata", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
 
         elif tool == "protect":
              if celery_app:
-                task = celery_app.send_task("protect_pdf", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "protect_pdf", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
 
         elif tool == "unlock":
              if celery_app:
-                task = celery_app.send_task("unlock_pdf", args=[job_id, path, job_params])
+                task = await _send_task(client_ip, "unlock_pdf", [job_id, path, job_params], cost, release=False)
                 jobs[job_id] = {"status": "queued", "celery_id": task.id}
              else:
+                 await _refund(client_ip, cost)
                  responses.append({"job_id": job_id, "status": "failed", "error": "Celery required"})
                  continue
         
         else:
+            await _refund(client_ip, cost)
             responses.append({"job_id": job_id, "status": "failed", "error": "Tool not supported"})
             continue
-            
-        responses.append({"job_id": job_id, "status": "queued", "filename": file.filename})
+
+        if storage.remote:
+            storage.release(upload_dir)
+        user.usage_bytes += size
+        db.commit() # Commit usage increment immediately
+        jobs[job_id].update(tool=tool, params=job_params, pages=pages, cost=cost)
+        retention.register(job_id, task_id=jobs[job_id].get("celery_id"))
+        responses.append({"job_id": job_id, "status": "queued", "filename": file.filename, "estimated_cost": round(cost, 2)})
+
+    # Released together, so runs of light jobs go to the workers as batches
+    if fair_share.enabled:
+        try:
+            await run_in_threadpool(fair_share.pump)
+        except Exception:
+            pass  # The background release loop picks them up
 
     return responses
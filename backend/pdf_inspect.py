@@ -0,0 +1,180 @@
+"""
+Cheap PDF inspection for the /inspect endpoint.
+
+pikepdf (qpdf) only reads the trailer and cross-reference table when a file
+is opened; objects are resolved on access. Inspection touches the page tree
+and resource dictionaries but never decodes content or image streams, so it
+runs in milliseconds even on large documents. Results are cached by content
+hash.
+"""
+import copy
+import hashlib
+import os
+from collections import OrderedDict
+from threading import Lock
+
+CACHE_SIZE = int(os.environ.get("INSPECT_CACHE_SIZE", 512))
+HASH_CHUNK = 1024 * 1024
+
+_cache = OrderedDict()
+_cache_lock = Lock()
+
+METADATA_KEYS = {
+    "/Title": "title",
+    "/Author": "author",
+    "/Subject": "subject",
+    "/Keywords": "keywords",
+    "/Creator": "creator",
+    "/Producer": "producer",
+}
+
+
+def file_sha256(path):
+    """Hash a file in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_get(key):
+    # Callers get their own copy: nested lists and dicts must not leak edits into the cache
+    with _cache_lock:
+        result = _cache.get(key)
+        if result is not None:
+            _cache.move_to_end(key)
+    return copy.deepcopy(result)
+
+
+def _cache_put(key, result):
+    result = copy.deepcopy(result)
+    with _cache_lock:
+        _cache[key] = result
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _page_resources(page_obj):
+    """Resources of a page, following inheritance up the page tree."""
+    import pikepdf
+
+    node = page_obj
+    for _ in range(64):  # Guard against /Parent loops in damaged files
+        if node is None:
+            break
+        if "/Resources" in node:
+            return node.Resources
+        node = node.get("/Parent")
+    return pikepdf.Dictionary()
+
+
+def _scan_resources(resources, images, seen, depth=0):
+    """
+    Return True if the resources (or nested forms) reference fonts.
+    Image XObjects are recorded in `images`, once per object.
+    """
+    import pikepdf
+
+    has_fonts = "/Font" in resources and len(resources.Font) > 0
+    xobjects = resources.get("/XObject")
+    if xobjects is None or depth > 3:
+        return has_fonts
+
+    for _, xobj in xobjects.items():
+        if not isinstance(xobj, pikepdf.Stream):
+            continue
+        key = xobj.objgen
+        if key != (0, 0) and key in seen:
+            continue
+        seen.add(key)
+
+        subtype = xobj.get("/Subtype")
+        if subtype == pikepdf.Name.Image:
+            filters = xobj.get("/Filter")
+            if isinstance(filters, pikepdf.Array):
+                filters = [str(f) for f in filters]
+            elif filters is not None:
+                filters = [str(filters)]
+            colorspace = xobj.get("/ColorSpace")
+            images.append({
+                "width": int(xobj.get("/Width", 0)),
+                "height": int(xobj.get("/Height", 0)),
+                "bits_per_component": int(xobj.get("/BitsPerComponent", 0)),
+                "filters": filters or [],
+                "colorspace": str(colorspace) if isinstance(colorspace, pikepdf.Name) else None,
+                "size_bytes": int(xobj.get("/Length", 0)),
+            })
+        elif subtype == pikepdf.Name.Form and "/Resources" in xobj:
+            has_fonts = _scan_resources(xobj.Resources, images, seen, depth + 1) or has_fonts
+    return has_fonts
+
+
+def _inspect(path):
+    # Imported on first use to keep API startup fast
+    import pikepdf
+
+    result = {
+        "size_bytes": os.path.getsize(path),
+        "encrypted": False,
+        "needs_password": False,
+    }
+    try:
+        pdf = pikepdf.open(path)
+    except pikepdf.PasswordError:
+        result.update(encrypted=True, needs_password=True)
+        return result
+
+    with pdf:
+        result["pdf_version"] = pdf.pdf_version
+        result["encrypted"] = pdf.is_encrypted
+        result["repaired"] = bool(pdf.get_warnings())
+
+        metadata = {}
+        if "/Info" in pdf.trailer:
+            for key, name in METADATA_KEYS.items():
+                if key in pdf.docinfo:
+                    metadata[name] = str(pdf.docinfo[key])
+        result["metadata"] = metadata
+
+        images = []
+        seen = set()
+        text_pages = 0
+        for page in pdf.pages:
+            if _scan_resources(_page_resources(page.obj), images, seen):
+                text_pages += 1
+
+        result["page_count"] = len(pdf.pages)
+        if pdf.pages:
+            box = pdf.pages[0].mediabox
+            result["first_page_size"] = [float(box[2]) - float(box[0]), float(box[3]) - float(box[1])]
+        result["text_pages"] = text_pages
+        result["has_text_layer"] = text_pages > 0
+        result["image_count"] = len(images)
+        result["max_image_pixels"] = max((img["width"] * img["height"] for img in images), default=0)
+        result["images"] = images
+    return result
+
+
+def inspect_pdf(path, sha256=None):
+    """
+    Inspect a PDF file, using the cached result for identical content.
+
+    Args:
+        path: Path to the PDF
+        sha256: Precomputed content hash (computed from the file if omitted)
+
+    Returns:
+        dict describing the document. Raises pikepdf.PdfError for files that
+        are not PDFs or cannot be repaired.
+    """
+    sha256 = sha256 or file_sha256(path)
+    cached = _cache_get(sha256)
+    if cached is not None:
+        return cached
+
+    result = _inspect(path)
+    result["sha256"] = sha256
+    _cache_put(sha256, result)
+    return result
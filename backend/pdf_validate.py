@@ -0,0 +1,142 @@
+"""
+Upload-time PDF validation and repair.
+
+Runs on every PDF input before it is charged to the user's quota or queued,
+so files that would only fail deep inside a worker are rejected straight
+away:
+
+  1. header   - "%PDF-" within the first 1 KiB
+  2. trailer  - "%%EOF" and "startxref" within the last 1 KiB
+  3. open     - pikepdf reads the trailer and cross-reference table (objects
+                stay unresolved) and the page tree is counted
+  4. security - files needing a user password are rejected unless the job
+                is an unlock with the right password
+
+Files qpdf could only open by reconstructing the xref (or missing the
+trailer markers) are rewritten once with a pikepdf open/save, so downstream
+tools don't all hit the same damage. Set UPLOAD_REPAIR=0 to accept them
+unchanged instead.
+"""
+import os
+
+REPAIR = os.environ.get("UPLOAD_REPAIR", "1") != "0"
+PROBE_BYTES = 1024
+
+# Tools whose inputs must be PDFs; convert only when converting from PDF
+PDF_TOOLS = {
+    "merge", "split", "compress", "ocr", "pdf_to_pptx", "pdf_to_xlsx", "pdf_to_html",
+    "watermark", "page_numbers", "rotate", "metadata", "protect", "unlock", "pipeline",
+}
+
+
+class InvalidPDF(Exception):
+    """The upload is not a PDF the tools can process."""
+
+
+def _reason(error, path):
+    # qpdf prefixes messages with the file path, which clients shouldn't see
+    return str(error).replace(f"{path}: ", "")
+
+
+def _unlock_params(tool, params):
+    """Params of the unlock the job starts with (unlock, or a pipeline's first step), else None."""
+    params = params or {}
+    if tool == "unlock":
+        return params
+    steps = params.get("steps") if tool == "pipeline" else None
+    if isinstance(steps, list) and steps and isinstance(steps[0], dict) and steps[0].get("tool") == "unlock":
+        return steps[0].get("params") or {}
+    return None
+
+
+def needs_validation(tool, path):
+    if tool in PDF_TOOLS:
+        return True
+    return tool == "convert" and path.lower().endswith(".pdf")
+
+
+def _probe(path):
+    """(header ok, trailer ok) from the first and last KiB."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(PROBE_BYTES)
+        f.seek(max(0, size - PROBE_BYTES))
+        tail = f.read(PROBE_BYTES)
+    return b"%PDF-" in head, b"%%EOF" in tail and b"startxref" in tail
+
+
+def validate_pdf(path, tool=None, params=None, repair=REPAIR):
+    """
+    Validate a PDF upload in place, repairing it if it is damaged but recoverable.
+
+    Args:
+        path: Path to the uploaded file
+        tool: Tool the file is for (unlock jobs, and pipelines starting with
+            one, may open it with their password)
+        params: Job parameters
+        repair: Rewrite recoverable files with pikepdf
+
+    Returns:
+        dict with pages, encrypted and repaired. Raises InvalidPDF for files
+        that are not PDFs, cannot be opened or need a password.
+    """
+    # Imported on first use to keep API startup fast
+    import pikepdf
+
+    header_ok, trailer_ok = _probe(path)
+    if not header_ok:
+        raise InvalidPDF("Not a PDF file (missing %PDF- header)")
+
+    unlock = _unlock_params(tool, params)
+    password = unlock.get("password", "") if unlock is not None else ""
+    try:
+        pdf = pikepdf.open(path, password=password)
+    except pikepdf.PasswordError:
+        if unlock is not None:
+            raise InvalidPDF("Incorrect password for this PDF")
+        raise InvalidPDF("PDF is password-protected; unlock it first")
+    except pikepdf.PdfError as e:
+        raise InvalidPDF(f"PDF is damaged beyond repair: {_reason(e, path)}")
+
+    with pdf:
+        try:
+            pages = len(pdf.pages)
+        except pikepdf.PdfError as e:
+            raise InvalidPDF(f"PDF page tree is unreadable: {_reason(e, path)}")
+        if not pages:
+            raise InvalidPDF("PDF has no pages")
+        encrypted = pdf.is_encrypted
+        damaged = not trailer_ok or bool(pdf.get_warnings())
+
+        repaired = False
+        if damaged and repair:
+            tmp_path = f"{path}.repair"
+            try:
+                # encryption=True keeps an encrypted file's security settings
+                pdf.save(tmp_path, encryption=True if encrypted else None)
+            except pikepdf.PdfError as e:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise InvalidPDF(f"PDF is damaged beyond repair: {_reason(e, tmp_path)}")
+            os.replace(tmp_path, path)
+            repaired = True
+
+    return {"pages": pages, "encrypted": encrypted, "repaired": repaired}
+
+
+def validate_inputs(tool, paths, params=None):
+    """
+    Validate every PDF input of a job.
+
+    Returns:
+        Paths that were repaired (and so changed on disk)
+    """
+    repaired = []
+    for path in paths:
+        if needs_validation(tool, path):
+            try:
+                if validate_pdf(path, tool, params)["repaired"]:
+                    repaired.append(path)
+            except InvalidPDF as e:
+                raise InvalidPDF(f"{os.path.basename(path)}: {e}")
+    return repaired
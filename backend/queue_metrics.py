@@ -0,0 +1,152 @@
+"""
+Celery queue depth, age and backlog, read straight from the Redis broker.
+
+Exposed to Prometheus at /metrics/queues (for dashboards and the worker HPA)
+and used by the API to shed load with 503 + Retry-After once the backlog
+passes BACKLOG_REJECT_SECONDS. Jobs the fair-share dispatcher is still
+holding for a queue count toward its depth and backlog.
+"""
+import json
+import os
+import time
+from threading import Lock
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.core import GaugeMetricFamily
+
+from admission import AdmissionRejected, WORKER_THROUGHPUT
+from fair_share import HELD_KEY
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+QUEUES = [q for q in os.environ.get("CELERY_QUEUES", "celery").split(",") if q]
+# Estimated CPU-seconds of queued work above which new jobs are refused
+BACKLOG_REJECT_SECONDS = float(os.environ.get("BACKLOG_REJECT_SECONDS", 1800))
+
+# Keep in sync with workers/celery_app.py
+ACTIVE_KEY_PREFIX = "pdfsimple:active:"
+
+# Messages inspected per queue to estimate backlog; longer queues are extrapolated
+SAMPLE_SIZE = 1000
+CACHE_TTL = 2.0
+DEFAULT_MESSAGE_COST = 1.0
+
+
+class QueueMonitor:
+    def __init__(self, redis_url=REDIS_URL, queues=QUEUES):
+        self.redis_url = redis_url
+        self.queues = queues
+        self._client = None
+        self._lock = Lock()
+        self._snapshot = None
+        self._snapshot_at = 0.0
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=1)
+        return self._client
+
+    def _held(self):
+        """{queue: (depth, CPU-seconds)} of jobs waiting in the fair-share queues."""
+        held = {}
+        for field, value in self.client.hgetall(HELD_KEY).items():
+            queue, _, kind = field.decode().rpartition(":")
+            depth, cost = held.get(queue, (0, 0.0))
+            if kind == "depth":
+                depth = max(0, int(value))
+            else:
+                cost = max(0.0, float(value))
+            held[queue] = (depth, cost)
+        return held
+
+    def _queue_stats(self, queue, now, held=(0, 0.0)):
+        depth = self.client.llen(queue)
+        stats = {"depth": depth + held[0], "oldest_age_seconds": 0.0, "backlog_seconds": held[1]}
+        if not depth:
+            return stats
+
+        # kombu LPUSHes and BRPOPs: the oldest message is at the tail
+        sample = self.client.lrange(queue, -SAMPLE_SIZE, -1)
+        costs = []
+        oldest = None
+        for raw in sample:
+            try:
+                headers = json.loads(raw).get("headers") or {}
+            except (ValueError, AttributeError):
+                headers = {}
+            costs.append(float(headers.get("cost") or DEFAULT_MESSAGE_COST))
+            sent_at = headers.get("sent_at")
+            if sent_at and (oldest is None or sent_at < oldest):
+                oldest = sent_at
+
+        if oldest:
+            stats["oldest_age_seconds"] = max(0.0, now - oldest)
+        stats["backlog_seconds"] += sum(costs) * depth / len(costs)
+        return stats
+
+    def _active_by_tool(self):
+        active = {}
+        for key in self.client.scan_iter(match=ACTIVE_KEY_PREFIX + "*", count=500):
+            tool = self.client.get(key)
+            if tool:
+                tool = tool.decode()
+                active[tool] = active.get(tool, 0) + 1
+        return active
+
+    def snapshot(self):
+        """
+        Current queue state, cached for CACHE_TTL seconds. Empty if Redis is unreachable.
+        """
+        import redis
+
+        with self._lock:
+            now = time.time()
+            if self._snapshot is not None and now - self._snapshot_at < CACHE_TTL:
+                return self._snapshot
+            try:
+                held = self._held()
+                queues = {queue: self._queue_stats(queue, now, held.get(queue, (0, 0.0))) for queue in self.queues}
+                snapshot = {
+                    "queues": queues,
+                    "active": self._active_by_tool(),
+                    "backlog_seconds": sum(q["backlog_seconds"] for q in queues.values()),
+                }
+            except redis.RedisError:
+                snapshot = {"queues": {}, "active": {}, "backlog_seconds": 0.0}
+            self._snapshot, self._snapshot_at = snapshot, now
+            return snapshot
+
+    def check_backpressure(self):
+        """Raise AdmissionRejected (503) when the queued backlog is over the threshold."""
+        backlog = self.snapshot()["backlog_seconds"]
+        if backlog > BACKLOG_REJECT_SECONDS:
+            raise AdmissionRejected(
+                503, "Job queue is backed up, retry later",
+                (backlog - BACKLOG_REJECT_SECONDS) / WORKER_THROUGHPUT,
+            )
+
+    def collect(self):
+        """prometheus_client collector interface."""
+        snapshot = self.snapshot()
+        depth = GaugeMetricFamily("pdfsimple_queue_depth", "Messages waiting in the queue", labels=["queue"])
+        age = GaugeMetricFamily(
+            "pdfsimple_queue_oldest_age_seconds", "Age of the oldest waiting message", labels=["queue"]
+        )
+        backlog = GaugeMetricFamily(
+            "pdfsimple_queue_backlog_seconds", "Estimated CPU-seconds of queued work", labels=["queue"]
+        )
+        for queue, stats in snapshot["queues"].items():
+            depth.add_metric([queue], stats["depth"])
+            age.add_metric([queue], stats["oldest_age_seconds"])
+            backlog.add_metric([queue], stats["backlog_seconds"])
+
+        active = GaugeMetricFamily("pdfsimple_active_tasks", "Tasks currently executing", labels=["tool"])
+        for tool, count in snapshot["active"].items():
+            active.add_metric([tool], count)
+        return [depth, age, backlog, active]
+
+
+queue_monitor = QueueMonitor()
+queue_registry = CollectorRegistry()
+queue_registry.register(queue_monitor)
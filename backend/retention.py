@@ -0,0 +1,245 @@
+"""
+Retention of job artifacts under DATA_DIR.
+
+Every job (and upload) owns the paths DATA_DIR/<id> and DATA_DIR/<id>_*.
+The API registers each id with a TTL as a small marker file in
+DATA_DIR/.retention, so every replica sharing the volume sees it, and a
+background sweeper:
+
+  1. removes artifacts whose TTL has passed (and their objects when
+     storage is remote),
+  2. removes orphans - unregistered artifacts older than ORPHAN_TTL, left
+     by crashes or older releases,
+  3. when the volume is fuller than GC_HIGH_WATER, evicts registered
+     artifacts oldest-first down to GC_LOW_WATER, skipping anything younger
+     than GC_MIN_AGE and jobs not known to be finished.
+
+Jobs are registered with their Celery task id, and whether a job has
+finished is read from its task's result in the shared result backend, so
+any replica can sweep jobs queued by another. An expired job that never
+shows up as finished (lost, or its result expired first) is kept for
+another ORPHAN_TTL before it is removed anyway.
+
+Evictions and reclaimed bytes are exported as Prometheus counters by reason
+(expired, orphan, pressure), along with the volume's used fraction.
+"""
+import asyncio
+import glob
+import json
+import os
+import shutil
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge
+
+DATA_DIR = os.environ.get("DATA_DIR", "/data")
+RESULT_TTL = int(os.environ.get("RESULT_TTL", 24 * 3600))
+ORPHAN_TTL = int(os.environ.get("ORPHAN_TTL", 7 * 24 * 3600))
+HIGH_WATER = float(os.environ.get("GC_HIGH_WATER", 0.85))
+LOW_WATER = float(os.environ.get("GC_LOW_WATER", 0.75))
+MIN_AGE = int(os.environ.get("GC_MIN_AGE", 600))
+INTERVAL = float(os.environ.get("GC_INTERVAL", 60))
+ENABLED = os.environ.get("GC_ENABLED", "1") != "0"
+
+EVICTIONS = Counter("pdfsimple_gc_evictions", "Job artifacts removed by the sweeper", ["reason"])
+RECLAIMED = Counter("pdfsimple_gc_reclaimed_bytes", "Bytes freed by the sweeper", ["reason"])
+VOLUME_USAGE = Gauge("pdfsimple_data_volume_usage_ratio", "Used fraction of the data volume")
+TRACKED = Gauge("pdfsimple_gc_tracked_artifacts", "Job and upload ids registered for retention")
+
+
+def _size(path):
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+    try:
+        return os.lstat(path).st_size
+    except OSError:
+        return 0
+
+
+class Retention:
+    def __init__(self, data_dir=DATA_DIR, storage=None, is_finished=None):
+        """
+        Args:
+            data_dir: Volume holding job artifacts
+            storage: Storage backend; remote objects are deleted on expiry
+            is_finished: Callable(task_id) -> True once a job's task has a final result
+        """
+        self.data_dir = data_dir
+        self.marker_dir = os.path.join(data_dir, ".retention")
+        self.storage = storage
+        self.is_finished = is_finished or (lambda task_id: True)
+
+    def _marker(self, name):
+        return os.path.join(self.marker_dir, f"{name}.json")
+
+    def register(self, name, ttl=RESULT_TTL, task_id=None):
+        """
+        Keep the artifacts of job or upload `name` for `ttl` seconds from now.
+
+        Args:
+            task_id: Celery task id of a job, so its artifacts are kept until it finishes
+        """
+        os.makedirs(self.marker_dir, exist_ok=True)
+        marker = self._marker(name)
+        entry = {"created_at": time.time()}
+        try:
+            with open(marker) as f:
+                previous = json.load(f)
+            entry["created_at"] = previous["created_at"]
+            task_id = task_id or previous.get("task_id")
+        except (OSError, ValueError, KeyError):
+            pass
+        entry["expires_at"] = time.time() + ttl
+        if task_id:
+            entry["task_id"] = task_id
+        tmp = f"{marker}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, marker)
+
+    def registered(self):
+        """{id: marker dict} for every registered id."""
+        entries = {}
+        try:
+            names = os.listdir(self.marker_dir)
+        except FileNotFoundError:
+            return entries
+        for filename in names:
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.marker_dir, filename)) as f:
+                    entries[filename[:-len(".json")]] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def artifacts(self, name):
+        base = os.path.join(self.data_dir, glob.escape(name))
+        return glob.glob(base) + glob.glob(f"{base}_*")
+
+    def evict(self, name, reason, remote=True):
+        """
+        Delete the artifacts of `name`.
+
+        Args:
+            remote: Also delete its objects from remote storage
+
+        Returns:
+            Bytes reclaimed
+        """
+        freed = 0
+        for path in self.artifacts(name):
+            freed += _size(path)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        if remote and self.storage is not None and self.storage.remote:
+            freed += self.storage.delete_prefix(name)
+        if remote:
+            try:
+                os.remove(self._marker(name))
+            except FileNotFoundError:
+                pass
+        EVICTIONS.labels(reason).inc()
+        RECLAIMED.labels(reason).inc(freed)
+        return freed
+
+    def finished(self, marker):
+        """False while the job behind a marker may still be queued or running."""
+        task_id = marker.get("task_id")
+        if not task_id:
+            return True
+        try:
+            return self.is_finished(task_id)
+        except Exception:
+            # Result backend unreachable: assume the job may still need its files
+            return False
+
+    def usage(self):
+        """Used fraction of the volume holding data_dir."""
+        st = os.statvfs(self.data_dir)
+        total = st.f_blocks * st.f_frsize
+        if not total:
+            return 0.0
+        return 1 - (st.f_bavail * st.f_frsize) / total
+
+    def sweep(self, now=None):
+        """
+        Run one pass: expired, orphaned, then pressure evictions.
+
+        Returns:
+            dict of evictions and bytes reclaimed per reason, and volume usage
+        """
+        now = now or time.time()
+        summary = {reason: {"evicted": 0, "bytes": 0} for reason in ("expired", "orphan", "pressure")}
+
+        def record(reason, freed):
+            summary[reason]["evicted"] += 1
+            summary[reason]["bytes"] += freed
+
+        registered = self.registered()
+        for name, marker in list(registered.items()):
+            if marker["expires_at"] <= now and (
+                self.finished(marker) or marker["expires_at"] + ORPHAN_TTL <= now
+            ):
+                record("expired", self.evict(name, "expired"))
+                del registered[name]
+
+        try:
+            entries = list(os.scandir(self.data_dir))
+        except FileNotFoundError:
+            entries = []
+        orphaned = set()
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            # Ids are UUIDs; derived artifacts append "_<suffix>"
+            name = entry.name.split("_", 1)[0]
+            if name in registered or name in orphaned:
+                continue
+            try:
+                age = now - entry.stat(follow_symlinks=False).st_mtime
+            except FileNotFoundError:
+                continue
+            if age > ORPHAN_TTL:
+                orphaned.add(name)
+                record("orphan", self.evict(name, "orphan", remote=False))
+
+        usage = self.usage()
+        if usage > HIGH_WATER:
+            # Only local copies: objects in remote storage stay until they expire
+            remote_is_truth = self.storage is not None and self.storage.remote
+            for name, marker in sorted(registered.items(), key=lambda item: item[1]["created_at"]):
+                if usage <= LOW_WATER:
+                    break
+                if now - marker["created_at"] < MIN_AGE or not self.finished(marker):
+                    continue
+                record("pressure", self.evict(name, "pressure", remote=not remote_is_truth))
+                usage = self.usage()
+
+        VOLUME_USAGE.set(usage)
+        TRACKED.set(len(self.registered()))
+        summary["usage"] = round(usage, 4)
+        return summary
+
+    async def run(self, interval=INTERVAL):
+        """Sweep every `interval` seconds until cancelled."""
+        while True:
+            try:
+                await run_in_threadpool(self.sweep)
+            except Exception as e:
+                print(f"Retention sweep failed: {str(e)}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,34 @@
+import pytest
+from admission import AdmissionController, AdmissionRejected
+
+
+@pytest.fixture(params=["redis", "local"])
+def controller(request):
+    now = [1_000_000.0]
+    controller = AdmissionController(capacity=100, throughput=1, user_rate_per_minute=60, user_burst=50,
+                                     clock=lambda: now[0], redis_url="redis://127.0.0.1:1/0")
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        controller._client = fakeredis.FakeRedis()
+    return controller
+
+
+def test_refund_gives_back_an_admitted_charge(controller):
+    controller.admit("alice", 40)
+    assert controller.backlog_seconds() == 40
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.admit("alice", 20)
+    assert rejected.value.status_code == 429
+
+    controller.refund("alice", 40)
+
+    assert controller.backlog_seconds() == 0
+    controller.admit("alice", 50)
+
+
+def test_refund_never_overfills(controller):
+    controller.refund("bob", 30)
+    assert controller.backlog_seconds() == 0
+    controller.admit("bob", 50)
+    with pytest.raises(AdmissionRejected):
+        controller.admit("bob", 1)
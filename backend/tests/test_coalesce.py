@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from coalesce import SingleFlight
+
+
+def test_duplicate_waits_for_the_claim_and_attaches_to_the_dispatched_job():
+    flights = SingleFlight(wait=5)
+    active = {"first"}
+    threads = []
+
+    def is_active(job_id):
+        threads.append(threading.current_thread())
+        return job_id in active
+
+    async def scenario():
+        assert await flights.join("key", "first", is_active) is None
+        duplicate = asyncio.create_task(flights.join("key", "second", is_active))
+        await asyncio.sleep(0.05)
+        assert not duplicate.done()
+        flights.settle("key", "first", dispatched=True)
+        return await duplicate
+
+    assert asyncio.run(scenario()) == "first"
+    # The result backend lookup ran off the event loop
+    assert threads and threading.main_thread() not in threads
+
+
+def test_claim_settled_without_dispatch_frees_the_key():
+    flights = SingleFlight(wait=5)
+
+    async def scenario():
+        await flights.join("key", "first", lambda job_id: True)
+        duplicate = asyncio.create_task(flights.join("key", "second", lambda job_id: True))
+        await asyncio.sleep(0.05)
+        # Rejected or failed: the waiting request runs the job itself
+        flights.settle("key", "first", dispatched=False)
+        return await duplicate
+
+    assert asyncio.run(scenario()) is None
+    assert flights.flights["key"][1] == "second"
+
+
+def test_unsettled_claim_times_out():
+    flights = SingleFlight(wait=0.1)
+
+    async def scenario():
+        await flights.join("key", "first", lambda job_id: True)
+        return await flights.join("key", "second", lambda job_id: True)
+
+    assert asyncio.run(scenario()) is None
+    assert flights.flights["key"][1] == "second"
+
+
+def test_finished_leader_is_not_joined_and_settled_flights_expire():
+    flights = SingleFlight(wait=5)
+    active = {"running"}
+
+    async def scenario():
+        for job_id in ("running", "finished"):
+            await flights.join(job_id, job_id, lambda job_id: job_id in active)
+            flights.settle(job_id, job_id, dispatched=True)
+        assert await flights.join("finished", "retry", lambda job_id: job_id in active) is None
+        flights.settle("finished", "retry", dispatched=True)
+        active.discard("retry")
+        await flights.expire(lambda job_id: job_id in active)
+
+    asyncio.run(scenario())
+    assert list(flights.flights) == ["running"]
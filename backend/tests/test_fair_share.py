@@ -0,0 +1,138 @@
+import json
+from types import SimpleNamespace
+import pytest
+from fair_share import FairShare, HELD_KEY, QUEUE_PREFIX, READY_KEY
+
+
+class FakeCelery:
+    """Records sent tasks; fails the next `fail` sends as if the broker were down."""
+
+    def __init__(self):
+        self.conf = SimpleNamespace(task_default_queue="celery")
+        self.sent = []
+        self.fail = 0
+        self.finished = set()
+
+    def send_task(self, name, args=None, headers=None, task_id=None):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("broker unreachable")
+        self.sent.append((name, args, headers, task_id))
+
+    def AsyncResult(self, task_id):
+        return SimpleNamespace(id=task_id, ready=lambda: task_id in self.finished)
+
+
+@pytest.fixture
+def make_share():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+
+    def make(**kwargs):
+        share = FairShare(FakeCelery(), enabled=True, **kwargs)
+        share._client = client
+        return share
+    return make
+
+
+def _submit(share, user, numbers, task="compress_pdf", cost=1.0):
+    for number in numbers:
+        share.send_task(user, task, args=[f"{user}-{number}"], headers={"cost": cost}, release=False)
+
+
+def _released(share):
+    return [args[0] for name, args, _, _ in share.celery_app.sent]
+
+
+def _held(share):
+    held = share.client.hgetall(HELD_KEY)
+    return int(held.get(b"celery:depth", 0)), float(held.get(b"celery:cost", 0))
+
+
+def test_new_user_is_served_right_behind_the_queued_messages(make_share):
+    share = make_share(queue_target=2, user_cap=10)
+    _submit(share, "bulk", range(6))
+    assert share.pump() == 2
+
+    # Arrives behind a large backlog, but starts at the current virtual time
+    _submit(share, "new", [0])
+    share.queue_target = 1
+    share.pump()
+
+    assert _released(share) == ["bulk-0", "bulk-1", "new-0"]
+
+
+def test_user_cap_is_skipped_while_others_wait(make_share):
+    share = make_share(queue_target=5, user_cap=2, weights={"heavy": 10})
+    _submit(share, "heavy", range(4))
+    _submit(share, "light", range(4))
+
+    share.pump()
+
+    # By weight "heavy" would take most releases; its cap hands slots to "light"
+    assert _released(share) == ["heavy-0", "light-0", "heavy-1", "light-1", "heavy-2"]
+
+
+def test_user_cap_is_ignored_when_a_user_is_alone(make_share):
+    share = make_share(queue_target=5, user_cap=2)
+    _submit(share, "bulk", range(5))
+
+    assert share.pump() == 5
+    assert _released(share) == [f"bulk-{i}" for i in range(5)]
+
+
+def test_failed_release_requeues_entries_in_order(make_share):
+    share = make_share(queue_target=3, user_cap=10)
+    _submit(share, "alice", range(3))
+    share.celery_app.fail = 1
+
+    with pytest.raises(ConnectionError):
+        share.pump()
+
+    queued = [json.loads(raw)["args"][0] for raw in share.client.lrange(QUEUE_PREFIX + "alice", 0, -1)]
+    assert queued == ["alice-0", "alice-1", "alice-2"]
+    assert share.client.zscore(READY_KEY, "alice") == 0
+    assert _held(share) == (3, 3.0)
+
+    assert share.pump() == 3
+    assert _released(share) == ["alice-0", "alice-1", "alice-2"]
+
+
+def test_held_depth_and_cost_return_to_zero(make_share):
+    share = make_share(queue_target=10, user_cap=10)
+    _submit(share, "alice", range(3), cost=2.5)
+    _submit(share, "bob", range(4), task="rotate_pages", cost=0.25)
+    assert _held(share) == (7, 8.5)
+
+    share.pump()
+
+    assert _held(share) == (0, 0.0)
+    assert not share.client.exists(READY_KEY)
+
+
+def test_light_jobs_are_grouped_up_to_batch_max_and_batch_max_cost(make_share):
+    share = make_share(queue_target=10, user_cap=10, batch_max=4)
+    _submit(share, "alice", range(5), task="rotate_pages", cost=0.25)
+    _submit(share, "alice", range(5, 8), task="rotate_pages", cost=2.0)
+    _submit(share, "alice", [8], task="edit_metadata", cost=0.25)
+    _submit(share, "alice", [9, 10], task="compress_pdf", cost=0.25)
+
+    assert share.pump() == 11
+
+    sent = [
+        (name, [item["args"][0] for item in args[1]] if name == "run_batch" else args[0])
+        for name, args, _, _ in share.celery_app.sent
+    ]
+    assert sent == [
+        ("run_batch", ["alice-0", "alice-1", "alice-2", "alice-3"]),  # batch_max
+        ("run_batch", ["alice-4", "alice-5", "alice-6"]),             # another 2.0 passes BATCH_MAX_COST
+        ("rotate_pages", "alice-7"),                                  # a batch of one goes out as itself
+        ("edit_metadata", "alice-8"),
+        ("compress_pdf", "alice-9"),                                  # heavy tasks are never batched
+        ("compress_pdf", "alice-10"),
+    ]
+    # Jobs keep their own ids inside the batch, which is sent under a new one
+    _, (_, items), headers, task_id = share.celery_app.sent[1]
+    ids = [item["id"] for item in items]
+    assert len(set(ids)) == 3 and task_id not in ids
+    assert headers["cost"] == 4.25 and headers["fair_user"] == "alice"
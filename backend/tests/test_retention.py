@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import pytest
+import retention
+from retention import Retention
+
+
+def _job(sweeper, name, created_at, expires_at, task_id=None):
+    os.makedirs(os.path.join(sweeper.data_dir, name))
+    with open(os.path.join(sweeper.data_dir, name, "output.pdf"), "wb") as f:
+        f.write(b"x" * 1000)
+    sweeper.register(name, task_id=task_id)
+    marker = sweeper.registered()[name]
+    marker.update(created_at=created_at, expires_at=expires_at)
+    with open(sweeper._marker(name), "w") as f:
+        json.dump(marker, f)
+
+
+@pytest.fixture
+def sweeper():
+    finished = {"done"}
+    return Retention(data_dir=tempfile.mkdtemp(), is_finished=lambda task_id: task_id in finished)
+
+
+def test_expired_jobs_are_kept_until_their_task_finishes(sweeper):
+    now = 1_000_000.0
+    _job(sweeper, "finished", now - 100, now - 1, task_id="done")
+    _job(sweeper, "running", now - 100, now - 1, task_id="queued-elsewhere")
+    _job(sweeper, "upload", now - 100, now - 1)
+    _job(sweeper, "lost", now - retention.ORPHAN_TTL - 100, now - retention.ORPHAN_TTL - 1, task_id="lost")
+    _job(sweeper, "fresh", now - 100, now + 100, task_id="done")
+
+    summary = sweeper.sweep(now=now)
+
+    assert summary["expired"]["evicted"] == 3
+    assert sorted(sweeper.registered()) == ["fresh", "running"]
+    assert sorted(os.listdir(sweeper.data_dir)) == [".retention", "fresh", "running"]
+
+
+def test_pressure_evicts_finished_jobs_oldest_first(sweeper, monkeypatch):
+    now = 1_000_000.0
+    for index, name in enumerate(["oldest", "unfinished", "older", "newer"]):
+        task_id = "queued-elsewhere" if name == "unfinished" else "done"
+        _job(sweeper, name, now - 10_000 + index, now + 3600, task_id=task_id)
+    _job(sweeper, "young", now - 1, now + 3600, task_id="done")
+
+    # Each job fills 10% of the volume: 95% full, down to 75% after two evictions
+    jobs = lambda: len(os.listdir(sweeper.data_dir)) - 1
+    monkeypatch.setattr(sweeper, "usage", lambda: 0.45 + 0.1 * jobs())
+
+    summary = sweeper.sweep(now=now)
+
+    assert summary["pressure"]["evicted"] == 2
+    assert sorted(sweeper.registered()) == ["newer", "unfinished", "young"]
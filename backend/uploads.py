@@ -0,0 +1,245 @@
+"""
+Resumable, chunked uploads.
+
+A client creates a session for a file of known size, PUTs fixed-size chunks
+in any order and over as many connections as it likes, and completes the
+session once every chunk is in. Each chunk carries its SHA-256
+("Upload-Checksum: sha256 <base64>", as in tus) and is written straight to
+its offset in a preallocated file, so a dropped connection costs one chunk
+and GET on the session tells the client which chunks are still missing.
+
+The completed file is published to storage and can be passed to any tool
+through the `uploads` field of POST /jobs, like a direct upload.
+
+Sessions are kept in memory (like jobs); with several API replicas the
+session's requests must reach the same one.
+"""
+import base64
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from fastapi.concurrency import run_in_threadpool
+
+DATA_DIR = os.environ.get("DATA_DIR", "/data")
+DEFAULT_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 4 * 1024 ** 3))
+SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", 24 * 3600))
+# Per client: sessions not yet completed, and the bytes they have preallocated
+MAX_SESSIONS_PER_CLIENT = int(os.environ.get("UPLOAD_MAX_SESSIONS", 8))
+MAX_PENDING_BYTES = int(os.environ.get("UPLOAD_MAX_PENDING_BYTES", MAX_UPLOAD_BYTES))
+WRITE_BUFFER = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Rejected upload request; carries the HTTP status."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def parse_checksum(header):
+    """
+    Parse "sha256 <base64 digest>" into raw digest bytes.
+    """
+    algorithm, _, value = (header or "").strip().partition(" ")
+    if algorithm.lower() != "sha256":
+        raise UploadError(400, "Upload-Checksum must be 'sha256 <base64 digest>'")
+    try:
+        digest = base64.b64decode(value.strip(), validate=True)
+    except Exception:
+        raise UploadError(400, "Upload-Checksum digest is not valid base64")
+    if len(digest) != 32:
+        raise UploadError(400, "Upload-Checksum digest must be 32 bytes")
+    return digest
+
+
+class UploadSessions:
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create(self, client, filename, size, chunk_size=None, remaining_quota=None):
+        """
+        Start a session and preallocate its file.
+
+        Args:
+            client: Client the session belongs to
+            filename: Name of the uploaded file
+            size: File size in bytes
+            chunk_size: Requested chunk size (clamped)
+            remaining_quota: Bytes the client may still use; its open
+                sessions count against it too
+
+        Returns:
+            dict describing the session (see status)
+        """
+        self.expire()
+        if size <= 0:
+            raise UploadError(400, "size must be positive")
+        if size > MAX_UPLOAD_BYTES:
+            raise UploadError(413, f"Uploads are limited to {MAX_UPLOAD_BYTES} bytes")
+        chunk_size = min(max(int(chunk_size or DEFAULT_CHUNK_SIZE), MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+        upload_id = str(uuid.uuid4())
+        directory = os.path.join(self.data_dir, upload_id)
+        partial = os.path.join(directory, ".partial")
+        session = {
+            "upload_id": upload_id,
+            "client": client,
+            "filename": os.path.basename(filename) or "upload",
+            "size": size,
+            "chunk_size": chunk_size,
+            "chunks": -(-size // chunk_size),
+            "received": set(),
+            "partial": partial,
+            "expires_at": time.time() + SESSION_TTL,
+            "path": None,
+        }
+        with self.lock:
+            # Checked and reserved together, so parallel requests can't overshoot
+            pending = [s for s in self.sessions.values() if s["client"] == client and s["path"] is None]
+            pending_bytes = sum(s["size"] for s in pending)
+            if len(pending) >= MAX_SESSIONS_PER_CLIENT:
+                raise UploadError(429, f"At most {MAX_SESSIONS_PER_CLIENT} uploads can be in progress at once")
+            if pending_bytes + size > MAX_PENDING_BYTES:
+                raise UploadError(413, f"Uploads in progress are limited to {MAX_PENDING_BYTES} bytes")
+            if remaining_quota is not None and pending_bytes + size > remaining_quota:
+                raise UploadError(413, "Quota exceeded. Upgrade to Premium.")
+            self.sessions[upload_id] = session
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(partial, "wb") as f:
+                f.truncate(size)
+        except Exception:
+            with self.lock:
+                self.sessions.pop(upload_id, None)
+            raise
+        return self.status(upload_id, client)
+
+    def _get(self, upload_id, client):
+        session = self.sessions.get(upload_id)
+        if not session or session["client"] != client or session["expires_at"] < time.time():
+            raise UploadError(404, "Upload session not found")
+        return session
+
+    def status(self, upload_id, client):
+        session = self._get(upload_id, client)
+        with self.lock:
+            received = sorted(session["received"])
+        missing = sorted(set(range(session["chunks"])) - set(received))
+        return {
+            "upload_id": upload_id,
+            "filename": session["filename"],
+            "size": session["size"],
+            "chunk_size": session["chunk_size"],
+            "chunks": session["chunks"],
+            "received": received,
+            "missing": missing,
+            "completed": session["path"] is not None,
+            "expires_at": int(session["expires_at"]),
+        }
+
+    def chunk_range(self, upload_id, client, index):
+        """(offset, length) of chunk `index`."""
+        session = self._get(upload_id, client)
+        if session["path"] is not None:
+            raise UploadError(409, "Upload already completed")
+        if not 0 <= index < session["chunks"]:
+            raise UploadError(416, f"Chunk index must be in [0, {session['chunks']})")
+        offset = index * session["chunk_size"]
+        return offset, min(session["chunk_size"], session["size"] - offset)
+
+    def open_chunk(self, upload_id, client, index):
+        """File descriptor for writing chunk `index` with os.pwrite."""
+        session = self._get(upload_id, client)
+        return os.open(session["partial"], os.O_WRONLY)
+
+    def mark_received(self, upload_id, client, index):
+        session = self._get(upload_id, client)
+        with self.lock:
+            session["received"].add(index)
+            session["expires_at"] = time.time() + SESSION_TTL
+
+    def complete(self, upload_id, client, checksum=None):
+        """
+        Move the assembled file into place once every chunk is in.
+
+        Args:
+            checksum: optional "sha256 <base64>" of the whole file
+
+        Returns:
+            Path of the finished file
+        """
+        session = self._get(upload_id, client)
+        if session["path"] is not None:
+            return session["path"]
+        missing = session["chunks"] - len(session["received"])
+        if missing:
+            raise UploadError(409, f"{missing} chunk(s) missing")
+        if checksum:
+            expected = parse_checksum(checksum)
+            digest = hashlib.sha256()
+            with open(session["partial"], "rb") as f:
+                for block in iter(lambda: f.read(WRITE_BUFFER), b""):
+                    digest.update(block)
+            if digest.digest() != expected:
+                raise UploadError(409, "Checksum mismatch")
+        path = os.path.join(os.path.dirname(session["partial"]), session["filename"])
+        os.replace(session["partial"], path)
+        session["path"] = path
+        return path
+
+    def expire(self):
+        """Drop sessions past their TTL along with their partial files."""
+        now = time.time()
+        with self.lock:
+            expired = [s for s in self.sessions.values() if s["expires_at"] < now]
+            for session in expired:
+                del self.sessions[session["upload_id"]]
+        for session in expired:
+            if session["path"] is None and os.path.exists(session["partial"]):
+                os.remove(session["partial"])
+
+
+async def receive_chunk(sessions, request, upload_id, index):
+    """
+    Stream a chunk's body to its offset, verifying its length and checksum.
+    """
+    client = request.client.host
+    expected = parse_checksum(request.headers.get("upload-checksum"))
+    offset, length = sessions.chunk_range(upload_id, client, index)
+    digest = hashlib.sha256()
+    written = 0
+    buffer = bytearray()
+    fd = sessions.open_chunk(upload_id, client, index)
+    try:
+        async for data in request.stream():
+            if written + len(buffer) + len(data) > length:
+                raise UploadError(413, f"Chunk {index} is longer than {length} bytes")
+            digest.update(data)
+            buffer += data
+            if len(buffer) >= WRITE_BUFFER:
+                written += await run_in_threadpool(os.pwrite, fd, bytes(buffer), offset + written)
+                buffer.clear()
+        if buffer:
+            written += await run_in_threadpool(os.pwrite, fd, bytes(buffer), offset + written)
+    finally:
+        os.close(fd)
+    if written != length:
+        raise UploadError(400, f"Chunk {index} must be {length} bytes, got {written}")
+    if digest.digest() != expected:
+        # Not marked received: the client resends it and overwrites the bytes
+        raise UploadError(409, "Checksum mismatch")
+    sessions.mark_received(upload_id, client, index)
+    return sessions.status(upload_id, client)
+
+
+upload_sessions = UploadSessions()
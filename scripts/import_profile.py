@@ -0,0 +1,122 @@
+"""
+Import-time profile of the backend and worker entry points.
+
+Runs each entry point in a fresh interpreter under `python -X importtime`
+and reports the wall time to import it, the heaviest top-level imports
+(cumulative) and the slowest individual modules (self time). Use it to keep
+heavy libraries off the startup path; pods scaled up under load only become
+ready after these imports.
+
+Usage:
+    python scripts/import_profile.py
+    python scripts/import_profile.py --top 15 --repeat 5
+    python scripts/import_profile.py --budget backend=800 worker=400   # exit 1 over budget (ms)
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    # uvicorn main:app, without touching the database
+    "backend": {
+        "cwd": os.path.join(ROOT, "backend"),
+        "code": "import main",
+        "env": {"DATABASE_URL": "sqlite://"},
+    },
+    # celery -A workers.celery_app worker imports the app and every included task module
+    "worker": {
+        "cwd": ROOT,
+        "code": "from workers.celery_app import celery_app; celery_app.loader.import_default_modules()",
+        "env": {},
+    },
+}
+
+
+def parse_importtime(stderr):
+    """
+    Parse -X importtime output into (module, self_us, cumulative_us, depth) tuples.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        # One space after the separator, then two per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def profile(name, repeat=3):
+    entry = ENTRY_POINTS[name]
+    env = dict(os.environ, **entry["env"])
+    walls = []
+    stderr = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", entry["code"]],
+            cwd=entry["cwd"], env=env, capture_output=True, text=True,
+        )
+        walls.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"{name} failed to import:\n{result.stderr[-2000:]}")
+        stderr = result.stderr
+
+    rows = parse_importtime(stderr)
+    top_level = [row for row in rows if row[3] == 0]
+    # The entry module's own imports are the actionable ones
+    direct = [row for row in rows if row[3] <= 1]
+    return {
+        "wall_ms": statistics.median(walls) * 1000,
+        "import_ms": sum(row[2] for row in top_level) / 1000,
+        "modules": len(rows),
+        "heaviest": sorted(((n, c / 1000) for n, _, c, _ in direct), key=lambda r: -r[1]),
+        "slowest": sorted(((n, s / 1000) for n, s, _, _ in rows), key=lambda r: -r[1]),
+        "loaded": sorted({n.split(".")[0] for n, _, _, _ in rows}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile import time of the backend and worker entry points")
+    parser.add_argument("entry_points", nargs="*", help=f"Any of {', '.join(sorted(ENTRY_POINTS))} (default: all)")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per entry point (median wall time)")
+    parser.add_argument("--budget", nargs="+", default=[], help="name=ms limits on wall time")
+    parser.add_argument("--json", help="Write the full report to this path")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.entry_points) - set(ENTRY_POINTS)
+    if unknown:
+        parser.error(f"Unknown entry points: {', '.join(sorted(unknown))}")
+    budgets = {key: float(value) for key, _, value in (b.partition("=") for b in args.budget)}
+    report = {}
+    failed = False
+    for name in args.entry_points or sorted(ENTRY_POINTS):
+        result = report[name] = profile(name, args.repeat)
+        print(f"== {name}: {result['wall_ms']:.0f} ms to import "
+              f"({result['import_ms']:.0f} ms in imports, {result['modules']} modules)")
+        print("  heaviest imports (cumulative, entry module and its direct imports):")
+        for module, ms in result["heaviest"][:args.top]:
+            print(f"    {ms:8.1f} ms  {module}")
+        print("  slowest modules (self):")
+        for module, ms in result["slowest"][:args.top]:
+            print(f"    {ms:8.1f} ms  {module}")
+        if name in budgets and result["wall_ms"] > budgets[name]:
+            print(f"  OVER BUDGET: {result['wall_ms']:.0f} ms > {budgets[name]:.0f} ms")
+            failed = True
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
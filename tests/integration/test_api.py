@@ -19,10 +19,16 @@ def test_health_check(api_base):
     except requests.exceptions.ConnectionError:
         pytest.fail("API is not reachable. Is Docker running?")
 
+def _blank_pdf(path, pages=1):
+    import pikepdf
+    pdf = pikepdf.Pdf.new()
+    for _ in range(pages):
+        pdf.add_blank_page()
+    pdf.save(path)
+    return path
+
 def test_upload_single_file(api_base, tmp_path):
-    # Create dummy PDF
-    dummy = tmp_path / "test.pdf"
-    dummy.write_text("%PDF-1.4 dummy content")
+    dummy = _blank_pdf(tmp_path / "test.pdf")
     
     with open(dummy, "rb") as f:
         files = {"files": ("test.pdf", f, "application/pdf")}
@@ -45,10 +51,8 @@ def test_upload_single_file(api_base, tmp_path):
     # Real test would assert 'completed' but we don't have real workers running potentially
 
 def test_batch_upload(api_base, tmp_path):
-    dummy1 = tmp_path / "b1.pdf"
-    dummy1.write_text("%PDF-1.4 batch 1")
-    dummy2 = tmp_path / "b2.pdf"
-    dummy2.write_text("%PDF-1.4 batch 2")
+    dummy1 = _blank_pdf(tmp_path / "b1.pdf")
+    dummy2 = _blank_pdf(tmp_path / "b2.pdf", pages=2)
     
     files = [
         ("files", ("b1.pdf", open(dummy1, "rb"), "application/pdf")),
@@ -66,3 +70,234 @@ def test_batch_upload(api_base, tmp_path):
     
     # Check quota error logic?
     # requires mocking or setting quota low.
+
+def test_invalid_pdf_rejected_at_upload(api_base, tmp_path):
+    stub = tmp_path / "stub.pdf"
+    stub.write_text("%PDF-1.4 dummy content")
+    with open(stub, "rb") as f:
+        resp = requests.post(f"{api_base}/jobs", files={"files": ("stub.pdf", f, "application/pdf")},
+                             data={"tool": "compress", "params": "{}"})
+    assert resp.status_code == 400
+    assert "stub.pdf" in resp.json()["detail"]
+
+    resp = requests.post(f"{api_base}/jobs", files={"files": ("notes.pdf", b"hello", "application/pdf")},
+                         data={"tool": "compress", "params": "{}"})
+    assert resp.status_code == 400
+
+    # A broken xref is repaired on upload and the job is queued
+    data = _blank_pdf(tmp_path / "damaged.pdf").read_bytes()
+    data = data.replace(b"startxref\n", b"startxref\n9")
+    resp = requests.post(f"{api_base}/jobs", files={"files": ("damaged.pdf", data, "application/pdf")},
+                         data={"tool": "compress", "params": "{}"})
+    assert resp.status_code == 200
+    assert resp.json().get("job_id")
+
+def test_inspect_pdf(api_base, tmp_path):
+    import pikepdf
+    sample = tmp_path / "inspect.pdf"
+    pdf = pikepdf.Pdf.new()
+    pdf.add_blank_page()
+    pdf.add_blank_page()
+    pdf.docinfo["/Title"] = "Inspect me"
+    pdf.save(sample)
+
+    with open(sample, "rb") as f:
+        resp = requests.post(f"{api_base}/inspect", files={"file": ("inspect.pdf", f, "application/pdf")})
+
+    assert resp.status_code == 200
+    info = resp.json()
+    assert info["page_count"] == 2
+    assert info["encrypted"] is False
+    assert info["has_text_layer"] is False
+    assert info["metadata"]["title"] == "Inspect me"
+
+    resp = requests.post(f"{api_base}/inspect", files={"file": ("junk.pdf", b"not a pdf", "application/pdf")})
+    assert resp.status_code == 400
+
+def test_result_download_ranges(api_base, tmp_path):
+    import pikepdf
+    sample = tmp_path / "ranges.pdf"
+    pdf = pikepdf.Pdf.new()
+    pdf.add_blank_page()
+    pdf.save(sample)
+
+    with open(sample, "rb") as f:
+        files = {"files": ("ranges.pdf", f, "application/pdf")}
+        resp = requests.post(f"{api_base}/jobs", files=files, data={"tool": "rotate", "params": '{"angle": 90}'})
+    job_id = resp.json()["job_id"]
+
+    for _ in range(20):
+        status = requests.get(f"{api_base}/jobs/{job_id}").json().get("status")
+        if status in ["completed", "failed"]:
+            break
+        time.sleep(1)
+    if status != "completed":
+        pytest.skip("No worker completed the job")
+
+    url = f"{api_base}/jobs/{job_id}/result"
+    full = requests.get(url)
+    assert full.status_code == 200
+    assert full.headers["Accept-Ranges"] == "bytes"
+    etag = full.headers["ETag"]
+    size = len(full.content)
+
+    assert requests.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    part = requests.get(url, headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert part.status_code == 206
+    assert part.headers["Content-Range"] == f"bytes 0-9/{size}"
+    assert part.content == full.content[:10]
+
+    stale = requests.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+
+    resp = requests.get(url, headers={"Range": f"bytes={size}-"})
+    assert resp.status_code == 416
+    assert resp.headers["Content-Range"] == f"bytes */{size}"
+
+def test_split_result_streams_zip(api_base, tmp_path):
+    import io
+    import zipfile
+    import pikepdf
+    sample = tmp_path / "split.pdf"
+    pdf = pikepdf.Pdf.new()
+    for _ in range(3):
+        pdf.add_blank_page()
+    pdf.save(sample)
+
+    with open(sample, "rb") as f:
+        files = {"files": ("split.pdf", f, "application/pdf")}
+        resp = requests.post(f"{api_base}/jobs", files=files, data={"tool": "split", "params": "{}"})
+    job_id = resp.json()["job_id"]
+
+    for _ in range(20):
+        status = requests.get(f"{api_base}/jobs/{job_id}").json().get("status")
+        if status in ["completed", "failed"]:
+            break
+        time.sleep(1)
+    if status != "completed":
+        pytest.skip("No worker completed the job")
+
+    resp = requests.get(f"{api_base}/jobs/{job_id}/result")
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(resp.content))
+    assert archive.namelist() == ["page_1.pdf", "page_2.pdf", "page_3.pdf"]
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+
+def test_resumable_upload(api_base, tmp_path):
+    import base64
+    import hashlib
+    import pikepdf
+
+    def checksum(data):
+        return "sha256 " + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+    sample = tmp_path / "resumable.pdf"
+    pdf = pikepdf.Pdf.new()
+    pdf.add_blank_page()
+    pdf.docinfo["/Padding"] = "x" * 600000
+    pdf.save(sample)
+    data = sample.read_bytes()
+
+    resp = requests.post(f"{api_base}/uploads/sessions",
+                         data={"filename": "resumable.pdf", "size": len(data), "chunk_size": 262144})
+    assert resp.status_code == 200
+    session = resp.json()
+    upload_id, size = session["upload_id"], session["chunk_size"]
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+    assert session["chunks"] == len(chunks)
+
+    url = f"{api_base}/uploads/sessions/{upload_id}"
+    resp = requests.put(f"{url}/chunks/0", data=chunks[0], headers={"Upload-Checksum": checksum(b"wrong")})
+    assert resp.status_code == 409
+
+    # Out of order, holding back chunk 0 as if the connection dropped
+    for index in reversed(range(1, len(chunks))):
+        resp = requests.put(f"{url}/chunks/{index}", data=chunks[index],
+                            headers={"Upload-Checksum": checksum(chunks[index])})
+        assert resp.status_code == 200
+    assert requests.post(f"{url}/complete").status_code == 409
+    assert requests.get(url).json()["missing"] == [0]
+
+    requests.put(f"{url}/chunks/0", data=chunks[0], headers={"Upload-Checksum": checksum(chunks[0])})
+    resp = requests.post(f"{url}/complete", data={"checksum": checksum(data)})
+    assert resp.status_code == 200
+    assert resp.json()["completed"] is True
+
+    resp = requests.post(f"{api_base}/jobs", data={"tool": "compress", "params": "{}", "uploads": f'["{upload_id}"]'})
+    assert resp.status_code == 200
+    assert resp.json().get("job_id")
+
+def test_identical_jobs_are_coalesced(api_base, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    sample = _blank_pdf(tmp_path / "twice.pdf", pages=50)
+
+    def submit(params):
+        with open(sample, "rb") as f:
+            files = {"files": ("twice.pdf", f, "application/pdf")}
+            return requests.post(f"{api_base}/jobs", files=files, data={"tool": "rotate", "params": params}).json()
+
+    # Same params in a different key order: still the same job
+    with ThreadPoolExecutor(2) as pool:
+        first, second = pool.map(submit, ['{"angle": 90, "pages": null}', '{"angle": 90}'])
+    coalesced = [job for job in (first, second) if "coalesced_with" in job]
+    assert len(coalesced) == 1
+    leader_id = coalesced[0]["coalesced_with"]
+    assert leader_id in (first["job_id"], second["job_id"])
+
+    for _ in range(20):
+        statuses = [requests.get(f"{api_base}/jobs/{job['job_id']}").json() for job in (first, second)]
+        if all(s["status"] in ["completed", "failed"] for s in statuses):
+            break
+        time.sleep(1)
+    assert statuses[0].get("output") == statuses[1].get("output")
+
+def test_pipeline_job(api_base, tmp_path):
+    import json
+    import pikepdf
+    first = _blank_pdf(tmp_path / "p1.pdf")
+    second = _blank_pdf(tmp_path / "p2.pdf", pages=2)
+    steps = [
+        {"tool": "merge"},
+        {"tool": "rotate", "params": {"angle": 90}},
+        {"tool": "protect", "params": {"password": "secret"}},
+    ]
+
+    bad = requests.post(f"{api_base}/jobs", files=[("files", ("p1.pdf", open(first, "rb"), "application/pdf"))],
+                        data={"tool": "pipeline", "params": json.dumps({"steps": steps[::-1]})})
+    assert bad.status_code == 400
+
+    files = [("files", (name, open(path, "rb"), "application/pdf")) for name, path in (("p1.pdf", first), ("p2.pdf", second))]
+    resp = requests.post(f"{api_base}/jobs", files=files, data={"tool": "pipeline", "params": json.dumps({"steps": steps})})
+    job_id = resp.json()["job_id"]
+    for _ in range(20):
+        status = requests.get(f"{api_base}/jobs/{job_id}").json().get("status")
+        if status in ["completed", "failed"]:
+            break
+        time.sleep(1)
+    if status != "completed":
+        pytest.skip("No worker completed the job")
+
+    result = tmp_path / "result.pdf"
+    result.write_bytes(requests.get(f"{api_base}/jobs/{job_id}/result").content)
+    with pikepdf.open(result, password="secret") as pdf:
+        assert [int(page.Rotate) for page in pdf.pages] == [90, 90, 90]
+
+def test_batch_of_light_jobs_reports_each_result(api_base, tmp_path):
+    sample = _blank_pdf(tmp_path / "light.pdf")
+    files = [("files", (f"light{i}.pdf", open(sample, "rb"), "application/pdf")) for i in range(12)]
+    resp = requests.post(f"{api_base}/jobs/batch", files=files, data={"tool": "rotate", "params": '{"angle": 180}'})
+    job_ids = [job["job_id"] for job in resp.json()]
+    assert len(job_ids) == 12
+
+    for _ in range(20):
+        statuses = [requests.get(f"{api_base}/jobs/{job_id}").json() for job_id in job_ids]
+        if all(s["status"] in ["completed", "failed"] for s in statuses):
+            break
+        time.sleep(1)
+    if not all(s["status"] == "completed" for s in statuses):
+        pytest.skip("No worker completed the jobs")
+    outputs = {s["output"]["file_path"] for s in statuses}
+    assert len(outputs) == 12
+    assert all(job_id in path for job_id, path in zip(job_ids, (s["output"]["file_path"] for s in statuses)))
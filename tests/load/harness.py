@@ -0,0 +1,376 @@
+"""
+End-to-end API load harness.
+
+Runs the FastAPI backend in a child process with no external services:
+  - SQLite instead of Postgres (DATABASE_URL)
+  - Celery on the in-memory kombu transport with an in-process worker
+    thread (or no worker with --workers 0, to measure enqueue only)
+  - fakeredis for the queue monitor when it is installed
+
+then drives a weighted mix of /jobs, /jobs/batch, status polling and result
+downloads at a target concurrency over real HTTP. It reports latency
+percentiles and throughput per operation, plus the backend's event-loop lag
+(sampled inside the server loop, so blocking calls in handlers show up
+directly) and resident memory. Worker threads share the backend process, so
+use --workers 0 when comparing backend memory between runs.
+
+Usage:
+    python tests/load/harness.py --concurrency 32 --duration 30
+    python tests/load/harness.py --mix jobs=1,status=10,download=2 --tool rotate,merge
+    python tests/load/harness.py --max-p99-ms 250 --max-loop-lag-ms 50   # exit 1 when exceeded
+
+/data must be writable; uploads and results are written there as in production.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BACKEND = os.path.join(ROOT, "backend")
+
+DEFAULT_MIX = "jobs=2,batch=1,status=12,download=3"
+# Generous admission budgets so the harness measures request overhead, not shedding
+UNLIMITED_ENV = {
+    "QUEUE_CAPACITY_SECONDS": "1e12",
+    "USER_CPU_SECONDS_PER_MINUTE": "1e12",
+    "USER_BURST_SECONDS": "1e12",
+    "BACKLOG_REJECT_SECONDS": "1e12",
+}
+LAG_INTERVAL = 0.01
+RSS_INTERVAL = 0.1
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _rss_bytes():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+
+def serve(port, workers, keep_limits):
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, BACKEND)
+
+    from workers.celery_app import celery_app
+    celery_app.conf.update(broker_url="memory://", result_backend="cache+memory://")
+
+    import main
+    import uvicorn
+    from queue_metrics import queue_monitor
+    try:
+        import fakeredis
+        queue_monitor._client = main.fair_share._client = main.admission._client = fakeredis.FakeRedis()
+    except ImportError:
+        main.fair_share.enabled = False
+    if not keep_limits:
+        main.limiter.enabled = False
+
+    stats = {"lag": [], "rss_peak": 0}
+
+    async def sample_loop():
+        loop = asyncio.get_running_loop()
+        last_rss = 0.0
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            now = loop.time()
+            stats["lag"].append(max(0.0, now - start - LAG_INTERVAL))
+            if now - last_rss >= RSS_INTERVAL:
+                stats["rss_peak"] = max(stats["rss_peak"], _rss_bytes())
+                last_rss = now
+
+    app_lifespan = main.app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with app_lifespan(app):
+            sampler = asyncio.create_task(sample_loop())
+            yield
+            sampler.cancel()
+
+    main.app.router.lifespan_context = lifespan
+
+    @main.app.post("/__loadtest/reset")
+    async def reset_stats():
+        stats["lag"] = []
+        stats["rss_peak"] = _rss_bytes()
+        return {"ok": True}
+
+    @main.app.get("/__loadtest/stats")
+    async def get_stats():
+        lag = stats["lag"]
+        return {
+            "loop_lag_ms": {
+                "p50": (percentile(lag, 50) or 0) * 1000,
+                "p99": (percentile(lag, 99) or 0) * 1000,
+                "max": max(lag, default=0) * 1000,
+            },
+            "rss_bytes": _rss_bytes(),
+            "peak_rss_bytes": max(stats["rss_peak"], _rss_bytes()),
+            "jobs_tracked": len(main.jobs),
+        }
+
+    def run_server():
+        uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+    if workers:
+        from celery.contrib.testing.worker import start_worker
+        with start_worker(celery_app, concurrency=workers, pool="threads", perform_ping_check=False):
+            run_server()
+    else:
+        run_server()
+
+
+def start_server(args):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='pdfsimple-load-')}/loadtest.db")
+    if not args.keep_limits:
+        for key, value in UNLIMITED_ENV.items():
+            env.setdefault(key, value)
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port),
+               "--workers", str(args.workers)]
+    if args.keep_limits:
+        command.append("--keep-limits")
+    process = subprocess.Popen(command, env=env, cwd=BACKEND)
+    return process, f"http://127.0.0.1:{port}"
+
+
+# ---------------------------------------------------------------------------
+# Client side
+# ---------------------------------------------------------------------------
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("jobs", "batch", "status", "download"):
+            raise ValueError(f"Unknown operation in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadRunner:
+    def __init__(self, client, args, document):
+        self.client = client
+        self.args = args
+        self.document = document
+        self.mix = parse_mix(args.mix)
+        self.tools = [tool.strip() for tool in args.tool.split(",") if tool.strip()]
+        self.rng = random.Random(args.seed)
+        self.job_ids = []
+        self.completed = []
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = 0
+        self.recording = False
+
+    def _files(self, count):
+        return [("files", (f"input{i}.pdf", self.document, "application/pdf")) for i in range(count)]
+
+    def _choose(self):
+        names = list(self.mix)
+        op = self.rng.choices(names, weights=[self.mix[n] for n in names])[0]
+        if op == "status" and not self.job_ids:
+            return "jobs"
+        if op == "download" and not self.completed:
+            return "status" if self.job_ids else "jobs"
+        return op
+
+    async def _request(self, op):
+        tool = self.rng.choice(self.tools)
+        if op == "jobs":
+            files = self._files(2 if tool == "merge" else 1)
+            response = await self.client.post("/jobs", data={"tool": tool, "params": self.args.params}, files=files)
+            if response.status_code == 200 and response.json().get("job_id"):
+                self.job_ids.append(response.json()["job_id"])
+        elif op == "batch":
+            tool = tool if tool != "merge" else "rotate"
+            files = self._files(self.args.batch_size)
+            response = await self.client.post("/jobs/batch", data={"tool": tool, "params": self.args.params},
+                                              files=files)
+            if response.status_code == 200:
+                self.job_ids.extend(job["job_id"] for job in response.json() if job.get("job_id"))
+        elif op == "status":
+            job_id = self.rng.choice(self.job_ids[-1000:])
+            response = await self.client.get(f"/jobs/{job_id}")
+            if response.status_code == 200 and response.json().get("status") == "completed":
+                self.completed.append(job_id)
+        else:
+            job_id = self.rng.choice(self.completed[-1000:])
+            async with self.client.stream("GET", f"/jobs/{job_id}/result") as response:
+                async for _ in response.aiter_bytes():
+                    pass
+        return response.status_code
+
+    async def _user(self, deadline):
+        while time.monotonic() < deadline:
+            op = self._choose()
+            start = time.perf_counter()
+            try:
+                status = await self._request(op)
+            except Exception:
+                status = "error"
+                self.errors += 1
+            elapsed = time.perf_counter() - start
+            if self.recording:
+                self.latencies.setdefault(op, []).append(elapsed)
+                key = f"{op} {status}"
+                self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    async def run(self, seconds):
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*(self._user(deadline) for _ in range(self.args.concurrency)))
+
+
+def _summarize(latencies, seconds):
+    report = {}
+    for op, values in sorted(latencies.items()):
+        report[op] = {
+            "requests": len(values),
+            "rps": len(values) / seconds,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p90_ms": percentile(values, 90) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": max(values) * 1000,
+        }
+    return report
+
+
+async def drive(base_url, args):
+    import httpx
+
+    sys.path.insert(0, ROOT)
+    from workers.benchmarks.corpus import build_pdf
+    path = os.path.join(tempfile.mkdtemp(prefix="pdfsimple-load-"), "input.pdf")
+    with open(build_pdf("text", args.pages, path), "rb") as f:
+        document = f.read()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        for _ in range(300):
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError("Backend did not become healthy")
+
+        runner = LoadRunner(client, args, document)
+        if args.warmup:
+            await runner.run(args.warmup)
+        await client.post("/__loadtest/reset")
+        runner.recording = True
+        start = time.perf_counter()
+        await runner.run(args.duration)
+        elapsed = time.perf_counter() - start
+        server = (await client.get("/__loadtest/stats")).json()
+
+    all_latencies = [value for values in runner.latencies.values() for value in values]
+    return {
+        "concurrency": args.concurrency,
+        "duration_seconds": elapsed,
+        "requests": len(all_latencies),
+        "throughput_rps": len(all_latencies) / elapsed,
+        "p99_ms": (percentile(all_latencies, 99) or 0) * 1000,
+        "operations": _summarize(runner.latencies, elapsed),
+        "status_codes": runner.statuses,
+        "client_errors": runner.errors,
+        "backend": server,
+    }
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['duration_seconds']:.1f}s at concurrency "
+          f"{report['concurrency']}: {report['throughput_rps']:.1f} req/s, p99 {report['p99_ms']:.1f} ms")
+    print(f"{'operation':<10} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for op, stats in report["operations"].items():
+        print(f"{op:<10} {stats['requests']:>9} {stats['rps']:>8.1f} {stats['p50_ms']:>9.1f} "
+              f"{stats['p90_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    print("status codes: " + ", ".join(f"{k}: {v}" for k, v in sorted(report["status_codes"].items())))
+    backend = report["backend"]
+    lag = backend["loop_lag_ms"]
+    print(f"backend event-loop lag: p50 {lag['p50']:.1f} ms, p99 {lag['p99']:.1f} ms, max {lag['max']:.1f} ms")
+    print(f"backend memory: {backend['rss_bytes'] / 1048576:.1f} MB now, "
+          f"{backend['peak_rss_bytes'] / 1048576:.1f} MB peak, {backend['jobs_tracked']} jobs tracked")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the PDFsimple API in-process")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Operation weights: jobs, batch, status, download")
+    parser.add_argument("--tool", default="rotate", help="Comma-separated tools to submit")
+    parser.add_argument("--params", default='{"angle": 90}', help="Job params JSON")
+    parser.add_argument("--pages", type=int, default=5, help="Pages in the uploaded document")
+    parser.add_argument("--batch-size", type=int, default=4, help="Files per /jobs/batch request")
+    parser.add_argument("--workers", type=int, default=4, help="In-process Celery worker threads (0: none)")
+    parser.add_argument("--keep-limits", action="store_true", help="Keep rate limits and admission budgets")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if overall p99 latency exceeds this")
+    parser.add_argument("--max-loop-lag-ms", type=float, help="Fail if p99 event-loop lag exceeds this")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.port, args.workers, args.keep_limits)
+        return 0
+
+    if not os.access("/data", os.W_OK):
+        parser.error("/data must exist and be writable")
+
+    process, base_url = start_server(args)
+    try:
+        report = asyncio.run(drive(base_url, args))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    failed = False
+    if args.max_p99_ms is not None and report["p99_ms"] > args.max_p99_ms:
+        print(f"FAIL: p99 latency {report['p99_ms']:.1f} ms > {args.max_p99_ms} ms")
+        failed = True
+    if args.max_loop_lag_ms is not None and report["backend"]["loop_lag_ms"]["p99"] > args.max_loop_lag_ms:
+        print(f"FAIL: event-loop lag p99 {report['backend']['loop_lag_ms']['p99']:.1f} ms > {args.max_loop_lag_ms} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
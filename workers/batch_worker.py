@@ -0,0 +1,69 @@
+"""
+Worker running a batch of light jobs as one task
+
+Rotate, metadata, protect and unlock take milliseconds on typical files, so
+at volume the broker publish/ack and per-task overhead cost more than the
+work. The API's fair-share dispatcher releases runs of them as one
+run_batch task; each job still runs through its own task (storage and
+metrics included) and its result is stored under its own task id, so job
+status and downloads work exactly as for a job sent on its own.
+
+Each job is marked STARTED (and active, for queue metrics) before it runs.
+The batch is acknowledged only once it finishes and is redelivered if its
+pool process dies; the redelivered batch skips jobs that already have a
+result, and fails the job that was running when the process died rather
+than run it again.
+"""
+import os
+import time
+import traceback
+from celery import states
+from .celery_app import celery_app, clear_active, mark_active
+
+# Keep in sync with BATCHABLE_TASKS in backend/fair_share.py
+BATCHABLE_TASKS = {"rotate_pages", "edit_metadata", "protect_pdf", "unlock_pdf"}
+
+
+@celery_app.task(name="run_batch", bind=True, acks_late=True, reject_on_worker_lost=True)
+def run_batch(self, task_name: str, items: list):
+    """
+    Run several jobs for one light task back to back.
+
+    Args:
+        task_name: Registered task name, one of BATCHABLE_TASKS
+        items: List of {"id": task id of the job, "args": task args}
+
+    Returns:
+        dict with counts of succeeded and failed jobs and the total time
+    """
+    if task_name not in BATCHABLE_TASKS:
+        raise Exception(f"Batch failed: {task_name} cannot be batched")
+    task = celery_app.tasks[task_name]
+    backend = celery_app.backend
+
+    start = time.perf_counter()
+    succeeded = failed = 0
+    for item in items:
+        state = backend.get_state(item["id"])
+        if state in states.READY_STATES:
+            # Finished before the batch was redelivered
+            continue
+        if state == states.STARTED:
+            # The process died running this job: don't let it take down the batch again
+            backend.store_result(item["id"], Exception("Worker lost while running the job"), states.FAILURE)
+            failed += 1
+            continue
+        backend.store_result(item["id"], {"pid": os.getpid(), "hostname": self.request.hostname}, states.STARTED)
+        # task_prerun/postrun don't fire for direct calls
+        mark_active(task_id=item["id"], task=task)
+        try:
+            result = task(*item["args"])
+        except Exception as e:
+            backend.store_result(item["id"], e, states.FAILURE, traceback=traceback.format_exc())
+            failed += 1
+        else:
+            backend.store_result(item["id"], result, states.SUCCESS)
+            succeeded += 1
+        finally:
+            clear_active(task_id=item["id"], task=task)
+    return {"task": task_name, "succeeded": succeeded, "failed": failed, "seconds": round(time.perf_counter() - start, 4)}
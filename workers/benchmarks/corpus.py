@@ -0,0 +1,244 @@
+"""
+Reproducible synthetic PDF corpora for the worker benchmarks.
+
+Documents are built directly with pikepdf and Pillow from a seeded RNG, so
+the same (kind, pages, seed) always produces the same bytes:
+
+  text     - several paragraphs of Helvetica text per page, with a text layer
+  image    - one photographic-style JPEG per page
+  scanned  - a 1-bit 200 dpi page image of rendered text, no text layer
+  table    - ruled grids with cell text, as pdfplumber finds them
+  mixed    - text, image, scanned and table pages in rotation
+
+Usage:
+    python -m workers.benchmarks.corpus --kind mixed --pages 500 --out /tmp/corpus
+"""
+import argparse
+import io
+import os
+import random
+import zlib
+
+import pikepdf
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+KINDS = ("text", "image", "scanned", "table", "mixed")
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+SCAN_DPI = 200
+# Distinct page images rendered per document; larger documents cycle through
+# them (each page still gets its own image object) to keep generation fast
+IMAGE_VARIANTS = 64
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip "
+    "ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse cillum fugiat nulla "
+    "pariatur excepteur sint occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim"
+).split()
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _text_content(rng):
+    lines = [b"BT /F1 11 Tf 14 TL 54 740 Td"]
+    for paragraph in range(rng.randint(3, 6)):
+        for _ in range(rng.randint(4, 9)):
+            lines.append(f"({_escape(_sentence(rng, 14))}) '".encode())
+        lines.append(b"T*")
+    lines.append(b"ET")
+    return b"\n".join(lines)
+
+
+def _table_content(rng):
+    rows, cols = rng.randint(8, 20), rng.randint(3, 6)
+    left, top, width, row_height = 54, 720, PAGE_WIDTH - 108, 24
+    col_width = width / cols
+    ops = [b"0.5 w"]
+    for r in range(rows + 1):
+        y = top - r * row_height
+        ops.append(f"{left} {y} m {left + width} {y} l S".encode())
+    for c in range(cols + 1):
+        x = left + c * col_width
+        ops.append(f"{x:.2f} {top} m {x:.2f} {top - rows * row_height} l S".encode())
+    ops.append(b"BT /F1 9 Tf")
+    for r in range(rows):
+        for c in range(cols):
+            cell = str(rng.randint(0, 99999)) if r and c else _sentence(rng, 2)
+            x = left + c * col_width + 4
+            y = top - (r + 1) * row_height + 8
+            ops.append(f"1 0 0 1 {x:.2f} {y} Tm ({_escape(cell)}) Tj".encode())
+    ops.append(b"ET")
+    return b"\n".join(ops)
+
+
+def _photo(rng, width=1200, height=900):
+    """A smooth, JPEG-friendly image with random shapes."""
+    image = Image.new("RGB", (width, height), tuple(rng.randint(0, 255) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(30):
+        x, y = rng.randint(-200, width), rng.randint(-200, height)
+        size = rng.randint(50, 500)
+        draw.ellipse((x, y, x + size, y + size), fill=tuple(rng.randint(0, 255) for _ in range(3)))
+    return image.filter(ImageFilter.GaussianBlur(6))
+
+
+def _scan(rng):
+    """A 1-bit page image of rendered text, slightly skewed like a scan."""
+    width, height = PAGE_WIDTH * SCAN_DPI // 72, PAGE_HEIGHT * SCAN_DPI // 72
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=28)
+    except TypeError:  # Pillow < 10.1
+        font = ImageFont.load_default()
+    y = 150
+    while y < height - 150:
+        draw.text((150, y), _sentence(rng, 12), fill=0, font=font)
+        y += 44
+    return image.rotate(rng.uniform(-1.0, 1.0), fillcolor=255).convert("1")
+
+
+def _encode_image(image):
+    """Return (stream data, image dictionary entries) for a page image."""
+    if image.mode == "1":
+        return zlib.compress(image.tobytes()), dict(
+            Width=image.width, Height=image.height, ColorSpace=pikepdf.Name.DeviceGray,
+            BitsPerComponent=1, Filter=pikepdf.Name.FlateDecode,
+        )
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue(), dict(
+        Width=image.width, Height=image.height, ColorSpace=pikepdf.Name.DeviceRGB,
+        BitsPerComponent=8, Filter=pikepdf.Name.DCTDecode,
+    )
+
+
+def _add_page(pdf, font, content, image=None):
+    resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+    if image is not None:
+        data, entries = image
+        resources.XObject = pikepdf.Dictionary(Im0=pikepdf.Stream(
+            pdf, data, Type=pikepdf.Name.XObject, Subtype=pikepdf.Name.Image, **entries
+        ))
+        width, height = entries["Width"], entries["Height"]
+        if entries["BitsPerComponent"] == 1:
+            box = (0, 0, PAGE_WIDTH, PAGE_HEIGHT)
+        else:
+            # Keep the aspect ratio inside 1in margins
+            scale = min((PAGE_WIDTH - 144) / width, (PAGE_HEIGHT - 144) / height)
+            w, h = width * scale, height * scale
+            box = ((PAGE_WIDTH - w) / 2, (PAGE_HEIGHT - h) / 2, w, h)
+        content = f"q {box[2]:.2f} 0 0 {box[3]:.2f} {box[0]:.2f} {box[1]:.2f} cm /Im0 Do Q\n".encode() + content
+    page = pikepdf.Dictionary(
+        Type=pikepdf.Name.Page,
+        MediaBox=[0, 0, PAGE_WIDTH, PAGE_HEIGHT],
+        Resources=resources,
+        Contents=pikepdf.Stream(pdf, content),
+    )
+    pdf.pages.append(pikepdf.Page(page))
+
+
+def build_pdf(kind, pages, output_path, seed=0):
+    """
+    Write a synthetic PDF of `pages` pages of the given kind to output_path.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown corpus kind: {kind}")
+    rng = random.Random(f"{kind}:{pages}:{seed}")
+    pdf = pikepdf.new()
+    font = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name.Helvetica,
+        Encoding=pikepdf.Name.WinAnsiEncoding,
+    ))
+    rotation = ("text", "image", "scanned", "table")
+    variants = {"image": ([], _photo), "scanned": ([], _scan)}
+
+    for index in range(pages):
+        page_kind = rotation[index % len(rotation)] if kind == "mixed" else kind
+        if page_kind == "text":
+            _add_page(pdf, font, _text_content(rng))
+        elif page_kind == "table":
+            _add_page(pdf, font, _table_content(rng))
+        else:
+            images, make = variants[page_kind]
+            if len(images) < IMAGE_VARIANTS:
+                images.append(_encode_image(make(rng)))
+                image = images[-1]
+            else:
+                image = images[index % IMAGE_VARIANTS]
+            _add_page(pdf, font, b"", image)
+
+    pdf.save(output_path, deterministic_id=True)
+    pdf.close()
+    return output_path
+
+
+def build_images(count, output_dir, seed=0):
+    """
+    Write `count` JPEG/PNG images (alternating) for images_to_pdf. Returns their paths.
+    """
+    rng = random.Random(f"images:{count}:{seed}")
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for index in range(count):
+        image = _photo(rng, 1600, 1200)
+        ext = "png" if index % 2 else "jpg"
+        path = os.path.join(output_dir, f"image_{index:04d}.{ext}")
+        if ext == "jpg":
+            image.save(path, quality=85)
+        else:
+            image.save(path)
+        paths.append(path)
+    return paths
+
+
+def corpus_path(kind, pages, cache_dir, seed=0):
+    """
+    Path of the (kind, pages, seed) document in cache_dir, generating it on first use.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{kind}-{pages}-{seed}.pdf")
+    if not os.path.exists(path):
+        tmp_path = path + ".tmp"
+        build_pdf(kind, pages, tmp_path, seed)
+        os.replace(tmp_path, path)
+    return path
+
+
+def images_path(count, cache_dir, seed=0):
+    """
+    Paths of `count` cached images for images_to_pdf, generating them on first use.
+    """
+    directory = os.path.join(cache_dir, f"images-{count}-{seed}")
+    if not os.path.isdir(directory):
+        tmp_dir = directory + ".tmp"
+        build_images(count, tmp_dir, seed)
+        os.replace(tmp_dir, directory)
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic PDF corpora")
+    parser.add_argument("--kind", choices=KINDS + ("all",), default="all")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark-corpus")
+    args = parser.parse_args()
+
+    kinds = KINDS if args.kind == "all" else (args.kind,)
+    for kind in kinds:
+        for pages in args.pages:
+            path = corpus_path(kind, pages, args.out, args.seed)
+            print(f"{path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+OCR accuracy and speed on a fixture set with known text.
+
+Builds one-page PDFs covering the cases OCR resolution and preprocessing
+matter for: scans at 150/200/300 DPI, skewed scans, and text-layer pages
+from 7 to 24 pt, each with its ground-truth text. Runs ocr_pdf (text
+output) on every fixture with the adaptive pipeline ("preprocess": true)
+and with the default fixed 300 DPI color rendering, and reports seconds
+per page and character accuracy (1 - edit distance / reference length)
+for both.
+
+Usage:
+    python -m workers.benchmarks.ocr_accuracy
+    python -m workers.benchmarks.ocr_accuracy --fixture-dir /tmp/ocr-fixtures --output ocr.json
+
+Needs pdftoppm and tesseract. Exits with status 1 when the adaptive
+pipeline is less accurate than fixed rendering overall.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import pikepdf
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from . import corpus
+
+# name -> (kind, text size in points, scan DPI, skew degrees)
+FIXTURES = {
+    "scan-150dpi-11pt": ("scan", 11, 150, 0.0),
+    "scan-200dpi-11pt": ("scan", 11, 200, 0.0),
+    "scan-300dpi-11pt": ("scan", 11, 300, 0.0),
+    "scan-200dpi-8pt": ("scan", 8, 200, 0.0),
+    "scan-300dpi-18pt": ("scan", 18, 300, 0.0),
+    "scan-200dpi-11pt-skew1.5": ("scan", 11, 200, 1.5),
+    "scan-300dpi-11pt-skew-3": ("scan", 11, 300, -3.0),
+    "text-7pt": ("text", 7, None, 0.0),
+    "text-10pt": ("text", 10, None, 0.0),
+    "text-14pt": ("text", 14, None, 0.0),
+    "text-24pt": ("text", 24, None, 0.0),
+}
+
+MODES = {
+    "adaptive": {"preprocess": True},
+    "fixed": {},
+}
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+
+def _font(size_px):
+    try:
+        return ImageFont.truetype(FONT_PATH, size_px)
+    except OSError:
+        return ImageFont.load_default(size=size_px)
+
+
+def _lines(rng, size_pt):
+    # Fill a Letter page with 1in margins
+    words_per_line = max(2, int(6.5 * 72 / (size_pt * 4.0)))
+    line_count = int(9 * 72 / (size_pt * 1.4))
+    return [corpus._sentence(rng, words_per_line) for _ in range(line_count)]
+
+
+def _scan_page(lines, size_pt, dpi, skew):
+    width, height = corpus.PAGE_WIDTH * dpi // 72, corpus.PAGE_HEIGHT * dpi // 72
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    font = _font(int(size_pt * dpi / 72))
+    for index, line in enumerate(lines):
+        draw.text((dpi, dpi + index * size_pt * 1.4 * dpi / 72), line, fill=0, font=font)
+    # Soft edges and paper tone, like a scanner's output
+    image = image.rotate(skew, resample=Image.Resampling.BICUBIC, fillcolor=255).filter(ImageFilter.GaussianBlur(0.6))
+    return image.point(lambda value: 40 + value * 200 // 255).convert("RGB")
+
+
+def _text_content(lines, size_pt):
+    ops = [f"BT /F1 {size_pt} Tf {size_pt * 1.4:.2f} TL 72 {corpus.PAGE_HEIGHT - 72 - size_pt} Td".encode()]
+    ops += [f"({corpus._escape(line)}) Tj T*".encode() for line in lines]
+    ops.append(b"ET")
+    return b"\n".join(ops)
+
+
+def build_fixtures(fixture_dir, seed=0):
+    """
+    Write every fixture as <name>.pdf with its text in <name>.txt, once.
+
+    Returns:
+        {name: (pdf path, reference text)}
+    """
+    os.makedirs(fixture_dir, exist_ok=True)
+    fixtures = {}
+    for name, (kind, size_pt, dpi, skew) in FIXTURES.items():
+        pdf_path = os.path.join(fixture_dir, f"{name}.pdf")
+        text_path = os.path.join(fixture_dir, f"{name}.txt")
+        if not (os.path.exists(pdf_path) and os.path.exists(text_path)):
+            lines = _lines(random.Random(f"{name}:{seed}"), size_pt)
+            pdf = pikepdf.new()
+            font = pdf.make_indirect(pikepdf.Dictionary(
+                Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name.Helvetica,
+                Encoding=pikepdf.Name.WinAnsiEncoding,
+            ))
+            if kind == "scan":
+                scan = corpus._encode_image(_scan_page(lines, size_pt, dpi, skew))
+                corpus._add_page(pdf, font, b"", scan)
+                # _add_page fits photos inside margins; a scan covers the page
+                page = pdf.pages[-1]
+                page.Contents = pikepdf.Stream(
+                    pdf, f"q {corpus.PAGE_WIDTH} 0 0 {corpus.PAGE_HEIGHT} 0 0 cm /Im0 Do Q".encode()
+                )
+            else:
+                corpus._add_page(pdf, font, _text_content(lines, size_pt))
+            pdf.save(pdf_path, deterministic_id=True)
+            with open(text_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines))
+        with open(text_path, encoding="utf-8") as f:
+            fixtures[name] = (pdf_path, f.read())
+    return fixtures
+
+
+def _normalize(text):
+    return " ".join(text.split())
+
+
+def edit_distance(a, b):
+    """
+    Levenshtein distance between two strings, a row of the table at a time.
+
+    Within a row, insertions chain left to right: cell j is the minimum over
+    k <= j of candidate[k] + (j - k), which is a running minimum.
+    """
+    import numpy as np
+
+    b_codes = np.frombuffer(b.encode("utf-32-le"), dtype=np.uint32)
+    steps = np.arange(len(b) + 1)
+    previous = steps.copy()
+    for i, char in enumerate(a, start=1):
+        candidate = np.empty_like(previous)
+        candidate[0] = i
+        candidate[1:] = np.minimum(previous[1:] + 1, previous[:-1] + (b_codes != ord(char)))
+        previous = np.minimum.accumulate(candidate - steps) + steps
+    return int(previous[-1])
+
+
+def accuracy(reference, recognized):
+    """Character accuracy of recognized text, ignoring whitespace differences."""
+    reference, recognized = _normalize(reference), _normalize(recognized)
+    if not reference:
+        return 1.0 if not recognized else 0.0
+    return max(0.0, 1 - edit_distance(reference, recognized) / len(reference))
+
+
+def run(fixtures, modes=MODES):
+    """
+    OCR every fixture in every mode.
+
+    Returns:
+        {fixture: {mode: {"seconds": ..., "accuracy": ...}}}
+    """
+    from ..ocr_worker import ocr_pdf
+
+    results = {}
+    for name, (pdf_path, reference) in fixtures.items():
+        results[name] = {}
+        for mode, params in modes.items():
+            work_dir = tempfile.mkdtemp(prefix="pdfsimple-ocr-")
+            try:
+                input_path = shutil.copy(pdf_path, os.path.join(work_dir, "input.pdf"))
+                start = time.perf_counter()
+                result = ocr_pdf(f"ocr-accuracy-{mode}", input_path, dict(params, output_format="text"))
+                seconds = time.perf_counter() - start
+                with open(result["file_path"], encoding="utf-8") as f:
+                    recognized = f.read()
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            results[name][mode] = {"seconds": round(seconds, 3), "accuracy": round(accuracy(reference, recognized), 4)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure OCR accuracy and speed on known-text fixtures")
+    parser.add_argument("--fixture-dir", default=os.path.join(tempfile.gettempdir(), "pdfsimple-ocr-fixtures"))
+    parser.add_argument("--fixture", nargs="+", help="Only run these fixtures")
+    parser.add_argument("--output", help="Also write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    missing = [tool for tool in ("pdftoppm", "tesseract") if not shutil.which(tool)]
+    if missing:
+        print(f"skipped: missing {', '.join(missing)}")
+        return 0
+
+    fixtures = build_fixtures(args.fixture_dir)
+    if args.fixture:
+        fixtures = {name: fixture for name, fixture in fixtures.items() if name in args.fixture}
+    results = run(fixtures)
+
+    print(f"{'fixture':<28}" + "".join(f"{mode + ' s/page':>16}{mode + ' acc':>14}" for mode in MODES))
+    for name, by_mode in results.items():
+        print(f"{name:<28}" + "".join(
+            f"{by_mode[mode]['seconds']:>16.3f}{by_mode[mode]['accuracy']:>14.4f}" for mode in MODES
+        ))
+    totals = {
+        mode: (sum(r[mode]["seconds"] for r in results.values()),
+               sum(r[mode]["accuracy"] for r in results.values()) / max(1, len(results)))
+        for mode in MODES
+    }
+    print(f"{'total / mean':<28}" + "".join(f"{totals[mode][0]:>16.3f}{totals[mode][1]:>14.4f}" for mode in MODES))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 1 if totals["adaptive"][1] < totals["fixed"][1] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Per-worker benchmark suite.
+
+Runs each task function directly (no broker, no Docker) against the
+synthetic corpora from corpus.py and records wall time, pages per second,
+peak RSS and output size. Each measurement runs in a fresh child process so
+peak RSS is per task. Results can be saved as a JSON baseline and later runs
+compared against it with per-metric regression thresholds.
+
+Timings only compare on the same hardware, so no baseline is committed:
+record one on the machine that will run the comparison (it is written to
+workers/benchmarks/baseline.json, which git ignores, with that machine's
+spec). Against a baseline from a different machine only output size is
+compared.
+
+Usage:
+    python -m workers.benchmarks.run --suite smoke
+    python -m workers.benchmarks.run --suite standard --case merge_pdfs ocr_pdf --repeat 3
+    python -m workers.benchmarks.run --baseline workers/benchmarks/baseline.json --update-baseline
+
+Exits with status 1 when a metric regresses past its threshold.
+"""
+import argparse
+import glob
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from collections import namedtuple
+
+import pikepdf
+
+from . import corpus
+from ..instrumentation import _peak_rss, _reset_peak_rss
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_CORPUS_DIR = os.environ.get(
+    "BENCHMARK_CORPUS_DIR", os.path.join(tempfile.gettempdir(), "pdfsimple-benchmark-corpus")
+)
+
+SUITES = {
+    "smoke": (5,),
+    "standard": (1, 50, 500),
+    "full": (1, 50, 500, 2000),
+}
+
+# Relative increase over the baseline that counts as a regression
+DEFAULT_THRESHOLDS = {
+    "wall_seconds": 0.25,
+    "peak_rss_bytes": 0.25,
+    "output_bytes": 0.10,
+}
+# Wall-time differences below this are treated as noise
+MIN_WALL_DELTA = 0.05
+# Metrics that don't depend on the machine's speed or core count
+PORTABLE_METRICS = ("output_bytes",)
+
+# task: "module:function" in the workers package
+# kind: corpus kind, or "images" for image inputs
+# inputs: "pdf", "pdf_pair" (merge) or "encrypted" (unlock)
+# requires: executables the task shells out to; the case is skipped without them
+# max_pages: largest document the case runs on (slow raster tools)
+Case = namedtuple("Case", "name task kind params inputs requires max_pages")
+
+CASES = [
+    Case("merge_pdfs", "merge_worker:merge_pdfs", "text", None, "pdf_pair", (), None),
+    Case("split_pdf", "split_worker:split_pdf", "text", {}, "pdf", (), None),
+    Case("compress_pdf", "compress_worker:compress_pdf", "mixed", {"level": "medium"}, "pdf", ("gs",), None),
+    Case("convert_file", "convert_worker:convert_file", "mixed", {"target_format": "jpg"}, "pdf",
+         ("pdftoppm",), 500),
+    Case("ocr_pdf", "ocr_worker:ocr_pdf", "scanned", {"output_format": "pdf"}, "pdf",
+         ("pdftoppm", "tesseract"), 50),
+    Case("pdf_to_pptx", "pdf_to_pptx_worker:pdf_to_pptx", "mixed", {}, "pdf", ("pdftoppm",), 500),
+    Case("pdf_to_xlsx", "pdf_to_xlsx_worker:pdf_to_xlsx", "table", {}, "pdf", (), None),
+    Case("pdf_to_html", "pdf_to_html_worker:pdf_to_html", "text", {"mode": "text"}, "pdf", (), None),
+    Case("images_to_pdf", "images_to_pdf_worker:images_to_pdf", "images", {}, "images", (), 500),
+    Case("add_watermark", "watermark_worker:add_watermark", "mixed", {"text": "CONFIDENTIAL"}, "pdf",
+         ("pdftoppm",), 500),
+    Case("add_page_numbers", "page_numbers_worker:add_page_numbers", "mixed", {}, "pdf", ("pdftoppm",), 500),
+    Case("rotate_pages", "rotate_pages_worker:rotate_pages", "text", {"angle": 90}, "pdf", (), None),
+    Case("edit_metadata", "metadata_worker:edit_metadata", "text", {"title": "Benchmark"}, "pdf", (), None),
+    Case("protect_pdf", "protect_pdf_worker:protect_pdf", "text", {"password": "bench"}, "pdf", (), None),
+    Case("unlock_pdf", "unlock_pdf_worker:unlock_pdf", "text", {"password": "bench"}, "encrypted", (), None),
+]
+
+
+def _load_task(spec):
+    module, name = spec.split(":")
+    return getattr(importlib.import_module(f"workers.{module}"), name)
+
+
+def _prepare_inputs(case, pages, work_dir, corpus_dir):
+    """Copy the case's inputs into work_dir (tasks write their output next to the input)."""
+    if case.inputs == "images":
+        paths = []
+        for path in corpus.images_path(pages, corpus_dir):
+            paths.append(shutil.copy(path, work_dir))
+        return paths
+
+    source = corpus.corpus_path(case.kind, pages, corpus_dir)
+    input_path = os.path.join(work_dir, "input.pdf")
+    if case.inputs == "encrypted":
+        with pikepdf.open(source) as pdf:
+            pdf.save(input_path, encryption=pikepdf.Encryption(user="bench", owner="bench"))
+    else:
+        shutil.copy(source, input_path)
+    if case.inputs == "pdf_pair":
+        second = os.path.join(work_dir, "input2.pdf")
+        shutil.copy(source, second)
+        return [input_path, second]
+    return input_path
+
+
+def _output_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(p) for p in glob.glob(os.path.join(path, "**"), recursive=True)
+                   if os.path.isfile(p))
+    return os.path.getsize(path)
+
+
+def _measure(case, inputs, pages, conn):
+    """Child process: run the task once and send back its metrics."""
+    job_id = f"bench-{uuid.uuid4().hex}"
+    try:
+        task = _load_task(case.task)
+        args = (job_id, inputs) if case.params is None else (job_id, inputs, dict(case.params))
+
+        _reset_peak_rss()
+        start = time.perf_counter()
+        result = task(*args)
+        wall = time.perf_counter() - start
+
+        output = result.get("file_path") if isinstance(result, dict) else result
+        # Page-parallel tasks do their work in child processes
+        children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+        metrics = {
+            "wall_seconds": wall,
+            "pages_per_second": pages / wall if wall > 0 else None,
+            "peak_rss_bytes": max(_peak_rss(), children_rss),
+            "output_bytes": _output_size(output) if output and os.path.exists(output) else 0,
+        }
+        if isinstance(result, dict) and "timings" in result:
+            metrics["stages"] = result["timings"]["stages"]
+        conn.send(metrics)
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+        # merge/split/convert write under /data/{job_id}*
+        for path in glob.glob(f"/data/{job_id}*"):
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+def run_case(case, pages, corpus_dir, repeat=1):
+    """
+    Benchmark one case on a `pages`-page document (or `pages` images).
+
+    Returns:
+        dict of metrics (medians over `repeat` runs), or {"error": ...}
+    """
+    context = multiprocessing.get_context("fork")
+    runs = []
+    for _ in range(repeat):
+        work_dir = tempfile.mkdtemp(prefix="pdfsimple-bench-")
+        try:
+            inputs = _prepare_inputs(case, pages, work_dir, corpus_dir)
+            parent, child = context.Pipe(duplex=False)
+            process = context.Process(target=_measure, args=(case, inputs, pages, child))
+            process.start()
+            child.close()
+            try:
+                metrics = parent.recv()
+            except EOFError:
+                metrics = None
+            process.join()
+            if metrics is None:
+                metrics = {"error": f"benchmark process died with exit code {process.exitcode}"}
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if "error" in metrics:
+            return metrics
+        runs.append(metrics)
+
+    summary = {"pages": pages, "runs": repeat}
+    for key in ("wall_seconds", "pages_per_second", "peak_rss_bytes", "output_bytes"):
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = round(statistics.median(values), 4) if values else None
+    if "stages" in runs[0]:
+        summary["stages"] = {
+            name: statistics.median(run["stages"].get(name, 0.0) for run in runs)
+            for name in runs[0]["stages"]
+        }
+    return summary
+
+
+def _machine():
+    return {"platform": platform.platform(), "cpus": os.cpu_count(), "python": platform.python_version()}
+
+
+def compare(results, baseline, thresholds=None):
+    """
+    Compare results against a baseline.
+
+    Only PORTABLE_METRICS are compared when the baseline was recorded on a
+    different machine.
+
+    Returns:
+        List of human-readable regression descriptions (empty if none)
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get("thresholds", {}), **(thresholds or {})}
+    if baseline.get("machine") != _machine():
+        thresholds = {metric: value for metric, value in thresholds.items() if metric in PORTABLE_METRICS}
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if not previous or "error" in current:
+            continue
+        for metric, threshold in thresholds.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            if metric == "wall_seconds" and new - old < MIN_WALL_DELTA:
+                continue
+            if new > old * (1 + threshold):
+                regressions.append(
+                    f"{key}: {metric} {old:.4g} -> {new:.4g} (+{(new / old - 1) * 100:.0f}%, limit {threshold * 100:.0f}%)"
+                )
+    return regressions
+
+
+def _format_row(key, metrics):
+    if "skipped" in metrics:
+        return f"{key:<32} skipped: {metrics['skipped']}"
+    if "error" in metrics:
+        return f"{key:<32} error: {metrics['error']}"
+    rate = metrics["pages_per_second"]
+    return (
+        f"{key:<32} {metrics['wall_seconds']:>9.3f}s {rate or 0:>9.1f} p/s "
+        f"{metrics['peak_rss_bytes'] / 1048576:>8.1f} MB {metrics['output_bytes'] / 1024:>10.1f} KB"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PDF worker tasks")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="smoke")
+    parser.add_argument("--pages", type=int, nargs="+", help="Override the suite's document sizes")
+    parser.add_argument("--case", nargs="+", help="Only run these cases")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per measurement (medians are reported)")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Write results to the baseline file")
+    parser.add_argument("--output", help="Also write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    sizes = args.pages or SUITES[args.suite]
+    cases = [case for case in CASES if not args.case or case.name in args.case]
+    results = {}
+    for case in cases:
+        missing = [tool for tool in case.requires if not shutil.which(tool)]
+        for pages in sizes:
+            key = f"{case.name}/{case.kind}-{pages}"
+            if missing:
+                results[key] = {"skipped": f"missing {', '.join(missing)}"}
+            elif case.max_pages and pages > case.max_pages:
+                continue
+            else:
+                results[key] = run_case(case, pages, args.corpus_dir, args.repeat)
+            print(_format_row(key, results[key]), flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    measured = {key: value for key, value in results.items() if "skipped" not in value and "error" not in value}
+    if args.update_baseline:
+        baseline = {"thresholds": DEFAULT_THRESHOLDS, "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline["machine"] = _machine()
+        baseline["results"].update(measured)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != _machine():
+            print(f"Baseline was recorded on {baseline.get('machine')}: comparing output size only")
+        regressions = compare(measured, baseline)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 1 if any("error" in value for value in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
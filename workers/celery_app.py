@@ -1,9 +1,27 @@
+import importlib
+import os
+import time
 from celery import Celery
+from celery.signals import (
+    before_task_publish, task_prerun, task_postrun, worker_init, worker_process_shutdown
+)
+
+from .instrumentation import start_metrics_server, mark_process_dead
+from .memory import MB, SOFT_LIMIT
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+
+# Redis keys marking tasks currently executing, read by the backend's queue metrics
+ACTIVE_KEY_PREFIX = "pdfsimple:active:"
+ACTIVE_KEY_TTL = 6 * 3600
+# Per-user sets of released task ids kept by the API's fair-share dispatcher
+# (keep in sync with backend/fair_share.py)
+FAIR_RUNNING_PREFIX = "pdfsimple:fair:running:"
 
 celery_app = Celery(
     "pdfsimple",
-    broker="redis://redis:6379/0",
-    backend="redis://redis:6379/0",
+    broker=REDIS_URL,
+    backend=REDIS_URL,
     include=[
         "workers.merge_worker",
         "workers.split_worker",
@@ -20,8 +38,68 @@ celery_app = Celery(
         "workers.metadata_worker",
         "workers.protect_pdf_worker",
         "workers.unlock_pdf_worker",
+        "workers.pipeline_worker",
+        "workers.batch_worker",
     ]
 )
 
-# Auto-discover tasks (optional if we use include)
-celery_app.autodiscover_tasks(["workers"], force=True)
+# Reserve one task per process at a time: prefetched messages are out of the
+# fair-share dispatcher's reach, so a deep prefetch would let one user's batch
+# jump ahead again
+celery_app.conf.worker_prefetch_multiplier = int(os.environ.get("WORKER_PREFETCH_MULTIPLIER", 1))
+
+# Replace a pool process once a task leaves it above this resident size (MB),
+# giving back memory the allocator kept after a large render. Checked after
+# each task, so running tasks are never interrupted; 0 disables recycling
+MAX_MEMORY_PER_CHILD = int(os.environ.get("WORKER_MAX_MEMORY_PER_CHILD_MB", SOFT_LIMIT // MB))
+if MAX_MEMORY_PER_CHILD:
+    celery_app.conf.worker_max_memory_per_child = MAX_MEMORY_PER_CHILD * 1024  # KiB
+
+# Worker modules import their heavy libraries (pikepdf, Pillow, pdfplumber,
+# python-pptx, openpyxl...) on first use, so startup only registers tasks.
+# Deployments that prefer warm prefork children can list modules in
+# WORKER_PRELOAD to import them once in the parent before the pool forks.
+WORKER_PRELOAD = [m.strip() for m in os.environ.get("WORKER_PRELOAD", "").split(",") if m.strip()]
+
+
+@before_task_publish.connect
+def stamp_sent_at(headers=None, **kwargs):
+    # Lets queue metrics compute the age of the oldest waiting message
+    if headers is not None:
+        headers.setdefault("sent_at", time.time())
+
+
+@task_prerun.connect
+def mark_active(task_id=None, task=None, **kwargs):
+    try:
+        celery_app.backend.client.set(ACTIVE_KEY_PREFIX + task_id, task.name, ex=ACTIVE_KEY_TTL)
+    except Exception:
+        pass  # Metrics must never fail a task
+
+
+@task_postrun.connect
+def clear_active(task_id=None, task=None, **kwargs):
+    try:
+        client = celery_app.backend.client
+        client.delete(ACTIVE_KEY_PREFIX + task_id)
+        user = getattr(task.request, "fair_user", None)
+        if user:
+            client.srem(FAIR_RUNNING_PREFIX + user, task_id)
+    except Exception:
+        pass
+
+
+@worker_init.connect
+def serve_metrics(**kwargs):
+    start_metrics_server()
+
+
+@worker_init.connect
+def preload_modules(**kwargs):
+    for module in WORKER_PRELOAD:
+        importlib.import_module(module)
+
+
+@worker_process_shutdown.connect
+def cleanup_metrics(pid=None, **kwargs):
+    mark_process_dead(pid or os.getpid())
@@ -1,9 +1,10 @@
 import os
 import subprocess
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .storage import intermediate, with_storage
 
-@celery_app.task(name="compress_pdf")
-def compress_pdf(job_id: str, input_path: str, params: dict):
+def compress(job_id: str, input_path: str, params: dict):
     """
     Compress PDF using Ghostscript.
     Params:
@@ -63,8 +64,9 @@ def compress_pdf(job_id: str, input_path: str, params: dict):
 
             
             for idx, setting in enumerate(levels_to_try):
-                # We use a temporary output for each attempt
-                temp_output = f"/data/{job_id}_try_{idx}.pdf"
+                # We use a temporary output for each attempt; the ones not
+                # returned are removed when the task finishes
+                temp_output = intermediate(f"/data/{job_id}_try_{idx}.pdf")
                 
                 cmd = [
                     "gs",
@@ -77,7 +79,8 @@ def compress_pdf(job_id: str, input_path: str, params: dict):
                     f"-sOutputFile={temp_output}",
                     input_path
                 ]
-                subprocess.run(cmd, check=True)
+                with stage("subprocess"):
+                    subprocess.run(cmd, check=True)
                 
                 size = os.path.getsize(temp_output)
                 candidates.append((size, temp_output))
@@ -94,7 +97,7 @@ def compress_pdf(job_id: str, input_path: str, params: dict):
                 
                 if best_candidate[0] > target_size:
                      # FORCE MODE: Aggressive downsampling
-                     force_output = f"/data/{job_id}_force.pdf"
+                     force_output = intermediate(f"/data/{job_id}_force.pdf")
                      cmd_force = [
                         "gs",
                         "-sDEVICE=pdfwrite",
@@ -109,7 +112,8 @@ def compress_pdf(job_id: str, input_path: str, params: dict):
                         input_path
                      ]
                      try:
-                        subprocess.run(cmd_force, check=True)
+                        with stage("subprocess"):
+                            subprocess.run(cmd_force, check=True)
                         if os.path.getsize(force_output) < best_candidate[0]:
                             current_best_output = force_output
                      except:
@@ -117,18 +121,20 @@ def compress_pdf(job_id: str, input_path: str, params: dict):
 
                 # NUCLEAR MODE: Rasterize if still failing
                 if os.path.getsize(current_best_output) > target_size:
-                    nuclear_output = f"/data/{job_id}_nuclear.pdf"
+                    nuclear_output = intermediate(f"/data/{job_id}_nuclear.pdf")
                     try:
-                        img_dir = f"/data/{job_id}_nuclear_imgs"
+                        img_dir = intermediate(f"/data/{job_id}_nuclear_imgs")
                         os.makedirs(img_dir, exist_ok=True)
-                        subprocess.run([
-                            "pdftoppm", "-jpeg", "-r", "72", input_path, 
-                            os.path.join(img_dir, "page")
-                        ], check=True)
-                        subprocess.run(
-                            f"convert {img_dir}/page-*.jpg -quality 30 -compress jpeg {nuclear_output}", 
-                            shell=True, check=True
-                        )
+                        with stage("render"):
+                            subprocess.run([
+                                "pdftoppm", "-jpeg", "-r", "72", input_path, 
+                                os.path.join(img_dir, "page")
+                            ], check=True)
+                        with stage("encode"):
+                            subprocess.run(
+                                f"convert {img_dir}/page-*.jpg -quality 30 -compress jpeg {nuclear_output}", 
+                                shell=True, check=True
+                            )
                         if os.path.getsize(nuclear_output) < os.path.getsize(current_best_output):
                             current_best_output = nuclear_output
                     except:
@@ -157,3 +163,13 @@ def compress_pdf(job_id: str, input_path: str, params: dict):
         raise Exception(f"Ghostscript failed: {e}")
     except Exception as exc:
         raise exc
+
+
+@celery_app.task(name="compress_pdf")
+@with_storage
+@instrument("compress_pdf")
+def compress_pdf(job_id: str, input_path: str, params: dict):
+    """
+    Compress PDF using Ghostscript (see compress for params).
+    """
+    return compress(job_id, input_path, params)
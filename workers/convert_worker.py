@@ -1,8 +1,12 @@
 import os
 import subprocess
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .storage import with_storage
 
 @celery_app.task(name="convert_file")
+@with_storage
+@instrument("convert_file")
 def convert_file(job_id: str, input_path: str, params: dict):
     """
     Convert file format.
@@ -25,7 +29,8 @@ def convert_file(job_id: str, input_path: str, params: dict):
         if target_format == "pdf" and ext in ["jpg", "jpeg", "png"]:
             output_path = os.path.join(output_dir, "converted.pdf")
             # Use ImageMagick: convert input.jpg output.pdf
-            subprocess.run(["convert", input_path, output_path], check=True)
+            with stage("subprocess"):
+                subprocess.run(["convert", input_path, output_path], check=True)
             return output_path
             
         # 2. PDF -> Image (JPG)
@@ -33,41 +38,40 @@ def convert_file(job_id: str, input_path: str, params: dict):
             # Use pdftoppm (poppler-utils) for high-quality conversion
             # pdftoppm -jpeg -r 150 input.pdf output_dir/page
             try:
-                subprocess.run([
-                    "pdftoppm",
-                    "-jpeg",
-                    "-r", "150",
-                    input_path,
-                    os.path.join(output_dir, "page")
-                ], check=True)
+                with stage("subprocess"):
+                    subprocess.run([
+                        "pdftoppm",
+                        "-jpeg",
+                        "-r", "150",
+                        input_path,
+                        os.path.join(output_dir, "page")
+                    ], check=True)
             except FileNotFoundError:
                 # Fallback to ImageMagick if pdftoppm not found (though it should be)
-                subprocess.run([
-                    "convert",
-                    "-density", "150",
-                    input_path,
-                    "-quality", "90",
-                    os.path.join(output_dir, "page-%d.jpg")
-                ], check=True)
+                with stage("subprocess"):
+                    subprocess.run([
+                        "convert",
+                        "-density", "150",
+                        input_path,
+                        "-quality", "90",
+                        os.path.join(output_dir, "page-%d.jpg")
+                    ], check=True)
 
-            # Zip the resulting images
-            import shutil
-            # make_archive expects invalid extension, so we give base name
-            zip_base_name = f"/data/{job_id}_images"
-            shutil.make_archive(zip_base_name, 'zip', output_dir)
-            return f"{zip_base_name}.zip"
+            # The page images are served as a zip built on the fly by the API
+            return output_dir
 
         # 3. Office -> PDF (Word/Excel -> PDF)
         if target_format == "pdf" and ext in ["docx", "doc", "xlsx", "pptx"]:
             # LibreOffice conversion
             # Note: soffice must be on PATH
-            subprocess.run([
-                "soffice",
-                "--headless",
-                "--convert-to", "pdf",
-                input_path,
-                "--outdir", output_dir
-            ], check=True)
+            with stage("subprocess"):
+                subprocess.run([
+                    "soffice",
+                    "--headless",
+                    "--convert-to", "pdf",
+                    input_path,
+                    "--outdir", output_dir
+                ], check=True)
             
             # Soffice uses the same basename. Find the resulting PDF.
             # It might handle spaces differently, so finding the only PDF in dir is safer or predicting name.
@@ -87,14 +91,15 @@ def convert_file(job_id: str, input_path: str, params: dict):
 
         # 4. PDF -> Word (docx)
         elif target_format == "docx" and ext == "pdf":
-            subprocess.run([
-                "soffice",
-                "--headless",
-                "--infilter=writer_pdf_import",
-                "--convert-to", "docx",
-                input_path,
-                "--outdir", output_dir
-            ], check=True)
+            with stage("subprocess"):
+                subprocess.run([
+                    "soffice",
+                    "--headless",
+                    "--infilter=writer_pdf_import",
+                    "--convert-to", "docx",
+                    input_path,
+                    "--outdir", output_dir
+                ], check=True)
             
             filename = os.path.basename(input_path)
             base = os.path.splitext(filename)[0]
@@ -3,23 +3,505 @@ Worker to convert images to PDF
 Supports PNG, TIFF, GIF, and JPG formats
 """
 from .celery_app import celery_app
+from .instrumentation import instrument
+from .storage import with_storage
+from .pdf_writer import StreamingPdfWriter, placement_matrix
 import os
-from PIL import Image
-import io
+import math
+import struct
+import zlib
+from contextlib import contextmanager
+
+
+# Page sizes in points (portrait)
+PAGE_SIZES = {
+    "A3": (842, 1191),
+    "A4": (595, 842),
+    "A5": (420, 595),
+    "LETTER": (612, 792),
+    "LEGAL": (612, 1008),
+}
+
+# EXIF orientation -> clockwise rotation needed to display the image upright.
+# Mirrored orientations (2, 4, 5, 7) are not listed and go through the decode path.
+EXIF_ROTATIONS = {1: 0, 3: 180, 6: 90, 8: 270}
+
+# EXIF orientation -> PIL Image.Transpose applied to decoded pixels
+EXIF_TRANSPOSE = {
+    2: "FLIP_LEFT_RIGHT",
+    3: "ROTATE_180",
+    4: "FLIP_TOP_BOTTOM",
+    5: "TRANSPOSE",
+    6: "ROTATE_270",
+    7: "TRANSVERSE",
+    8: "ROTATE_90",
+}
+
+JPEG_COLORSPACES = {"L": "/DeviceGray", "RGB": "/DeviceRGB", "CMYK": "/DeviceCMYK"}
+
+READ_CHUNK = 1024 * 1024
+
+# Decoded images above this many pixels are downsampled before embedding
+DEFAULT_MAX_PIXELS = int(os.environ.get("IMAGES_MAX_PIXELS", 40_000_000))
+
+# Images that have to be decoded in one piece are refused above this size
+# (by default the threshold Pillow uses for decompression bombs). CCITT
+# TIFFs and JPEG/PNG/JPEG 2000 files embedded as they are never decode,
+# and JPEGs and uncompressed strip-based TIFFs are downsampled without a
+# full decode; every other image is subject to this limit.
+DEFAULT_MAX_DECODE_PIXELS = int(os.environ.get("IMAGES_MAX_DECODE_PIXELS", 2 * 89_478_485))
+
+# Rows decoded at a time when downsampling strip by strip
+BAND_ROWS = 256
+
+# TIFF tags
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_COMPRESSION = 259
+TIFF_PHOTOMETRIC = 262
+TIFF_FILL_ORDER = 266
+TIFF_STRIP_OFFSETS = 273
+TIFF_ROWS_PER_STRIP = 278
+TIFF_STRIP_BYTE_COUNTS = 279
+TIFF_PLANAR_CONFIG = 284
+TIFF_T4_OPTIONS = 292
+TIFF_TILE_WIDTH = 322
+
+
+def _iter_file(path, spans=None):
+    """
+    Yield the bytes of a file, or of the given (offset, length) spans, in chunks.
+    """
+    with open(path, "rb") as f:
+        if spans is None:
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    return
+                yield chunk
+        for offset, length in spans:
+            f.seek(offset)
+            while length > 0:
+                chunk = f.read(min(READ_CHUNK, length))
+                if not chunk:
+                    raise ValueError("Unexpected end of file")
+                length -= len(chunk)
+                yield chunk
+
+
+def _png_info(path):
+    """
+    Read PNG chunk headers (not the pixel data).
+
+    Returns a dict describing the image when its IDAT data can be embedded
+    directly as a Flate stream, or None if it has to be decoded (alpha,
+    transparency or interlacing).
+    """
+    info = {"spans": []}
+    with open(path, "rb") as f:
+        if f.read(8) != b"\x89PNG\r\n\x1a\n":
+            return None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            length, chunk_type = struct.unpack(">I4s", header)
+            if chunk_type == b"IHDR":
+                data = f.read(length)
+                width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", data)
+                if color_type not in (0, 2, 3) or interlace:
+                    return None
+                info.update(width=width, height=height, bit_depth=bit_depth, color_type=color_type)
+                f.seek(4, os.SEEK_CUR)
+            elif chunk_type == b"PLTE":
+                info["palette"] = f.read(length)
+                f.seek(4, os.SEEK_CUR)
+            elif chunk_type == b"tRNS":
+                return None
+            elif chunk_type == b"IDAT":
+                info["spans"].append((f.tell(), length))
+                f.seek(length + 4, os.SEEK_CUR)
+            elif chunk_type == b"IEND":
+                break
+            else:
+                f.seek(length + 4, os.SEEK_CUR)
+    if "width" not in info or not info["spans"]:
+        return None
+    if info["color_type"] == 3 and "palette" not in info:
+        return None
+    return info
+
+
+def _embed_png(writer, path, info):
+    """Embed PNG IDAT data as a Flate stream with a PNG predictor."""
+    color_type = info["color_type"]
+    colors = 3 if color_type == 2 else 1
+    if color_type == 3:
+        palette = info["palette"]
+        colorspace = f"[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]"
+    elif color_type == 2:
+        colorspace = "/DeviceRGB"
+    else:
+        colorspace = "/DeviceGray"
+    
+    dictionary = (
+        f"/Type /XObject /Subtype /Image /Width {info['width']} /Height {info['height']} "
+        f"/ColorSpace {colorspace} /BitsPerComponent {info['bit_depth']} /Filter /FlateDecode "
+        f"/DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent {info['bit_depth']} "
+        f"/Columns {info['width']} >>"
+    )
+    length = sum(span_length for _, span_length in info["spans"])
+    return writer.add_stream(dictionary, _iter_file(path, info["spans"]), length)
+
+
+def _embed_encoded(writer, path, img):
+    """Embed JPEG / JPEG2000 file bytes as DCT / JPX streams."""
+    if img.format == "JPEG2000":
+        dictionary = f"/Type /XObject /Subtype /Image /Width {img.width} /Height {img.height} /Filter /JPXDecode"
+    else:
+        dictionary = (
+            f"/Type /XObject /Subtype /Image /Width {img.width} /Height {img.height} "
+            f"/ColorSpace {JPEG_COLORSPACES[img.mode]} /BitsPerComponent 8 /Filter /DCTDecode"
+        )
+        if img.mode == "CMYK" and "adobe" in img.info:
+            # Adobe CMYK JPEGs are stored inverted
+            dictionary += " /Decode [1 0 1 0 1 0 1 0]"
+    return writer.add_stream(dictionary, _iter_file(path), os.path.getsize(path))
+
+
+def _open_unchecked(path):
+    """
+    Open an image the way Image.open does, minus its decompression bomb check.
+    """
+    from PIL import Image
+
+    Image.init()
+    with open(path, "rb") as f:
+        prefix = f.read(16)
+    for fmt in Image.ID:
+        factory, accept = Image.OPEN[fmt]
+        result = not accept or accept(prefix)
+        if not result or isinstance(result, (str, bytes)):
+            continue
+        try:
+            # Given a path the plugin opens (and later closes) the file itself
+            return factory(path)
+        except (SyntaxError, IndexError, TypeError, struct.error):
+            continue
+    raise ValueError(f"Cannot identify image file {os.path.basename(path)}")
+
+
+@contextmanager
+def _open_image(path):
+    """
+    Open an image lazily.
+
+    Pillow refuses images above Image.MAX_IMAGE_PIXELS (about 179 MP) as
+    decompression bombs when they are opened, before any pixels are read.
+    That setting is process-wide, so it is left alone: images it refuses
+    are reopened without the check, and the decode limit is applied only
+    where a frame really has to be decoded whole (_decode_frame), so large
+    scans can still be passed through or downsampled strip by strip.
+    """
+    from PIL import Image
+
+    try:
+        img = Image.open(path)
+    except Image.DecompressionBombError:
+        img = _open_unchecked(path)
+    try:
+        yield img
+    finally:
+        img.close()
+
+
+def _tiff_ccitt_info(img):
+    """
+    Describe the current TIFF frame's CCITT fax strips, or return None if the
+    frame is not bilevel G3/G4 data that PDF can embed as-is.
+    """
+    if img.format != "TIFF" or TIFF_TILE_WIDTH in img.tag_v2:
+        return None
+    tags = img.tag_v2
+    compression = tags.get(TIFF_COMPRESSION)
+    t4_options = tags.get(TIFF_T4_OPTIONS, 0)
+    if compression == 4:
+        k, byte_align = -1, False
+    elif compression == 3 and not t4_options & 3:
+        # 1-D T.4 only; 2-D and uncompressed-mode G3 are decoded instead
+        k, byte_align = 0, bool(t4_options & 4)
+    else:
+        return None
+    if tags.get(TIFF_PHOTOMETRIC) not in (0, 1) or tags.get(TIFF_FILL_ORDER, 1) != 1:
+        return None
+    
+    offsets = tags.get(TIFF_STRIP_OFFSETS)
+    counts = tags.get(TIFF_STRIP_BYTE_COUNTS)
+    if offsets is None or counts is None:
+        return None
+    offsets = offsets if isinstance(offsets, tuple) else (offsets,)
+    counts = counts if isinstance(counts, tuple) else (counts,)
+    rows_per_strip = min(tags.get(TIFF_ROWS_PER_STRIP, img.height), img.height)
+    
+    strips = []
+    for idx, (offset, count) in enumerate(zip(offsets, counts)):
+        top = idx * rows_per_strip
+        strips.append((offset, count, top, min(top + rows_per_strip, img.height)))
+    return {
+        "k": k,
+        "byte_align": byte_align,
+        # Fax runs decode with white as 0; BlackIsZero (1) images are stored inverted
+        "black_is_1": tags.get(TIFF_PHOTOMETRIC) == 1,
+        "strips": strips,
+    }
+
+
+def _embed_ccitt(writer, path, width, info):
+    """Embed each CCITT strip as its own image XObject. Returns [(object_id, top, bottom)]."""
+    bands = []
+    for offset, count, top, bottom in info["strips"]:
+        dictionary = (
+            f"/Type /XObject /Subtype /Image /Width {width} /Height {bottom - top} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /CCITTFaxDecode "
+            f"/DecodeParms << /K {info['k']} /Columns {width} /Rows {bottom - top} "
+            f"/BlackIs1 {'true' if info['black_is_1'] else 'false'} "
+            f"/EncodedByteAlign {'true' if info['byte_align'] else 'false'} >>"
+        )
+        obj_id = writer.add_stream(dictionary, _iter_file(path, [(offset, count)]), count)
+        bands.append((obj_id, top, bottom))
+    return bands
+
+
+def _flatten(img):
+    """Return an 'L' or 'RGB' copy of the image, compositing transparency onto white."""
+    from PIL import Image
+
+    # Convert RGBA to RGB if needed (PDF doesn't support transparency well)
+    if img.mode in ('RGBA', 'LA', 'P', 'PA'):
+        img = img.convert('RGBA')
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        rgb_img.paste(img, mask=img.split()[-1])
+        return rgb_img
+    if img.mode in ('1', 'I;16', 'I;16B', 'I;16L'):
+        return img.convert('L')
+    if img.mode not in ('RGB', 'L'):
+        return img.convert('RGB')
+    return img
+
+
+def _reduce_factor(width, height, max_pixels):
+    """Smallest integer factor that brings the image within max_pixels."""
+    factor = max(1, int(math.sqrt(width * height / max_pixels)))
+    while math.ceil(width / factor) * math.ceil(height / factor) > max_pixels:
+        factor += 1
+    return factor
+
+
+def _raw_tiff_bands(img):
+    """
+    Split the current frame of an uncompressed, strip-organised TIFF into
+    bands of rows that can be decoded independently.
+
+    Returns a list of (top, bottom, offset, stride, raw_args) or None when the
+    layout doesn't allow it.
+    """
+    if img.format != "TIFF" or TIFF_TILE_WIDTH in img.tag_v2:
+        return None
+    if img.tag_v2.get(TIFF_PLANAR_CONFIG, 1) != 1:
+        return None
+    bits = img.tag_v2.get(TIFF_BITS_PER_SAMPLE, 1)
+    bits = sum(bits) if isinstance(bits, tuple) else bits
+    stride = (img.width * bits + 7) // 8
+    
+    bands = []
+    for decoder, (x0, y0, x1, y1), offset, args in img.tile:
+        rawmode, tile_stride, orientation = (tuple(args) + (0, 1))[:3]
+        if decoder != "raw" or (x0, x1) != (0, img.width) or orientation != 1 or tile_stride not in (0, stride):
+            return None
+        for top in range(y0, y1, BAND_ROWS):
+            bottom = min(top + BAND_ROWS, y1)
+            bands.append((top, bottom, offset + (top - y0) * stride, stride, args))
+    return bands
+
+
+def _load_band(path, mode, width, top, bottom, offset, stride, args):
+    """Decode rows [top, bottom) of a raw frame without decoding the rest of the image."""
+    from PIL import Image
+
+    length = (bottom - top) * stride
+    data = b"".join(_iter_file(path, [(offset, length)]))
+    args = args if isinstance(args, tuple) else (args,)
+    return _flatten(Image.frombytes(mode, (width, bottom - top), data, "raw", *args))
+
+
+def _reduce_in_bands(path, img, bands, factor):
+    """
+    Downsample a frame band by band so only BAND_ROWS rows of full-resolution
+    pixels are held in memory at once.
+    """
+    from PIL import Image
+
+    out = None
+    carry = None
+    out_y = 0
+    for top, bottom, offset, stride, args in bands:
+        strip = _load_band(path, img.mode, img.width, top, bottom, offset, stride, args)
+        if carry is not None:
+            joined = Image.new(strip.mode, (strip.width, carry.height + strip.height))
+            joined.paste(carry, (0, 0))
+            joined.paste(strip, (0, carry.height))
+            strip = joined
+        if out is None:
+            out = Image.new(strip.mode, (math.ceil(img.width / factor), math.ceil(img.height / factor)))
+        
+        # Reduce whole groups of `factor` rows and carry the remainder into the next band
+        usable = (strip.height // factor) * factor
+        if usable:
+            reduced = strip.crop((0, 0, strip.width, usable)).reduce(factor)
+            out.paste(reduced, (0, out_y))
+            out_y += reduced.height
+        carry = strip.crop((0, usable, strip.width, strip.height)) if usable < strip.height else None
+    
+    if carry is not None:
+        out.paste(carry.reduce(factor), (0, out_y))
+    return out
+
+
+def _decode_frame(path, img, max_pixels, max_decode_pixels):
+    """
+    Decode the current frame as an 'L' or 'RGB' image of at most max_pixels.
+    """
+    from PIL import Image
+
+    factor = _reduce_factor(img.width, img.height, max_pixels)
+    if factor > 1:
+        if img.format == "JPEG":
+            # Let the JPEG decoder scale down while decoding
+            target = (math.ceil(img.width / factor), math.ceil(img.height / factor))
+            img.draft(img.mode, target)
+            return _flatten(img).resize(target, Image.Resampling.BOX)
+        
+        bands = _raw_tiff_bands(img)
+        if bands:
+            return _reduce_in_bands(path, img, bands, factor)
+    
+    if img.width * img.height > max_decode_pixels:
+        raise ValueError(
+            f"Image {img.width}x{img.height} exceeds the decode limit of {max_decode_pixels} pixels"
+        )
+    flat = _flatten(img)
+    return flat.reduce(factor) if factor > 1 else flat
+
+
+def _embed_decoded(writer, img):
+    """Embed an 'L' or 'RGB' image losslessly as a Flate stream."""
+    colorspace = "/DeviceGray" if img.mode == "L" else "/DeviceRGB"
+    data = zlib.compress(img.tobytes())
+    dictionary = (
+        f"/Type /XObject /Subtype /Image /Width {img.width} /Height {img.height} "
+        f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter /FlateDecode"
+    )
+    return writer.add_stream(dictionary, data, len(data))
+
+
+def _embed_images(writer, path, passthrough=True, max_pixels=DEFAULT_MAX_PIXELS,
+                  max_decode_pixels=DEFAULT_MAX_DECODE_PIXELS):
+    """
+    Write one image file as XObjects, one page per frame.
+
+    Yields (bands, displayed_width_px, displayed_height_px, rotation) per frame,
+    where bands is a list of (object_id, top_row, bottom_row) covering the frame.
+    """
+    from PIL import Image
+
+    with _open_image(path) as img:
+        frames = getattr(img, "n_frames", 1)
+        
+        if passthrough and frames == 1:
+            if img.format == "JPEG" and img.mode in JPEG_COLORSPACES:
+                rotation = EXIF_ROTATIONS.get(img.getexif().get(0x0112, 1))
+                if rotation is not None:
+                    obj_id = _embed_encoded(writer, path, img)
+                    if rotation in (90, 270):
+                        yield [(obj_id, 0, img.width)], img.height, img.width, rotation
+                    else:
+                        yield [(obj_id, 0, img.height)], img.width, img.height, rotation
+                    return
+            elif img.format == "JPEG2000":
+                yield [(_embed_encoded(writer, path, img), 0, img.height)], img.width, img.height, 0
+                return
+            elif img.format == "PNG":
+                info = _png_info(path)
+                if info:
+                    yield [(_embed_png(writer, path, info), 0, info["height"])], info["width"], info["height"], 0
+                    return
+        
+        for frame in range(frames):
+            if frame and img.format != "TIFF" and img.width * img.height > max_decode_pixels:
+                # Seeking past the first frame of an animation composites the earlier ones
+                raise ValueError(
+                    f"Image {img.width}x{img.height} exceeds the decode limit of {max_decode_pixels} pixels"
+                )
+            img.seek(frame)
+            if passthrough:
+                info = _tiff_ccitt_info(img)
+                if info:
+                    yield _embed_ccitt(writer, path, img.width, info), img.width, img.height, 0
+                    continue
+            
+            orientation = img.getexif().get(0x0112, 1) if frames == 1 else 1
+            decoded = _decode_frame(path, img, max_pixels, max_decode_pixels)
+            if orientation in EXIF_TRANSPOSE:
+                decoded = decoded.transpose(Image.Transpose[EXIF_TRANSPOSE[orientation]])
+            yield [(_embed_decoded(writer, decoded), 0, decoded.height)], decoded.width, decoded.height, 0
+
+
+def _page_box(width_px, height_px, page_size, orientation):
+    """
+    Return (page_width, page_height, x, y, draw_width, draw_height) in points.
+    """
+    if str(page_size).lower() == "fit":
+        # One pixel per point, the page wraps the image
+        return width_px, height_px, 0, 0, width_px, height_px
+    
+    short, long = PAGE_SIZES.get(str(page_size).upper(), PAGE_SIZES["A4"])
+    if orientation == "landscape" or (orientation == "auto" and width_px > height_px):
+        page_width, page_height = long, short
+    else:
+        page_width, page_height = short, long
+    
+    scale = min(page_width / width_px, page_height / height_px)
+    draw_width, draw_height = width_px * scale, height_px * scale
+    x = (page_width - draw_width) / 2
+    y = (page_height - draw_height) / 2
+    return page_width, page_height, x, y, draw_width, draw_height
 
 
 @celery_app.task(name="images_to_pdf", bind=True)
+@with_storage
+@instrument("images_to_pdf")
 def images_to_pdf(self, job_id: str, input_paths: list, params: dict = None) -> dict:
     """
     Convert multiple images to a single PDF
     Supports PNG, TIFF, GIF, JPG
+
+    Images are read one at a time and written straight to the output file.
+    In passthrough mode JPEG/JPEG2000 bytes, PNG image data and CCITT G3/G4
+    TIFF strips are embedded without being decoded or re-encoded; other
+    images are decoded and stored losslessly. Multi-page TIFF/GIF inputs
+    produce one page per frame, and decoded frames over max_pixels are
+    downsampled. Only JPEGs (scaled while decoding) and uncompressed
+    strip-based TIFFs (strip by strip) avoid holding the full-resolution
+    image; other images are decoded whole first, so they are refused above
+    IMAGES_MAX_DECODE_PIXELS.
     
     Args:
         job_id: Unique job identifier
         input_paths: List of paths to input images
         params: dict with optional keys:
-            - orientation: 'portrait' or 'landscape' (default 'auto')
-            - page_size: 'A4', 'Letter', 'A3' etc (default 'A4')
+            - orientation: 'portrait', 'landscape' or 'auto' (default 'auto')
+            - page_size: 'A4', 'Letter', 'A3' etc, or 'fit' to size each page to its image (default 'A4')
+            - passthrough: Embed encoded image data without re-encoding (default True)
+            - max_pixels: Pixel budget for decoded frames (default IMAGES_MAX_PIXELS or 40M)
     
     Returns:
         dict with file_path to output .pdf file
@@ -32,35 +514,33 @@ def images_to_pdf(self, job_id: str, input_paths: list, params: dict = None) ->
     
     try:
         orientation = params.get("orientation", "auto")
+        page_size = params.get("page_size", "A4")
+        passthrough = params.get("passthrough", True)
+        max_pixels = int(params.get("max_pixels", DEFAULT_MAX_PIXELS))
         
         if not input_paths:
             raise ValueError("No input images provided")
         
-        # Open all images
-        images = []
         for img_path in input_paths:
             if not os.path.exists(img_path):
                 raise FileNotFoundError(f"Image file not found: {img_path}")
-            
-            img = Image.open(img_path)
-            
-            # Convert RGBA to RGB if needed (PDF doesn't support transparency well)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = rgb_img
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            images.append(img)
         
-        # Save as PDF
-        if images:
-            images[0].save(
-                output_path,
-                save_all=True,
-                append_images=images[1:] if len(images) > 1 else []
-            )
+        with StreamingPdfWriter(output_path) as writer:
+            for img_path in input_paths:
+                for bands, width, height, rotation in _embed_images(writer, img_path, passthrough, max_pixels):
+                    page_width, page_height, x, y, draw_width, draw_height = _page_box(
+                        width, height, page_size, orientation
+                    )
+                    content = []
+                    xobjects = {}
+                    for idx, (obj_id, top, bottom) in enumerate(bands):
+                        # Bands are stacked top to bottom; a single band fills the box
+                        band_y = y + draw_height * (height - bottom) / height if rotation == 0 else y
+                        band_height = draw_height * (bottom - top) / height if rotation == 0 else draw_height
+                        matrix = placement_matrix(x, band_y, draw_width, band_height, rotation)
+                        content.append(f"q {matrix} cm /Im{idx} Do Q")
+                        xobjects[f"Im{idx}"] = obj_id
+                    writer.add_page(page_width, page_height, "\n".join(content).encode(), xobjects)
         
         return {"file_path": output_path}
     
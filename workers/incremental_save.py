@@ -0,0 +1,160 @@
+"""
+Incremental-update saving for small edits.
+
+Instead of rewriting every object, the original file is copied and only the
+changed objects are appended, followed by a new cross-reference section whose
+/Prev points at the original one (PDF 32000-1 section 7.5.6). Damaged or
+encrypted inputs fall back to a full pikepdf save.
+"""
+import os
+import re
+import shutil
+import zlib
+
+
+STARTXREF_RE = re.compile(rb"startxref\s+(\d+)\s+%%EOF", re.S)
+
+
+def _find_startxref(path):
+    """Return the byte offset of the last cross-reference section, or None."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(max(0, size - 4096))
+        tail = f.read()
+    matches = list(STARTXREF_RE.finditer(tail))
+    if not matches:
+        return None
+    offset = int(matches[-1].group(1))
+    return offset if 0 < offset < size else None
+
+
+def _uses_xref_stream(path, offset):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return not f.read(4).startswith(b"xref")
+
+
+def can_save_incremental(pdf, input_path):
+    """
+    True when `pdf` was opened cleanly from `input_path` and can take an incremental update.
+    """
+    if pdf.is_encrypted or pdf.get_warnings():
+        # qpdf had to repair the file (or it is encrypted): rewrite it fully
+        return False
+    return _find_startxref(input_path) is not None
+
+
+def _serialize(obj):
+    """Return the body of an indirect object (without the 'n g obj' wrapper)."""
+    import pikepdf
+
+    if isinstance(obj, pikepdf.Stream):
+        data = obj.read_raw_bytes()
+        stream_dict = pikepdf.Dictionary(obj.stream_dict)
+        stream_dict.Length = len(data)
+        return stream_dict.unparse(resolved=True) + b"\nstream\n" + data + b"\nendstream"
+    return obj.unparse(resolved=True)
+
+
+def _subsections(numbers):
+    """Group sorted object numbers into (first, count) runs."""
+    runs = []
+    for num in numbers:
+        if runs and runs[-1][0] + runs[-1][1] == num:
+            runs[-1][1] += 1
+        else:
+            runs.append([num, 1])
+    return runs
+
+
+def save_incremental(pdf, input_path, output_path, changed_objects):
+    """
+    Write `output_path` as `input_path` plus an incremental update holding `changed_objects`.
+
+    Args:
+        pdf: The pikepdf.Pdf opened from input_path
+        input_path: Original file
+        output_path: Destination file
+        changed_objects: Indirect pikepdf objects that were modified or created
+    """
+    import pikepdf
+
+    prev = _find_startxref(input_path)
+    xref_stream = _uses_xref_stream(input_path, prev)
+
+    objects = {}
+    for obj in changed_objects:
+        if not obj.is_indirect:
+            raise ValueError("Only indirect objects can be written incrementally")
+        objects[obj.objgen] = obj
+
+    shutil.copyfile(input_path, output_path)
+    with open(output_path, "r+b") as f:
+        f.seek(0, os.SEEK_END)
+        f.write(b"\n")
+
+        offsets = {}
+        for (num, gen), obj in sorted(objects.items()):
+            offsets[num] = (f.tell(), gen)
+            f.write(f"{num} {gen} obj\n".encode() + _serialize(obj) + b"\nendobj\n")
+
+        size = max([int(pdf.trailer.get("/Size", 0))] + [num + 1 for num in offsets])
+        trailer = pikepdf.Dictionary(Size=size, Prev=prev, Root=pdf.Root)
+        for key in ("/Info", "/ID"):
+            if key in pdf.trailer:
+                trailer[key] = pdf.trailer[key]
+
+        xref_offset = f.tell()
+        if xref_stream:
+            # Files using cross-reference streams must be updated with one too
+            xref_num = size
+            offsets[xref_num] = (xref_offset, 0)
+            trailer.Size = xref_num + 1
+            numbers = sorted(offsets)
+            width = max(4, (xref_offset.bit_length() + 7) // 8)
+            data = b"".join(
+                b"\x01" + offsets[num][0].to_bytes(width, "big") + offsets[num][1].to_bytes(2, "big")
+                for num in numbers
+            )
+            data = zlib.compress(data)
+            trailer.Type = pikepdf.Name.XRef
+            trailer.W = pikepdf.Array([1, width, 2])
+            trailer.Index = pikepdf.Array([v for run in _subsections(numbers) for v in run])
+            trailer.Filter = pikepdf.Name.FlateDecode
+            trailer.Length = len(data)
+            f.write(
+                f"{xref_num} 0 obj\n".encode() + trailer.unparse(resolved=True)
+                + b"\nstream\n" + data + b"\nendstream\nendobj\n"
+            )
+        else:
+            lines = [b"xref\n"]
+            for first, count in _subsections(sorted(offsets)):
+                lines.append(f"{first} {count}\n".encode())
+                for num in range(first, first + count):
+                    offset, gen = offsets[num]
+                    lines.append(f"{offset:010d} {gen:05d} n \n".encode())
+            lines.append(b"trailer\n" + trailer.unparse(resolved=True) + b"\n")
+            f.write(b"".join(lines))
+
+        f.write(f"startxref\n{xref_offset}\n%%EOF\n".encode())
+
+
+def save(pdf, input_path, output_path, changed_objects, incremental=True):
+    """
+    Save `pdf` incrementally when possible, otherwise with a full rewrite.
+
+    Returns True if an incremental update was written.
+    """
+    import pikepdf
+
+    if incremental and can_save_incremental(pdf, input_path):
+        try:
+            save_incremental(pdf, input_path, output_path, changed_objects)
+            with pikepdf.open(output_path) as check:
+                if not check.get_warnings():
+                    return True
+        except Exception:
+            pass
+
+    pdf.save(output_path)
+    return False
@@ -0,0 +1,218 @@
+"""
+Per-task worker instrumentation.
+
+Wrap a task with @instrument to record its duration, pages, bytes in/out
+and peak RSS, and use `with stage("render"):` inside it to time named
+stages (render, ocr, encode, save, subprocess...). Page counts come from
+the task (a "pages" result key, or utils.count_pages calls) when it has
+them, otherwise from each input's page tree root. Metrics are exported
+to Prometheus from every prefork child through prometheus_client's
+multiprocess mode (PROMETHEUS_MULTIPROC_DIR), and dict results get a
+"timings" breakdown the backend feeds into its cost model.
+"""
+import functools
+import os
+import resource
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Histogram
+
+METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", 9809))
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+RATE_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+RSS_BUCKETS = tuple(mb * 1024 * 1024 for mb in (64, 128, 256, 512, 1024, 2048, 4096, 8192))
+
+TASK_DURATION = Histogram(
+    "pdfsimple_task_duration_seconds", "Task wall time", ["tool", "status"], buckets=DURATION_BUCKETS
+)
+STAGE_DURATION = Histogram(
+    "pdfsimple_task_stage_seconds", "Wall time of named task stages", ["tool", "stage"], buckets=DURATION_BUCKETS
+)
+PAGES_PER_SECOND = Histogram(
+    "pdfsimple_task_pages_per_second", "Pages processed per second of task time", ["tool"], buckets=RATE_BUCKETS
+)
+PEAK_RSS = Histogram(
+    "pdfsimple_task_peak_rss_bytes", "Peak resident memory of the worker process during a task", ["tool"],
+    buckets=RSS_BUCKETS,
+)
+PAGES = Counter("pdfsimple_task_pages", "Pages processed", ["tool"])
+BYTES_IN = Counter("pdfsimple_task_bytes_in", "Input bytes read", ["tool"])
+BYTES_OUT = Counter("pdfsimple_task_bytes_out", "Output bytes written", ["tool"])
+
+_current = ContextVar("pdfsimple_task_timings", default=None)
+
+
+@contextmanager
+def stage(name):
+    """Time a named stage of the current task. A no-op outside instrumented tasks."""
+    record = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if record is not None:
+            elapsed = time.perf_counter() - start
+            record["stages"][name] = record["stages"].get(name, 0.0) + elapsed
+            STAGE_DURATION.labels(record["tool"], name).observe(elapsed)
+
+
+def _reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM (Linux >= 4.0), making the peak per task
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux; it covers the process lifetime
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def note_pages(path, pages):
+    """
+    Record the page count of an input the current task has opened anyway,
+    so the wrapper doesn't reopen it. A no-op outside instrumented tasks.
+    """
+    record = _current.get()
+    if record is not None:
+        record["pages"][path] = pages
+
+
+def _input_paths(args):
+    paths = []
+    for arg in args:
+        if isinstance(arg, str) and os.path.isfile(arg):
+            paths.append(arg)
+        elif isinstance(arg, (list, tuple)):
+            paths.extend(p for p in arg if isinstance(p, str) and os.path.isfile(p))
+    return paths
+
+
+def _output_path(result):
+    path = result.get("file_path") if isinstance(result, dict) else result
+    return path if isinstance(path, str) and os.path.exists(path) else None
+
+
+def _output_bytes(path):
+    """Size of an output file, or of every file in an output directory (split pages, HTML images)."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _count_pages(paths):
+    """
+    Page count from each PDF's page tree root (/Count), without walking the
+    page tree or parsing anything else.
+    """
+    import pikepdf
+    pages = 0
+    for path in paths:
+        if path.lower().endswith(".pdf") and os.path.isfile(path):
+            try:
+                with pikepdf.open(path) as pdf:
+                    pages += int(pdf.Root.Pages.Count)
+            except Exception:
+                pass
+    return pages
+
+
+def instrument(tool):
+    """
+    Decorator recording metrics for a task function. Apply below @celery_app.task.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record = {"tool": tool, "stages": {}, "pages": {}}
+            token = _current.set(record)
+            _reset_peak_rss()
+            inputs = _input_paths(args)
+            start = time.perf_counter()
+            status = "failure"
+            try:
+                result = func(*args, **kwargs)
+                status = "success"
+            finally:
+                total = time.perf_counter() - start
+                _current.reset(token)
+                TASK_DURATION.labels(tool, status).observe(total)
+
+            output = _output_path(result)
+            # Counts the task reported or noted while working; inputs it never opened are counted cheaply
+            pages = (result.get("pages") if isinstance(result, dict) else None) or (
+                sum(record["pages"].get(path, 0) for path in inputs)
+                + _count_pages([path for path in inputs if path not in record["pages"]])
+            )
+            if not pages and output:
+                pages = _count_pages([output])
+            bytes_in = sum(os.path.getsize(p) for p in inputs)
+            bytes_out = _output_bytes(output) if output else 0
+            peak_rss = _peak_rss()
+
+            PAGES.labels(tool).inc(pages)
+            BYTES_IN.labels(tool).inc(bytes_in)
+            BYTES_OUT.labels(tool).inc(bytes_out)
+            PEAK_RSS.labels(tool).observe(peak_rss)
+            if pages and total > 0:
+                PAGES_PER_SECOND.labels(tool).observe(pages / total)
+
+            if isinstance(result, dict):
+                result["timings"] = {
+                    "total": round(total, 4),
+                    "stages": {name: round(seconds, 4) for name, seconds in record["stages"].items()},
+                    "pages": pages,
+                    "pages_per_second": round(pages / total, 3) if pages and total > 0 else None,
+                    "bytes_in": bytes_in,
+                    "bytes_out": bytes_out,
+                    "peak_rss_bytes": peak_rss,
+                }
+            return result
+        return wrapper
+    return decorator
+
+
+def start_metrics_server():
+    """
+    Serve metrics aggregated across all pool processes. Call once in the
+    worker's main process; does nothing unless PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not multiproc_dir:
+        return
+    from prometheus_client import CollectorRegistry, start_http_server, multiprocess
+
+    # Values from a previous run would otherwise be aggregated forever
+    os.makedirs(multiproc_dir, exist_ok=True)
+    for name in os.listdir(multiproc_dir):
+        if name.endswith(".db"):
+            os.remove(os.path.join(multiproc_dir, name))
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(METRICS_PORT, registry=registry)
+
+
+def mark_process_dead(pid):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
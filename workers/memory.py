@@ -0,0 +1,113 @@
+"""
+Worker memory governance.
+
+Raster tools (watermark, page numbers, OCR, PDF to PowerPoint) render pages
+to bitmaps: about 6 MB for a Letter page at 150 DPI, 25 MB at 300 DPI, and
+more for the copies a tool makes while editing it. Instead of rendering the
+whole document at once they take pages from page_batches(), which sizes each
+batch from the task's declared bytes per page so it fits below the soft
+limit (WORKER_MEMORY_SOFT_LIMIT_MB) on top of the process's current RSS,
+shrinking down to one page at a time as memory gets tight. If even one page
+would cross the hard limit (WORKER_MEMORY_LIMIT_MB), the task fails with
+MemoryLimitExceeded and a clear message rather than being killed by the
+kernel's OOM killer with no result.
+
+Memory the allocator keeps after a large task is returned by recycling the
+pool process (worker_max_memory_per_child in celery_app.py).
+"""
+import os
+
+MB = 1024 * 1024
+
+# Per pool process. 0 disables the limit
+MEMORY_LIMIT = int(os.environ.get("WORKER_MEMORY_LIMIT_MB", 2048)) * MB
+# Batches are sized to stay below this
+SOFT_LIMIT = int(os.environ.get("WORKER_MEMORY_SOFT_LIMIT_MB", MEMORY_LIMIT * 3 // 4 // MB)) * MB
+# Most pages rendered at once, however much memory is free
+MAX_BATCH_PAGES = int(os.environ.get("WORKER_MAX_BATCH_PAGES", 16))
+
+# Used when a page's size can't be read
+DEFAULT_PAGE_POINTS = (612, 792)  # Letter
+
+
+class MemoryLimitExceeded(Exception):
+    pass
+
+
+def current_rss():
+    """Resident memory of this process in bytes (0 if unknown)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def page_bytes(input_path, dpi, copies=1, channels=3):
+    """
+    Memory needed to hold the largest page of a PDF rendered as a bitmap.
+
+    Args:
+        input_path: Path to the PDF
+        dpi: Rendering resolution
+        copies: Bitmaps the task holds per page (e.g. 2 when it edits a copy
+            of the rendered page)
+        channels: Bytes per pixel (3 for RGB, 1 for grayscale)
+
+    Returns:
+        Estimated bytes per page
+    """
+    import pikepdf
+
+    width, height = DEFAULT_PAGE_POINTS
+    try:
+        with pikepdf.open(input_path) as pdf:
+            sizes = [(abs(float(box[2]) - float(box[0])), abs(float(box[3]) - float(box[1])))
+                     for box in (page.mediabox for page in pdf.pages)]
+        if sizes:
+            width, height = max(sizes, key=lambda size: size[0] * size[1])
+    except Exception:
+        pass
+    # Points are 1/72 inch
+    return int(width / 72 * dpi) * int(height / 72 * dpi) * channels * copies
+
+
+def batch_size(bytes_per_page, tool, max_pages=None):
+    """
+    Pages that can be rendered now without crossing the soft limit (at least 1).
+
+    Raises MemoryLimitExceeded if a single page would cross the hard limit.
+    """
+    max_pages = max_pages or MAX_BATCH_PAGES
+    if not MEMORY_LIMIT:
+        return max_pages
+    rss = current_rss()
+    if rss + bytes_per_page > MEMORY_LIMIT:
+        raise MemoryLimitExceeded(
+            f"{tool} needs about {bytes_per_page // MB} MB per page and the worker is using {rss // MB} MB "
+            f"of its {MEMORY_LIMIT // MB} MB limit; try a lower DPI or split the document"
+        )
+    return max(1, min(max_pages, (SOFT_LIMIT - rss) // max(1, bytes_per_page)))
+
+
+def page_batches(total_pages, bytes_per_page, tool, max_pages=None):
+    """
+    Yield half-open (start, end) page ranges covering [0, total_pages).
+
+    Each range is sized when it is requested, after the previous batch has
+    been processed and released, so batches shrink as memory fills up.
+
+    Args:
+        total_pages: Pages in the document
+        bytes_per_page: page_bytes() of the task
+        tool: Tool name for error messages
+        max_pages: Largest batch (default WORKER_MAX_BATCH_PAGES)
+    """
+    start = 0
+    while start < total_pages:
+        end = min(total_pages, start + batch_size(bytes_per_page, tool, max_pages))
+        yield start, end
+        start = end
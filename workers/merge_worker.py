@@ -1,13 +1,18 @@
 import os
-import pikepdf
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .storage import with_storage
 
 @celery_app.task(name="merge_pdfs")
+@with_storage
+@instrument("merge_pdfs")
 def merge_pdfs(job_id: str, input_paths: list):
     """
     Merge a list of PDF file paths into a single PDF.
     Stores the result in /tmp/{job_id}_merged.pdf and returns the path.
     """
+    import pikepdf
+
     output_path = f"/data/{job_id}_merged.pdf"
     try:
         pdf_writer = pikepdf.Pdf.new()
@@ -16,7 +21,8 @@ def merge_pdfs(job_id: str, input_paths: list):
             with pikepdf.Pdf.open(pdf_path) as pdf_reader:
                 pdf_writer.pages.extend(pdf_reader.pages)
         
-        pdf_writer.save(output_path)
+        with stage("save"):
+            pdf_writer.save(output_path)
         pdf_writer.close()
         return output_path
     except Exception as exc:
@@ -2,12 +2,50 @@
 Worker to view and edit PDF metadata
 """
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .storage import with_storage
+from .incremental_save import save
 import os
-import pikepdf
 import json
 
 
+METADATA_FIELDS = {
+    "title": "/Title",
+    "author": "/Author",
+    "subject": "/Subject",
+    "keywords": "/Keywords",
+    "creator": "/Creator",
+    "producer": "/Producer",
+}
+
+
+def read_metadata(pdf):
+    """Document info of an open pikepdf.Pdf as {field: str}."""
+    if "/Info" not in pdf.trailer:
+        return {}
+    return {field: str(pdf.docinfo.get(key, "")) for field, key in METADATA_FIELDS.items()}
+
+
+def apply_metadata(pdf, params):
+    """
+    Set the document info fields given in params on an open pikepdf.Pdf.
+
+    Returns:
+        dict of the updates, keyed by PDF name (None for fields left alone)
+    """
+    metadata_updates = {key: params.get(field) for field, key in METADATA_FIELDS.items()}
+
+    # Remove None values and apply updates
+    docinfo = pdf.docinfo
+    for key, value in metadata_updates.items():
+        if value is not None:
+            docinfo[key] = value
+    return metadata_updates
+
+
 @celery_app.task(name="edit_metadata", bind=True)
+@with_storage
+@instrument("edit_metadata")
 def edit_metadata(self, job_id: str, input_path: str, params: dict = None) -> dict:
     """
     View and edit PDF metadata
@@ -23,10 +61,13 @@ def edit_metadata(self, job_id: str, input_path: str, params: dict = None) -> di
             - creator: Application that created the original PDF
             - producer: Application that produced the PDF
             - action: 'get' to retrieve metadata, 'set' to update metadata (default 'set')
+            - incremental: Append only the updated Info dictionary to a copy of the input (default True)
     
     Returns:
         dict with file_path and/or metadata
     """
+    import pikepdf
+
     if params is None:
         params = {}
     
@@ -36,16 +77,7 @@ def edit_metadata(self, job_id: str, input_path: str, params: dict = None) -> di
     try:
         with pikepdf.open(input_path) as pdf:
             # Get current metadata
-            current_metadata = {}
-            if pdf.metadata:
-                current_metadata = {
-                    "title": str(pdf.metadata.get("/Title", "")),
-                    "author": str(pdf.metadata.get("/Author", "")),
-                    "subject": str(pdf.metadata.get("/Subject", "")),
-                    "keywords": str(pdf.metadata.get("/Keywords", "")),
-                    "creator": str(pdf.metadata.get("/Creator", "")),
-                    "producer": str(pdf.metadata.get("/Producer", "")),
-                }
+            current_metadata = read_metadata(pdf)
             
             if action == "get":
                 # Just return current metadata
@@ -53,24 +85,18 @@ def edit_metadata(self, job_id: str, input_path: str, params: dict = None) -> di
             
             elif action == "set":
                 # Update metadata
-                metadata_updates = {
-                    "/Title": params.get("title"),
-                    "/Author": params.get("author"),
-                    "/Subject": params.get("subject"),
-                    "/Keywords": params.get("keywords"),
-                    "/Creator": params.get("creator"),
-                    "/Producer": params.get("producer"),
-                }
-                
-                # Remove None values and apply updates
-                for key, value in metadata_updates.items():
-                    if value is not None:
-                        pdf.metadata[key] = value
+                metadata_updates = apply_metadata(pdf, params)
+                docinfo = pdf.docinfo
                 
                 output_path = os.path.join(output_dir, "metadata_edited.pdf")
-                pdf.save(output_path)
+                changed = [docinfo] if docinfo.is_indirect else []
+                with stage("save"):
+                    incremental = save(
+                        pdf, input_path, output_path, changed,
+                        params.get("incremental", True) and docinfo.is_indirect
+                    )
                 
-                return {"file_path": output_path, "metadata": metadata_updates}
+                return {"file_path": output_path, "metadata": metadata_updates, "incremental": incremental}
         
         return {"status": "success"}
     
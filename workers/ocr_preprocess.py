@@ -0,0 +1,265 @@
+"""
+Page analysis and image preprocessing for OCR.
+
+With params['preprocess'], rather than render every page at a fixed 300 DPI
+in color, ocr_pdf renders each page in grayscale at the resolution its
+content needs:
+
+  - pages with a text layer: enough for the smallest common text size to
+    come out about OCR_TEXT_HEIGHT_PX pixels high (Tesseract's sweet spot)
+  - scanned pages: the embedded image's own resolution, since rendering
+    above it adds pixels but no detail, capped at what body text needs
+
+and binarizes (Otsu) and deskews (projection profile) the page with NumPy
+before Tesseract sees it, so Tesseract skips its own thresholding and reads
+straight lines.
+"""
+import math
+import os
+
+DEFAULT_DPI = 300
+MIN_DPI = int(os.environ.get("OCR_MIN_DPI", 150))
+MAX_DPI = int(os.environ.get("OCR_MAX_DPI", 400))
+# Rendered font size (em height) Tesseract reads most accurately
+TEXT_HEIGHT_PX = int(os.environ.get("OCR_TEXT_HEIGHT_PX", 32))
+# Assumed text size on scanned pages
+BODY_TEXT_PT = 10
+# Text sizes below this percentile (footnotes, page furniture) may come out small
+TEXT_SIZE_PERCENTILE = 0.1
+
+MAX_SKEW_DEGREES = 5.0
+# Skew is searched on a copy downsampled to about this width
+SKEW_SEARCH_WIDTH = 1000
+# Pages are rotated only for skews larger than this
+MIN_DESKEW_DEGREES = 0.1
+
+
+def _multiply(m, n):
+    """Product of two PDF matrices [a b c d e f] (m applied first)."""
+    a, b, c, d, e, f = m
+    return [
+        a * n[0] + b * n[2], a * n[1] + b * n[3],
+        c * n[0] + d * n[2], c * n[1] + d * n[3],
+        e * n[0] + f * n[2] + n[4], e * n[1] + f * n[3] + n[5],
+    ]
+
+
+def _scale(m):
+    """Vertical scale of a matrix: how tall one unit of text space ends up."""
+    return math.hypot(m[2], m[3])
+
+
+def _features(content_owner, ctm, text_sizes, image_dpis, depth=0):
+    """
+    Collect effective text sizes (points) and image resolutions (DPI) drawn
+    by a page or form XObject, following nested forms.
+    """
+    import pikepdf
+
+    resources = content_owner.get("/Resources") or pikepdf.Dictionary()
+    xobjects = resources.get("/XObject") or pikepdf.Dictionary()
+    stack = []
+    font_size = 0.0
+    text_matrix = [1, 0, 0, 1, 0, 0]
+    line_matrix = [1, 0, 0, 1, 0, 0]
+    leading = 0.0
+    try:
+        instructions = pikepdf.parse_content_stream(content_owner)
+    except Exception:
+        return
+    for instruction in instructions:
+        if isinstance(instruction, pikepdf.ContentStreamInlineImage):
+            continue
+        operands, operator = instruction.operands, str(instruction.operator)
+        if operator == "q":
+            stack.append(ctm)
+        elif operator == "Q":
+            ctm = stack.pop() if stack else ctm
+        elif operator == "cm" and len(operands) == 6:
+            ctm = _multiply([float(x) for x in operands], ctm)
+        elif operator == "BT":
+            text_matrix = line_matrix = [1, 0, 0, 1, 0, 0]
+        elif operator == "Tf" and len(operands) == 2:
+            font_size = abs(float(operands[1]))
+        elif operator == "TL" and operands:
+            leading = float(operands[0])
+        elif operator == "Tm" and len(operands) == 6:
+            text_matrix = line_matrix = [float(x) for x in operands]
+        elif operator in ("Td", "TD") and len(operands) == 2:
+            if operator == "TD":
+                leading = -float(operands[1])
+            line_matrix = _multiply([1, 0, 0, 1, float(operands[0]), float(operands[1])], line_matrix)
+            text_matrix = line_matrix
+        elif operator in ("T*", "'", '"'):
+            line_matrix = _multiply([1, 0, 0, 1, 0, -leading], line_matrix)
+            text_matrix = line_matrix
+        if operator in ("Tj", "TJ", "'", '"') and font_size:
+            text_sizes.append(font_size * _scale(_multiply(text_matrix, ctm)))
+        elif operator == "Do" and operands:
+            xobject = xobjects.get(str(operands[0]))
+            if xobject is None:
+                continue
+            subtype = xobject.get("/Subtype")
+            if subtype == "/Image":
+                # Images are drawn into the unit square: the CTM gives their size in points
+                width_in = math.hypot(ctm[0], ctm[1]) / 72
+                height_in = math.hypot(ctm[2], ctm[3]) / 72
+                if width_in > 0 and height_in > 0:
+                    image_dpis.append(min(int(xobject.get("/Width", 0)) / width_in,
+                                          int(xobject.get("/Height", 0)) / height_in))
+            elif subtype == "/Form" and depth < 3:
+                matrix = [float(x) for x in xobject.get("/Matrix", [1, 0, 0, 1, 0, 0])]
+                _features(xobject, _multiply(matrix, ctm), text_sizes, image_dpis, depth + 1)
+
+
+def _text_dpi(size_pt):
+    return TEXT_HEIGHT_PX * 72 / size_pt
+
+
+def choose_dpi(text_sizes, image_dpis):
+    """
+    Render resolution for a page from the text sizes and image resolutions on it.
+
+    Args:
+        text_sizes: Effective font sizes of the page's text, in points
+        image_dpis: Resolutions of the page's images as drawn
+
+    Returns:
+        DPI between OCR_MIN_DPI and OCR_MAX_DPI
+    """
+    candidates = []
+    sizes = sorted(size for size in text_sizes if size > 1)
+    if sizes:
+        candidates.append(_text_dpi(sizes[int(len(sizes) * TEXT_SIZE_PERCENTILE)]))
+    if image_dpis:
+        candidates.append(min(max(image_dpis), _text_dpi(BODY_TEXT_PT)))
+    if not candidates:
+        # Vector outlines or an unreadable content stream: no clue, render as before
+        return DEFAULT_DPI
+    return int(round(min(MAX_DPI, max(MIN_DPI, max(candidates)))))
+
+
+def page_dpis(input_path):
+    """
+    Render resolution for each page of a PDF (see choose_dpi).
+    """
+    import pikepdf
+
+    dpis = []
+    with pikepdf.open(input_path) as pdf:
+        for page in pdf.pages:
+            text_sizes, image_dpis = [], []
+            _features(page.obj, [1, 0, 0, 1, 0, 0], text_sizes, image_dpis)
+            dpis.append(choose_dpi(text_sizes, image_dpis))
+    return dpis
+
+
+def binarize(gray):
+    """
+    Otsu threshold of a grayscale page.
+
+    Args:
+        gray: 2-D uint8 NumPy array
+
+    Returns:
+        Boolean array, True for ink
+    """
+    import numpy as np
+
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    below = np.cumsum(hist)
+    above = below[-1] - below
+    below_sum = np.cumsum(hist * np.arange(256))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (below_sum[-1] * below / below[-1] - below_sum) ** 2 / (below * above)
+    threshold = int(np.argmax(np.nan_to_num(between)))
+    return gray <= threshold
+
+
+def skew_angle(ink):
+    """
+    Angle (degrees, counter-clockwise) the text lines of a page are rotated by.
+
+    The ink is projected onto the vertical axis at candidate angles; the
+    angle giving the sharpest profile (lines and gaps best separated) wins.
+    Searches coarsely in 1 degree steps, then in 0.1 degree steps.
+    """
+    import numpy as np
+
+    step = max(1, ink.shape[1] // SKEW_SEARCH_WIDTH)
+    ys, xs = np.nonzero(ink[::step, ::step])
+    if len(ys) < 100:
+        return 0.0
+    ys = ys.astype(np.float64)
+    xs = xs.astype(np.float64) - xs.mean()
+
+    def sharpness(degrees):
+        radians = math.radians(degrees)
+        rows = np.rint(ys * math.cos(radians) + xs * math.sin(radians)).astype(np.int64)
+        profile = np.bincount(rows - rows.min()).astype(np.float64)
+        return float(np.dot(profile, profile))
+
+    coarse = max(np.arange(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES + 0.5, 1.0), key=sharpness)
+    fine = max(np.arange(coarse - 1.0, coarse + 1.05, 0.1), key=sharpness)
+    return float(round(fine, 2))
+
+
+def preprocess(image, deskew=True):
+    """
+    Binarize and deskew a rendered page for Tesseract.
+
+    Args:
+        image: PIL image of the page
+        deskew: Straighten rotated text lines
+
+    Returns:
+        (1-byte grayscale PIL image, black text on white; degrees it was
+        rotated counter-clockwise to straighten it)
+    """
+    import numpy as np
+    from PIL import Image
+
+    ink = binarize(np.asarray(image.convert("L")))
+    angle = -skew_angle(ink) if deskew else 0.0
+    page = Image.fromarray(np.where(ink, np.uint8(0), np.uint8(255)))
+    if abs(angle) < MIN_DESKEW_DEGREES:
+        return page, 0.0
+    return page.rotate(angle, resample=Image.Resampling.NEAREST, fillcolor=255), angle
+
+
+def text_layer_matrix(mediabox, rotate, layer_size, angle):
+    """
+    Matrix placing Tesseract's text layer for a rendered page on the original page.
+
+    Args:
+        mediabox: Page MediaBox [x0, y0, x1, y1] (the area pdf2image renders)
+        rotate: Page /Rotate in degrees
+        layer_size: (width, height) of the text layer page, in points
+        angle: Degrees preprocess() rotated the rendered page by
+
+    Returns:
+        PDF matrix [a b c d e f] for the layer's form XObject
+    """
+    x0, y0, x1, y1 = (float(v) for v in mediabox)
+    x0, x1 = min(x0, x1), max(x0, x1)
+    y0, y1 = min(y0, y1), max(y0, y1)
+    width, height = x1 - x0, y1 - y0
+    rotate = int(rotate) % 360
+    # The rendered (viewed) page is the rotated page
+    view_width, view_height = (height, width) if rotate in (90, 270) else (width, height)
+
+    matrix = [view_width / layer_size[0], 0, 0, view_height / layer_size[1], 0, 0]
+    if angle:
+        # Undo the deskew rotation about the page centre
+        radians = math.radians(-angle)
+        cos, sin = math.cos(radians), math.sin(radians)
+        cx, cy = view_width / 2, view_height / 2
+        matrix = _multiply(matrix, [cos, sin, -sin, cos, cx - cx * cos + cy * sin, cy - cx * sin - cy * cos])
+    # View space to user space
+    to_user = {
+        0: [1, 0, 0, 1, x0, y0],
+        90: [0, 1, -1, 0, x0 + width, y0],
+        180: [-1, 0, 0, -1, x0 + width, y0 + height],
+        270: [0, -1, 1, 0, x0, y0 + height],
+    }[rotate]
+    return _multiply(matrix, to_user)
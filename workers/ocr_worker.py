@@ -1,22 +1,99 @@
 import os
-import pytesseract
-from pdf2image import convert_from_path
+from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .memory import page_batches, page_bytes
+from .ocr_preprocess import page_dpis, preprocess, text_layer_matrix
+from .storage import with_storage
+from .utils import count_pages, parse_bool
 
-def ocr_pdf(job_id, input_path, params=None):
+# Resolution without preprocessing.
+# 500 dpi is good for OCR, but slow. 300 is standard.
+DPI = 300
+
+
+def _rendered_pages(input_path, dpis, grayscale=False):
+    """
+    Yield (image, dpi) for each page of a PDF, rendered in batches sized to
+    the memory available. Each page is dropped once the caller moves on.
+
+    Args:
+        input_path: Path to the PDF
+        dpis: Resolution of each page
+        grayscale: Render 1-byte grayscale instead of RGB
+    """
+    from pdf2image import convert_from_path
+
+    if grayscale:
+        # The page, its NumPy copy, the ink mask, the binarized and the deskewed page
+        bytes_per_page = page_bytes(input_path, max(dpis, default=DPI), copies=5, channels=1)
+    else:
+        bytes_per_page = page_bytes(input_path, max(dpis, default=DPI))
+    for start, end in page_batches(len(dpis), bytes_per_page, "ocr_pdf"):
+        # One render per run of pages sharing a resolution
+        run_start = start
+        while run_start < end:
+            dpi = dpis[run_start]
+            run_end = run_start + 1
+            while run_end < end and dpis[run_end] == dpi:
+                run_end += 1
+            with stage("render"):
+                images = convert_from_path(
+                    input_path, dpi=dpi, first_page=run_start + 1, last_page=run_end, grayscale=grayscale
+                )
+            while images:
+                yield images.pop(0), dpi
+            run_start = run_end
+
+
+def _add_text_layer(pdf, page, layer_page, angle):
+    """
+    Overlay the invisible text of Tesseract's text-only PDF for a page on
+    the original page, undoing the deskew rotation.
+    """
+    import pikepdf
+
+    box = [float(v) for v in layer_page.mediabox]
+    matrix = text_layer_matrix(page.mediabox, page.obj.get("/Rotate", 0), (box[2] - box[0], box[3] - box[1]), angle)
+    name = page.add_resource(pdf.copy_foreign(layer_page.as_form_xobject()), pikepdf.Name.XObject, prefix="OCR")
+    # Keep the page's own graphics state from leaking into the overlay
+    page.contents_add(pikepdf.Stream(pdf, b"q\n"), prepend=True)
+    placement = " ".join(f"{value:.6f}" for value in matrix)
+    page.contents_add(pikepdf.Stream(pdf, f"\nQ\nq {placement} cm {name} Do Q\n".encode()))
+
+
+def ocr(job_id, input_path, params=None):
     """
     Convert PDF to images, then OCR each image to text (or searchable PDF).
-    For MVP, let's process each page and create a text file or a searchable PDF.
+
+    Pages are rendered in color at 300 DPI. With params['preprocess'], each
+    page is instead rendered in grayscale at a resolution chosen from its
+    text sizes and image resolutions, then binarized and deskewed before
+    Tesseract reads it (see ocr_preprocess.py).
     
     If params['output_format'] == 'text':
-        Return full text string or path to .txt file.
+        Return path to a .txt file with the text of every page.
     Else:
-        Return path to searchable PDF (using pytesseract.image_to_pdf_or_hocr).
+        Return path to a searchable PDF. By default every page is replaced
+        by Tesseract's PDF of its raster: the rendered image with the text
+        on top, so vector content and any existing text layer are lost.
+        With preprocess, the original pages are kept and Tesseract's text
+        is overlaid on them as an invisible layer.
+
+    Other params:
+        - lang: Tesseract language(s) (default 'eng')
+        - dpi: Render every page at this resolution instead
+        - preprocess: Choose the resolution per page, binarize and deskew
+          pages, and overlay the text on the original pages (default False;
+          compare with benchmarks/ocr_accuracy.py)
     """
+    import pytesseract
+
     if params is None:
         params = {}
     
     output_format = params.get('output_format', 'pdf') # 'pdf' or 'text'
     lang = params.get('lang', 'eng')
+    adaptive = parse_bool(params.get('preprocess'))
     
     # Generate output path
     base_dir = os.path.dirname(input_path)
@@ -28,45 +105,77 @@ def ocr_pdf(job_id, input_path, params=None):
     output_path = os.path.join(base_dir, output_filename)
     
     try:
-        # 1. Convert PDF pages to images
-        # 500 dpi is good for OCR, but slow. 300 is standard.
-        images = convert_from_path(input_path, dpi=300)
+        # 1. Choose each page's resolution
+        if params.get('dpi'):
+            dpis = [int(params['dpi'])] * count_pages(input_path)
+        elif adaptive:
+            with stage("analyze"):
+                dpis = page_dpis(input_path)
+        else:
+            dpis = [DPI] * count_pages(input_path)
+
+        # 2. Convert PDF pages to images, a batch at a time
+        images = _rendered_pages(input_path, dpis, grayscale=adaptive)
         
         if output_format == 'text':
             full_text = []
-            for img in images:
-                text = pytesseract.image_to_string(img, lang=lang)
+            for img, dpi in images:
+                if adaptive:
+                    with stage("preprocess"):
+                        img, _ = preprocess(img)
+                with stage("ocr"):
+                    text = pytesseract.image_to_string(img, lang=lang, config=f"--dpi {dpi}")
                 full_text.append(text)
             
             with open(output_path, "w", encoding="utf-8") as f:
                 f.write("\n\n".join(full_text))
                 
         else:
-            # Create searchable PDF
-            # simple loop: get pdf data for each page and merge?
-            # Or use pytesseract to get PDF bytes for the whole image list? 
-            # pytesseract supports image-to-pdf.
-            # But we have multiple images (pages).
-            # We need to process each page and merge them.
-            
-            from PyPDF2 import PdfMerger # Or we can use our merge_worker logic if available, or just PdfMerger
-            # But we only have pikepdf installed in requirements? (Let's check).
-            # requirements has `pikepdf`. We can use pikepdf to merge.
-            # But pytesseract output is bytes.
-            
             import pikepdf
             import io
             
-            pdf = pikepdf.new()
+            # Text-layer PDFs stay open until the output is saved: copied
+            # pages read their streams from them
+            layers = []
+            if adaptive:
+                pdf = pikepdf.open(input_path)
+            else:
+                pdf = pikepdf.new()
             
-            for img in images:
-                pdf_bytes = pytesseract.image_to_pdf_or_hocr(img, extension='pdf', lang=lang)
-                with pikepdf.open(io.BytesIO(pdf_bytes)) as page_pdf:
-                    pdf.pages.extend(page_pdf.pages)
-            
-            pdf.save(output_path)
+            try:
+                for index, (img, dpi) in enumerate(images):
+                    if adaptive:
+                        with stage("preprocess"):
+                            img, angle = preprocess(img)
+                        with stage("ocr"):
+                            pdf_bytes = pytesseract.image_to_pdf_or_hocr(
+                                img, extension='pdf', lang=lang, config=f"--dpi {dpi} -c textonly_pdf=1"
+                            )
+                        layers.append(pikepdf.open(io.BytesIO(pdf_bytes)))
+                        _add_text_layer(pdf, pdf.pages[index], layers[-1].pages[0], angle)
+                    else:
+                        with stage("ocr"):
+                            pdf_bytes = pytesseract.image_to_pdf_or_hocr(img, extension='pdf', lang=lang)
+                        layers.append(pikepdf.open(io.BytesIO(pdf_bytes)))
+                        pdf.pages.extend(layers[-1].pages)
+                
+                with stage("save"):
+                    pdf.save(output_path)
+            finally:
+                for document in [pdf] + layers:
+                    document.close()
             
         return {"file_path": output_path}
 
     except Exception as e:
         raise RuntimeError(f"OCR failed: {str(e)}")
+
+
+@celery_app.task(name="ocr_pdf")
+@with_storage
+@instrument("ocr_pdf")
+def ocr_pdf(job_id, input_path, params=None):
+    """
+    OCR a PDF to text or a searchable PDF (see ocr for params).
+    """
+    return ocr(job_id, input_path, params)
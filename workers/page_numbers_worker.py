@@ -2,13 +2,17 @@
 Worker to add page numbers to PDF
 """
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .memory import page_batches, page_bytes
+from .storage import with_storage
+from .utils import count_pages
 import os
-from pdf2image import convert_from_path
-from PIL import Image, ImageDraw, ImageFont
 
 
-@celery_app.task(name="add_page_numbers", bind=True)
-def add_page_numbers(self, job_id: str, input_path: str, params: dict = None) -> dict:
+DPI = 150
+
+
+def apply_page_numbers(job_id: str, input_path: str, params: dict = None) -> dict:
     """
     Add page numbers to PDF
     
@@ -24,6 +28,9 @@ def add_page_numbers(self, job_id: str, input_path: str, params: dict = None) ->
     Returns:
         dict with file_path to output PDF
     """
+    from pdf2image import convert_from_path
+    from PIL import Image, ImageDraw, ImageFont
+
     if params is None:
         params = {}
     
@@ -36,67 +43,86 @@ def add_page_numbers(self, job_id: str, input_path: str, params: dict = None) ->
         format_str = params.get("format", "{number}")
         start_from = params.get("start_from", 1)
         
-        # Convert PDF to images
-        images = convert_from_path(input_path, dpi=150)
-        numbered_images = []
-        total_pages = len(images)
+        # Render and number the pages in batches sized to the memory
+        # available, appending each batch to the output
+        # (rendered page and its numbered copy per page)
+        total_pages = count_pages(input_path)
+        bytes_per_page = page_bytes(input_path, DPI, copies=2)
+        for start, end in page_batches(total_pages, bytes_per_page, "add_page_numbers"):
+            with stage("render"):
+                images = convert_from_path(input_path, dpi=DPI, first_page=start + 1, last_page=end)
+            numbered_images = []
         
-        for idx, image in enumerate(images, start=start_from):
-            numbered_img = image.copy()
-            draw = ImageDraw.Draw(numbered_img)
+            for idx, image in enumerate(images, start=start_from + start):
+                numbered_img = image.copy()
+                draw = ImageDraw.Draw(numbered_img)
             
-            try:
-                font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
+                try:
+                    font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", font_size)
+                except:
+                    font = ImageFont.load_default()
             
-            # Format page number
-            page_num = idx
-            page_text = format_str.replace("{number}", str(page_num)).replace("{total}", str(total_pages))
+                # Format page number
+                page_num = idx
+                page_text = format_str.replace("{number}", str(page_num)).replace("{total}", str(total_pages))
             
-            # Get text size
-            bbox = draw.textbbox((0, 0), page_text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
+                # Get text size
+                bbox = draw.textbbox((0, 0), page_text, font=font)
+                text_width = bbox[2] - bbox[0]
+                text_height = bbox[3] - bbox[1]
             
-            # Calculate position with margin
-            margin = 20
+                # Calculate position with margin
+                margin = 20
             
-            if position == "top":
-                x = (numbered_img.width - text_width) // 2
-                y = margin
-            elif position == "bottom":
-                x = (numbered_img.width - text_width) // 2
-                y = numbered_img.height - text_height - margin
-            elif position == "topright":
-                x = numbered_img.width - text_width - margin
-                y = margin
-            elif position == "topleft":
-                x = margin
-                y = margin
-            elif position == "bottomright":
-                x = numbered_img.width - text_width - margin
-                y = numbered_img.height - text_height - margin
-            elif position == "bottomleft":
-                x = margin
-                y = numbered_img.height - text_height - margin
-            else:
-                x = numbered_img.width - text_width - margin
-                y = numbered_img.height - text_height - margin
+                if position == "top":
+                    x = (numbered_img.width - text_width) // 2
+                    y = margin
+                elif position == "bottom":
+                    x = (numbered_img.width - text_width) // 2
+                    y = numbered_img.height - text_height - margin
+                elif position == "topright":
+                    x = numbered_img.width - text_width - margin
+                    y = margin
+                elif position == "topleft":
+                    x = margin
+                    y = margin
+                elif position == "bottomright":
+                    x = numbered_img.width - text_width - margin
+                    y = numbered_img.height - text_height - margin
+                elif position == "bottomleft":
+                    x = margin
+                    y = numbered_img.height - text_height - margin
+                else:
+                    x = numbered_img.width - text_width - margin
+                    y = numbered_img.height - text_height - margin
             
-            # Draw page number
-            draw.text((x, y), page_text, font=font, fill=(0, 0, 0))
-            numbered_images.append(numbered_img)
+                # Draw page number
+                draw.text((x, y), page_text, font=font, fill=(0, 0, 0))
+                numbered_images.append(numbered_img)
         
-        # Save as PDF
-        if numbered_images:
-            numbered_images[0].save(
-                output_path,
-                save_all=True,
-                append_images=numbered_images[1:] if len(numbered_images) > 1 else []
-            )
+            # Save as PDF
+            if numbered_images:
+                with stage("save"):
+                    numbered_images[0].save(
+                        output_path,
+                        save_all=True,
+                        append=start > 0,
+                        append_images=numbered_images[1:] if len(numbered_images) > 1 else []
+                    )
+            # Free this batch before the next one is sized and rendered
+            images = numbered_images = None
         
         return {"file_path": output_path}
     
     except Exception as e:
         raise Exception(f"Add page numbers operation failed: {str(e)}")
+
+
+@celery_app.task(name="add_page_numbers", bind=True)
+@with_storage
+@instrument("add_page_numbers")
+def add_page_numbers(self, job_id: str, input_path: str, params: dict = None) -> dict:
+    """
+    Add page numbers to PDF (see apply_page_numbers for params).
+    """
+    return apply_page_numbers(job_id, input_path, params)
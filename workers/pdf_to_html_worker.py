@@ -3,16 +3,100 @@ Worker to convert PDF to HTML
 Uses pdfplumber to extract text and basic structure
 """
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .storage import asset, with_storage
+from .utils import count_pages, page_ranges, pool_size, imap_ordered
 import os
-import pdfplumber
-from pdf2image import convert_from_path
+
+
+HTML_HEADER = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>PDF Document</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; line-height: 1.6; }
+        .page { margin-bottom: 40px; page-break-after: always; border: 1px solid #ddd; padding: 20px; }
+        .page img { max-width: 100%; height: auto; }
+        .text-content { white-space: pre-wrap; word-wrap: break-word; }
+        h1 { color: #333; }
+    </style>
+</head>
+<body>
+"""
+
+HTML_FOOTER = """</body>
+</html>"""
+
+# Pages handled by one pool task. Large enough to amortise opening the file,
+# small enough that a chunk's HTML stays small in memory.
+DEFAULT_CHUNK_PAGES = 25
+
+
+def _text_pages_html(args):
+    """
+    Extract text and tables for pages [start, end) and return their HTML fragments.
+    Runs in a pool process; only the requested pages are parsed.
+    """
+    import pdfplumber
+
+    input_path, start, end = args
+    fragments = []
+    with pdfplumber.open(input_path, pages=range(start + 1, end + 1)) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text()
+            tables = page.extract_tables()
+
+            parts = [f'<div class="page"><h1>Page {page.page_number}</h1>']
+            if text:
+                parts.append(f'<div class="text-content">{text}</div>')
+            if tables:
+                parts.append('<table border="1" cellpadding="5" cellspacing="0">\n')
+                for row in tables[0]:  # Use first table
+                    parts.append('<tr>')
+                    parts.extend(f'<td>{cell or ""}</td>' for cell in row)
+                    parts.append('</tr>\n')
+                parts.append('</table>\n')
+            parts.append('</div>\n')
+            fragments.append("".join(parts))
+
+            # Drop parsed layout objects so memory stays flat across the range
+            page.flush_cache()
+    return "".join(fragments)
+
+
+def _image_pages_html(args):
+    """
+    Render pages [start, end) to PNG files next to the output and return their HTML fragments.
+    """
+    from pdf2image import convert_from_path
+
+    input_path, output_dir, dpi, start, end = args
+    images = convert_from_path(input_path, dpi=dpi, first_page=start + 1, last_page=end)
+    fragments = []
+    for idx, image in enumerate(images, start + 1):
+        img_path = os.path.join(output_dir, f"page_{idx}.png")
+        image.save(img_path, "PNG")
+        image.close()
+
+        rel_img_path = f"page_{idx}.png"
+        fragments.append(f'<div class="page"><h1>Page {idx}</h1><img src="{rel_img_path}" alt="Page {idx}"></div>\n')
+    return "".join(fragments)
 
 
 @celery_app.task(name="pdf_to_html", bind=True)
+@with_storage
+@instrument("pdf_to_html")
 def pdf_to_html(self, job_id: str, input_path: str, params: dict = None) -> dict:
     """
     Convert PDF to HTML
     Can produce text-based or image-based HTML
+
+    Pages are processed in ranges across a process pool and each range's HTML
+    is written to the output file as soon as it is ready, in page order.
+    In 'images' mode the page_<n>.png files the HTML links to are written
+    next to it and published with it.
     
     Args:
         job_id: Unique job identifier
@@ -20,6 +104,8 @@ def pdf_to_html(self, job_id: str, input_path: str, params: dict = None) -> dict
         params: dict with optional keys:
             - mode: 'text' or 'images' (default 'text')
             - dpi: DPI for image conversion (default 150, only for 'images' mode)
+            - chunk_pages: Pages per pool task (default 25)
+            - workers: Number of pool processes (default CPU count)
     
     Returns:
         dict with file_path to output .html file
@@ -33,66 +119,29 @@ def pdf_to_html(self, job_id: str, input_path: str, params: dict = None) -> dict
     try:
         mode = params.get("mode", "text")
         dpi = params.get("dpi", 150)
-        
-        html_content = """<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>PDF Document</title>
-    <style>
-        body { font-family: Arial, sans-serif; margin: 20px; line-height: 1.6; }
-        .page { margin-bottom: 40px; page-break-after: always; border: 1px solid #ddd; padding: 20px; }
-        .page img { max-width: 100%; height: auto; }
-        .text-content { white-space: pre-wrap; word-wrap: break-word; }
-        h1 { color: #333; }
-    </style>
-</head>
-<body>
-"""
-        
+        chunk_pages = params.get("chunk_pages", DEFAULT_CHUNK_PAGES)
+
+        ranges = page_ranges(count_pages(input_path), chunk_pages)
         if mode == "images":
             # Convert each page to image and embed
-            images = convert_from_path(input_path, dpi=dpi)
-            
-            for idx, image in enumerate(images, 1):
-                # Save image
-                img_path = os.path.join(output_dir, f"page_{idx}.png")
-                image.save(img_path, "PNG")
-                
-                # Get relative path for HTML
-                rel_img_path = f"page_{idx}.png"
-                html_content += f'<div class="page"><h1>Page {idx}</h1><img src="{rel_img_path}" alt="Page {idx}"></div>\n'
-        
+            func = _image_pages_html
+            tasks = [(input_path, output_dir, dpi, start, end) for start, end in ranges]
         else:  # text mode
-            with pdfplumber.open(input_path) as pdf:
-                for page_idx, page in enumerate(pdf.pages, 1):
-                    text = page.extract_text()
-                    
-                    # Extract tables if any
-                    tables = page.extract_tables()
-                    
-                    html_content += f'<div class="page"><h1>Page {page_idx}</h1>'
-                    
-                    if text:
-                        html_content += f'<div class="text-content">{text}</div>'
-                    
-                    if tables:
-                        html_content += '<table border="1" cellpadding="5" cellspacing="0">\n'
-                        for row in tables[0]:  # Use first table
-                            html_content += '<tr>'
-                            for cell in row:
-                                html_content += f'<td>{cell or ""}</td>'
-                            html_content += '</tr>\n'
-                        html_content += '</table>\n'
-                    
-                    html_content += '</div>\n'
-        
-        html_content += """</body>
-</html>"""
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+            func = _text_pages_html
+            tasks = [(input_path, start, end) for start, end in ranges]
+
+        with stage("extract"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(HTML_HEADER)
+                for fragment in imap_ordered(func, tasks, pool_size(params)):
+                    f.write(fragment)
+                f.write(HTML_FOOTER)
+
+        if mode == "images":
+            # The page images sit next to the HTML and are published with it
+            for start, end in ranges:
+                for idx in range(start + 1, end + 1):
+                    asset(os.path.join(output_dir, f"page_{idx}.png"))
         
         return {"file_path": output_path}
     
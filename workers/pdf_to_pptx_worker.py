@@ -3,16 +3,70 @@ Worker to convert PDF to PowerPoint (.pptx)
 Uses pdf2image to extract pages and python-pptx to create presentation
 """
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .memory import batch_size, page_bytes
+from .storage import with_storage
+from .utils import count_pages, page_ranges, pool_size, imap_ordered
 import os
-from pdf2image import convert_from_path
-from pptx import Presentation
-from pptx.util import Inches
+import io
+
+
+# Pages rendered by one pool task. Only a few chunks are in flight at once,
+# which bounds how many rendered pages exist in memory.
+DEFAULT_CHUNK_PAGES = 4
+
+
+def _first_page_aspect(input_path):
+    """
+    Height / width of the first page as rendered (MediaBox, after /Rotate),
+    or None if it can't be read.
+    """
+    import pikepdf
+
+    try:
+        with pikepdf.open(input_path) as pdf:
+            page = pdf.pages[0]
+            x0, y0, x1, y1 = (float(v) for v in page.mediabox)
+            width, height = abs(x1 - x0), abs(y1 - y0)
+            if int(page.obj.get("/Rotate", 0)) % 180:
+                width, height = height, width
+    except Exception:
+        return None
+    return height / width if width and height else None
+
+
+def _render_pages(args):
+    """
+    Render pages [start, end) and encode each one in memory.
+    Runs in a pool process and returns a list of (image_bytes, width_px, height_px).
+    """
+    from pdf2image import convert_from_path
+
+    input_path, dpi, image_format, quality, start, end = args
+    images = convert_from_path(input_path, dpi=dpi, first_page=start + 1, last_page=end)
+    encoded = []
+    for image in images:
+        buf = io.BytesIO()
+        if image_format == "png":
+            image.save(buf, "PNG")
+        else:
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            image.save(buf, "JPEG", quality=quality, optimize=True)
+        encoded.append((buf.getvalue(), image.width, image.height))
+        image.close()
+    return encoded
 
 
 @celery_app.task(name="pdf_to_pptx", bind=True)
+@with_storage
+@instrument("pdf_to_pptx")
 def pdf_to_pptx(self, job_id: str, input_path: str, params: dict = None) -> dict:
     """
     Convert PDF to PowerPoint presentation
+
+    Pages are rendered lazily in parallel ranges and each page is encoded
+    into an in-memory buffer passed straight to add_picture.
     
     Args:
         job_id: Unique job identifier
@@ -20,10 +74,18 @@ def pdf_to_pptx(self, job_id: str, input_path: str, params: dict = None) -> dict
         params: dict with optional keys:
             - dpi: DPI for PDF rendering (default 150)
             - title: Presentation title
+            - image_format: 'jpeg' or 'png' (default 'jpeg')
+            - jpeg_quality: JPEG quality 1-95 (default 85)
+            - fit_to_page: Size slides to the first page's aspect ratio (default False)
+            - chunk_pages: Pages per pool task (default 4)
+            - workers: Number of pool processes (default CPU count)
     
     Returns:
         dict with file_path to output .pptx file
     """
+    from pptx import Presentation
+    from pptx.util import Inches, Emu
+
     if params is None:
         params = {}
     
@@ -33,40 +95,70 @@ def pdf_to_pptx(self, job_id: str, input_path: str, params: dict = None) -> dict
     try:
         dpi = params.get("dpi", 150)
         title = params.get("title", "PDF Presentation")
-        
-        # Convert PDF pages to images
-        images = convert_from_path(input_path, dpi=dpi)
+        image_format = str(params.get("image_format", "jpeg")).lower()
+        quality = int(params.get("jpeg_quality", 85))
+        fit_to_page = params.get("fit_to_page", False)
+        chunk_pages = params.get("chunk_pages", DEFAULT_CHUNK_PAGES)
         
         # Create presentation
         prs = Presentation()
         prs.slide_width = Inches(10)
         prs.slide_height = Inches(7.5)
         
+        # One slide size per presentation: follow the first page, decided
+        # before any slide is laid out
+        aspect = _first_page_aspect(input_path) if fit_to_page else None
+        if aspect:
+            prs.slide_height = Emu(int(prs.slide_width * aspect))
+        
         # Add title slide
         title_slide_layout = prs.slide_layouts[0]
         title_slide = prs.slides.add_slide(title_slide_layout)
         title_slide.shapes.title.text = title
+        if aspect:
+            # The layout's placeholders are placed for a 7.5in high slide
+            scale = prs.slide_height / Inches(7.5)
+            for placeholder in title_slide.placeholders:
+                left, top, width, height = placeholder.left, placeholder.top, placeholder.width, placeholder.height
+                placeholder.left, placeholder.width = left, width
+                placeholder.top, placeholder.height = Emu(int(top * scale)), Emu(int(height * scale))
+        
+        # A chunk's rendered pages are held at once, and imap_ordered keeps up to
+        # two chunks per pool process in flight: share the memory available between them
+        processes = pool_size(params)
+        in_flight = 1 if processes <= 1 else processes * 2
+        chunk_pages = max(1, batch_size(
+            page_bytes(input_path, dpi), "pdf_to_pptx", max_pages=int(chunk_pages) * in_flight
+        ) // in_flight)
+        tasks = [
+            (input_path, dpi, image_format, quality, start, end)
+            for start, end in page_ranges(count_pages(input_path), chunk_pages)
+        ]
         
         # Add image slides
-        for idx, image in enumerate(images, 1):
-            # Use blank layout
-            blank_slide_layout = prs.slide_layouts[6]
-            slide = prs.slides.add_slide(blank_slide_layout)
-            
-            # Save image to temp location
-            temp_img_path = os.path.join(output_dir, f"page_{idx}.png")
-            image.save(temp_img_path, "PNG")
-            
-            # Add image to slide, filling the slide
-            left = Inches(0)
-            top = Inches(0)
-            slide.shapes.add_picture(temp_img_path, left, top, width=prs.slide_width, height=prs.slide_height)
-            
-            # Clean up temp image
-            os.remove(temp_img_path)
+        for chunk in imap_ordered(_render_pages, tasks, processes):
+            for image_bytes, width_px, height_px in chunk:
+                # Use blank layout
+                blank_slide_layout = prs.slide_layouts[6]
+                slide = prs.slides.add_slide(blank_slide_layout)
+                
+                if fit_to_page:
+                    # Keep the page's aspect ratio, centred on the slide
+                    scale = min(prs.slide_width / width_px, prs.slide_height / height_px)
+                    width = Emu(int(width_px * scale))
+                    height = Emu(int(height_px * scale))
+                    left = Emu((prs.slide_width - width) // 2)
+                    top = Emu((prs.slide_height - height) // 2)
+                else:
+                    # Fill the slide
+                    left, top = Inches(0), Inches(0)
+                    width, height = prs.slide_width, prs.slide_height
+                
+                slide.shapes.add_picture(io.BytesIO(image_bytes), left, top, width=width, height=height)
         
         # Save presentation
-        prs.save(output_path)
+        with stage("save"):
+            prs.save(output_path)
         
         return {"file_path": output_path}
     
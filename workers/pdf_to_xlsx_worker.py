@@ -3,64 +3,134 @@ Worker to convert PDF to Excel (.xlsx)
 Uses pdfplumber to extract tables and openpyxl to create Excel file
 """
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .storage import with_storage
+from .utils import count_pages, page_ranges, pool_size, imap_ordered
 import os
-import pdfplumber
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
+import io
+import csv
+import zipfile
+
+
+# Pages handled by one pool task
+DEFAULT_CHUNK_PAGES = 20
+
+
+def _extract_page_tables(args):
+    """
+    Extract tables (and optionally text) for pages [start, end).
+    Runs in a pool process and returns a list of (page_number, tables, text).
+    """
+    import pdfplumber
+
+    input_path, start, end, extract_text = args
+    results = []
+    with pdfplumber.open(input_path, pages=range(start + 1, end + 1)) as pdf:
+        for page in pdf.pages:
+            tables = page.extract_tables()
+            text = page.extract_text() if extract_text else None
+            results.append((page.page_number, tables, text))
+            page.flush_cache()
+    return results
+
+
+def _iter_pages(input_path, params):
+    """
+    Yield (page_number, tables, text) for every page, in order.
+    """
+    extract_text = params.get("extract_text", False)
+    chunk_pages = params.get("chunk_pages", DEFAULT_CHUNK_PAGES)
+    tasks = [
+        (input_path, start, end, extract_text)
+        for start, end in page_ranges(count_pages(input_path), chunk_pages)
+    ]
+    for chunk in imap_ordered(_extract_page_tables, tasks, pool_size(params)):
+        yield from chunk
+
+
+def _write_xlsx(pages, output_path):
+    """
+    Stream tables into a write-only workbook, one sheet per table.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    
+    for page_idx, tables, text in pages:
+        for table_idx, table in enumerate(tables or [], 1):
+            sheet_name = f"Page{page_idx}_Table{table_idx}"[:31]  # Max 31 char sheet name
+            ws = wb.create_sheet(title=sheet_name)
+            for row in table:
+                ws.append(row)
+        
+        if text:
+            sheet_name = f"Text_Page{page_idx}"[:31]
+            ws = wb.create_sheet(title=sheet_name)
+            ws.append([text])
+    
+    # A workbook needs at least one sheet to be valid
+    if not wb.worksheets:
+        wb.create_sheet(title="Sheet")
+    
+    wb.save(output_path)
+
+
+def _write_csv_zip(pages, output_path):
+    """
+    Write each table as a CSV file (and text as .txt) inside a zip archive.
+    """
+    with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as zipf:
+        for page_idx, tables, text in pages:
+            for table_idx, table in enumerate(tables or [], 1):
+                with zipf.open(f"Page{page_idx}_Table{table_idx}.csv", 'w') as raw:
+                    with io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+                        csv.writer(f).writerows(table)
+            
+            if text:
+                zipf.writestr(f"Text_Page{page_idx}.txt", text)
 
 
 @celery_app.task(name="pdf_to_xlsx", bind=True)
+@with_storage
+@instrument("pdf_to_xlsx")
 def pdf_to_xlsx(self, job_id: str, input_path: str, params: dict = None) -> dict:
     """
     Convert PDF to Excel spreadsheet
     Extracts tables from PDF and creates Excel sheets
+
+    Tables are extracted page-parallel on a process pool and streamed, in
+    page order, into a write-only workbook (or a zip of CSV files).
     
     Args:
         job_id: Unique job identifier
         input_path: Path to input PDF
         params: dict with optional keys:
             - extract_text: Also extract text as separate sheets (default False)
+            - output_format: 'xlsx' or 'csv' (zip of CSV files) (default 'xlsx')
+            - chunk_pages: Pages per pool task (default 20)
+            - workers: Number of pool processes (default CPU count)
     
     Returns:
-        dict with file_path to output .xlsx file
+        dict with file_path to output .xlsx (or .zip) file
     """
     if params is None:
         params = {}
     
     output_dir = os.path.dirname(input_path)
-    output_path = os.path.join(output_dir, "output.xlsx")
     
     try:
-        extract_text = params.get("extract_text", False)
-        
-        wb = Workbook()
-        wb.remove(wb.active)  # Remove default sheet
-        
-        sheet_num = 1
+        output_format = params.get("output_format", "xlsx")
+        pages = _iter_pages(input_path, params)
         
-        with pdfplumber.open(input_path) as pdf:
-            for page_idx, page in enumerate(pdf.pages, 1):
-                # Extract tables
-                tables = page.extract_tables()
-                
-                if tables:
-                    for table_idx, table in enumerate(tables, 1):
-                        sheet_name = f"Page{page_idx}_Table{table_idx}"[:31]  # Max 31 char sheet name
-                        ws = wb.create_sheet(title=sheet_name)
-                        
-                        for row_idx, row in enumerate(table, 1):
-                            for col_idx, cell in enumerate(row, 1):
-                                ws.cell(row=row_idx, column=col_idx, value=cell)
-                
-                # Optionally extract text
-                if extract_text:
-                    text = page.extract_text()
-                    if text:
-                        sheet_name = f"Text_Page{page_idx}"[:31]
-                        ws = wb.create_sheet(title=sheet_name)
-                        ws.cell(row=1, column=1, value=text)
+        if output_format == "csv":
+            output_path = os.path.join(output_dir, "output.zip")
+            with stage("extract"):
+                _write_csv_zip(pages, output_path)
+        else:
+            output_path = os.path.join(output_dir, "output.xlsx")
+            with stage("extract"):
+                _write_xlsx(pages, output_path)
         
-        wb.save(output_path)
         return {"file_path": output_path}
     
     except Exception as e:
@@ -0,0 +1,136 @@
+"""
+Minimal streaming PDF writer for image-only documents.
+
+Objects are written to the output file as soon as they are added, so only
+the page currently being built is ever held in memory. Image data can be
+passed as raw encoded bytes (JPEG, JPEG2000, PNG IDAT data) and is embedded
+without being decoded.
+"""
+import zlib
+
+
+class StreamingPdfWriter:
+    """
+    Write a PDF one page at a time.
+
+    Usage:
+        with StreamingPdfWriter(path) as writer:
+            image_id = writer.add_stream("/Type /XObject /Subtype /Image ...", chunks, length)
+            writer.add_page(595, 842, b"q ... cm /Im0 Do Q", {"Im0": image_id})
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        # offsets[object_id - 1] -> byte offset; catalog and page tree are written last
+        self._offsets = [None, None]
+        self._page_ids = []
+        self._file.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+    @property
+    def page_count(self):
+        return len(self._page_ids)
+
+    def _begin_object(self, obj_id=None):
+        if obj_id is None:
+            self._offsets.append(None)
+            obj_id = len(self._offsets)
+        self._offsets[obj_id - 1] = self._file.tell()
+        self._file.write(f"{obj_id} 0 obj\n".encode())
+        return obj_id
+
+    def _write_object(self, body, obj_id=None):
+        obj_id = self._begin_object(obj_id)
+        self._file.write(body.encode() + b"\nendobj\n")
+        return obj_id
+
+    def add_stream(self, dictionary, chunks, length):
+        """
+        Write a stream object and return its object id.
+
+        Args:
+            dictionary: Dictionary entries without the enclosing << >> and /Length
+            chunks: bytes, or an iterable of bytes chunks totalling `length`
+            length: Exact number of data bytes
+        """
+        if isinstance(chunks, (bytes, bytearray)):
+            chunks = [chunks]
+        obj_id = self._begin_object()
+        self._file.write(f"<< {dictionary} /Length {length} >>\nstream\n".encode())
+        written = 0
+        for chunk in chunks:
+            self._file.write(chunk)
+            written += len(chunk)
+        if written != length:
+            raise ValueError(f"Stream length mismatch: expected {length}, wrote {written}")
+        self._file.write(b"\nendstream\nendobj\n")
+        return obj_id
+
+    def add_page(self, width, height, content, xobjects):
+        """
+        Add a page of the given size (points) drawing `content` with named image XObjects.
+        """
+        content_id = self.add_stream("/Filter /FlateDecode", *_deflated(content))
+        resources = " ".join(f"/{name} {obj_id} 0 R" for name, obj_id in xobjects.items())
+        page_id = self._write_object(
+            f"<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {_num(width)} {_num(height)}] "
+            f"/Resources << /XObject << {resources} >> >> /Contents {content_id} 0 R >>"
+        )
+        self._page_ids.append(page_id)
+        return page_id
+
+    def close(self):
+        if self._file.closed:
+            return
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>", self.PAGES_ID)
+        self._write_object(f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>", self.CATALOG_ID)
+
+        xref_offset = self._file.tell()
+        lines = [f"xref\n0 {len(self._offsets) + 1}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{offset:010d} 00000 n \n" for offset in self._offsets)
+        lines.append(
+            f"trailer\n<< /Size {len(self._offsets) + 1} /Root {self.CATALOG_ID} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n"
+        )
+        self._file.write("".join(lines).encode())
+        self._file.close()
+
+
+def _deflated(data):
+    compressed = zlib.compress(data)
+    return compressed, len(compressed)
+
+
+def _num(value):
+    """Format a number for a PDF content stream or dictionary."""
+    return f"{value:.4f}".rstrip("0").rstrip(".")
+
+
+def placement_matrix(x, y, width, height, rotation=0):
+    """
+    Return the `cm` operands that draw an image into the box (x, y, width, height).
+
+    `rotation` is the clockwise rotation (0, 90, 180, 270) needed to display
+    the stored image upright; width/height describe the displayed box.
+    """
+    if rotation == 90:
+        values = (0, -height, width, 0, x, y + height)
+    elif rotation == 180:
+        values = (-width, 0, 0, -height, x + width, y + height)
+    elif rotation == 270:
+        values = (0, height, -width, 0, x + width, y)
+    else:
+        values = (width, 0, 0, height, x, y)
+    return " ".join(_num(v) for v in values)
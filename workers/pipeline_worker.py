@@ -0,0 +1,176 @@
+"""
+Worker to run several tools on a document in one task
+
+A pipeline job is an ordered list of steps, e.g.
+merge -> rotate -> metadata -> compress -> protect. The document stays
+open as a pikepdf.Pdf across pikepdf-native steps (merge, unlock, rotate,
+metadata, protect) and is written to a file only for steps run by an
+external tool (compress with gs, watermark, page numbers, OCR), so a
+pipeline of native steps parses its inputs once and writes one output.
+"""
+import os
+import shutil
+from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .storage import intermediate, with_storage
+
+# Steps that edit the open document in place
+PDF_STEPS = {"rotate", "metadata"}
+# Steps run by tools that read and write files
+FILE_STEPS = {"compress", "watermark", "page_numbers", "ocr"}
+# Steps only allowed at one end of the pipeline: merge and unlock decide how
+# the inputs are opened, protect how the result is written
+FIRST_STEPS = {"merge", "unlock"}
+LAST_STEPS = {"protect"}
+STEPS = PDF_STEPS | FILE_STEPS | FIRST_STEPS | LAST_STEPS
+MAX_STEPS = 10
+
+
+def parse_steps(params, input_count=1):
+    """
+    Validate a pipeline's steps.
+
+    Args:
+        params: Job params with "steps": [{"tool": ..., "params": {...}}, ...]
+        input_count: Number of input files
+
+    Returns:
+        List of (tool, params) tuples. Raises ValueError for invalid pipelines.
+    """
+    steps = (params or {}).get("steps")
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("Pipeline needs a non-empty 'steps' list")
+    if len(steps) > MAX_STEPS:
+        raise ValueError(f"Pipelines are limited to {MAX_STEPS} steps")
+
+    parsed = []
+    for index, step in enumerate(steps):
+        if not isinstance(step, dict) or step.get("tool") not in STEPS:
+            raise ValueError(f"Step {index + 1}: tool must be one of {', '.join(sorted(STEPS))}")
+        tool = step["tool"]
+        step_params = step.get("params") or {}
+        if not isinstance(step_params, dict):
+            raise ValueError(f"Step {index + 1}: params must be an object")
+        if tool in FIRST_STEPS and index != 0:
+            raise ValueError(f"Step {index + 1}: {tool} must be the first step")
+        if tool in LAST_STEPS and index != len(steps) - 1:
+            raise ValueError(f"Step {index + 1}: {tool} must be the last step")
+        if tool == "metadata" and step_params.get("action", "set") != "set":
+            raise ValueError(f"Step {index + 1}: only metadata 'set' can be part of a pipeline")
+        if tool == "ocr" and step_params.get("output_format", "pdf") != "pdf":
+            raise ValueError(f"Step {index + 1}: ocr in a pipeline produces a searchable PDF")
+        parsed.append((tool, step_params))
+
+    if input_count > 1 and parsed[0][0] != "merge":
+        raise ValueError("Pipelines with several inputs must start with merge")
+    return parsed
+
+
+def _link(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def _file_tool(tool):
+    """The plain function behind the task for a file step: (job_id, input_path, params) -> result."""
+    if tool == "compress":
+        from .compress_worker import compress
+        return compress
+    if tool == "watermark":
+        from .watermark_worker import apply_watermark
+        return apply_watermark
+    if tool == "page_numbers":
+        from .page_numbers_worker import apply_page_numbers
+        return apply_page_numbers
+    from .ocr_worker import ocr
+    return ocr
+
+
+@celery_app.task(name="run_pipeline")
+@with_storage
+@instrument("run_pipeline")
+def run_pipeline(job_id: str, input_paths: list, params: dict):
+    """
+    Run a pipeline of tools in one task.
+
+    Args:
+        job_id: Unique job identifier
+        input_paths: Input PDFs (several only when the first step is merge)
+        params: dict with key:
+            - steps: List of {"tool": ..., "params": {...}} run in order; tools
+              are merge, unlock, rotate, metadata, compress, watermark,
+              page_numbers, ocr and protect
+
+    Returns:
+        dict with file_path to the output PDF and the tools run
+    """
+    import pikepdf
+    from .rotate_pages_worker import rotate
+    from .metadata_worker import apply_metadata
+    from .protect_pdf_worker import encryption
+
+    output_path = f"/data/{job_id}_pipeline.pdf"
+    pdf = None
+    sources = []
+    try:
+        steps = parse_steps(params, len(input_paths))
+
+        first_tool, first_params = steps[0]
+        with stage("open"):
+            if first_tool == "merge":
+                pdf = pikepdf.Pdf.new()
+                for path in input_paths:
+                    # Copied pages read their streams from the source until saved
+                    sources.append(pikepdf.open(path))
+                    pdf.pages.extend(sources[-1].pages)
+            else:
+                password = first_params.get("password", "") if first_tool == "unlock" else ""
+                pdf = pikepdf.open(input_paths[0], password=password)
+        # A file holding the document as it is now, if there is one: external
+        # tools can read it without the document being written out first
+        current_file = input_paths[0] if first_tool not in FIRST_STEPS else None
+
+        encrypt = None
+        for index, (tool, step_params) in enumerate(steps, start=1):
+            with stage(f"{index}_{tool}"):
+                if tool == "rotate":
+                    rotate(pdf, step_params)
+                    current_file = None
+                elif tool == "metadata":
+                    apply_metadata(pdf, step_params)
+                    current_file = None
+                elif tool == "protect":
+                    encrypt = encryption(step_params)
+                elif tool in FILE_STEPS:
+                    # Tools write next to their input: give each step its own directory
+                    step_dir = intermediate(f"/data/{job_id}_step{index}")
+                    os.makedirs(step_dir, exist_ok=True)
+                    step_input = os.path.join(step_dir, "input.pdf")
+                    if current_file is None:
+                        pdf.save(step_input)
+                    else:
+                        _link(current_file, step_input)
+                    pdf.close()
+                    result = _file_tool(tool)(f"{job_id}_step{index}", step_input, step_params)
+                    current_file = intermediate(result["file_path"])
+                    pdf = pikepdf.open(current_file)
+
+        with stage("save"):
+            if current_file is not None and current_file not in input_paths and encrypt is None:
+                # The last tool's output is already the result
+                pdf.close()
+                os.replace(current_file, output_path)
+            else:
+                pdf.save(output_path, encryption=encrypt)
+        return {"file_path": output_path, "steps": [tool for tool, _ in steps]}
+
+    except pikepdf.PasswordError:
+        raise Exception("Pipeline failed: incorrect password or password-protected PDF (start with an unlock step)")
+    except Exception as e:
+        raise Exception(f"Pipeline failed: {str(e)}")
+    finally:
+        for document in [pdf] + sources:
+            if document is not None:
+                document.close()
@@ -2,11 +2,30 @@
 Worker to protect PDF with password
 """
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .storage import with_storage
 import os
-import pikepdf
+
+
+def encryption(params):
+    """
+    pikepdf.Encryption for the passwords in params (AES-256).
+    """
+    import pikepdf
+
+    user_password = params.get("password", "")
+    owner_password = params.get("owner_password", "")
+
+    if not user_password and not owner_password:
+        raise ValueError("At least one password (user or owner) must be provided")
+
+    # Pikepdf uses user for opening and owner for permissions
+    return pikepdf.Encryption(user=user_password, owner=owner_password or user_password, R=6)
 
 
 @celery_app.task(name="protect_pdf", bind=True)
+@with_storage
+@instrument("protect_pdf")
 def protect_pdf(self, job_id: str, input_path: str, params: dict = None) -> dict:
     """
     Protect PDF with password
@@ -23,6 +42,8 @@ def protect_pdf(self, job_id: str, input_path: str, params: dict = None) -> dict
     Returns:
         dict with file_path to output PDF
     """
+    import pikepdf
+
     if params is None:
         params = {}
     
@@ -30,22 +51,12 @@ def protect_pdf(self, job_id: str, input_path: str, params: dict = None) -> dict
     output_path = os.path.join(output_dir, "protected.pdf")
     
     try:
-        user_password = params.get("password", "")
-        owner_password = params.get("owner_password", "")
-        
-        if not user_password and not owner_password:
-            raise ValueError("At least one password (user or owner) must be provided")
+        # Set encryption with passwords
+        encrypt = encryption(params)
         
         with pikepdf.open(input_path) as pdf:
-            # Set encryption with passwords
-            # Pikepdf uses user_password for opening and owner_password for permissions
-            encryption_params = {
-                "user_password": user_password,
-                "owner_password": owner_password or user_password,
-                "R": 5,  # Use R=5 for better encryption (AES-256)
-            }
-            
-            pdf.save(output_path, encryption=pikepdf.Encryption(**encryption_params))
+            with stage("save"):
+                pdf.save(output_path, encryption=encrypt)
         
         return {"file_path": output_path}
     
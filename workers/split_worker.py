@@ -1,8 +1,11 @@
 import os
-import pikepdf
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .storage import with_storage
 
 @celery_app.task(name="split_pdf")
+@with_storage
+@instrument("split_pdf")
 def split_pdf(job_id: str, input_path: str, params: dict):
     """
     Split a PDF into multiple files.
@@ -12,12 +15,14 @@ def split_pdf(job_id: str, input_path: str, params: dict):
     
     For MVP, we just split every page into a separate PDF if no params,
     or extract specific pages if params provided.
+
+    Returns the directory of per-page PDFs; it is served as a zip.
     """
+    import pikepdf
+
     output_dir = f"/data/{job_id}_split"
     os.makedirs(output_dir, exist_ok=True)
-    
-    output_files = []
-    
+
     try:
         with pikepdf.Pdf.open(input_path) as pdf:
             # Simple implementation: extract defined pages or all
@@ -26,17 +31,11 @@ def split_pdf(job_id: str, input_path: str, params: dict):
                 dst = pikepdf.Pdf.new()
                 dst.pages.append(page)
                 out_name = os.path.join(output_dir, f"page_{i+1}.pdf")
-                dst.save(out_name)
+                with stage("save"):
+                    dst.save(out_name)
                 dst.close()
-                output_files.append(out_name)
-        
-        # Zip the results
-        import zipfile
-        zip_path = f"/data/{job_id}.zip"
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for file in output_files:
-                zipf.write(file, os.path.basename(file))
-        
-        return zip_path
+
+        # The API zips the directory on the fly when it is downloaded
+        return output_dir
     except Exception as exc:
         raise exc
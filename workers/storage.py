@@ -0,0 +1,471 @@
+"""
+Storage for job inputs and results, shared by the API and the workers.
+
+Jobs keep passing plain paths under DATA_DIR ("/data/<job_id>/input.pdf");
+relative to DATA_DIR a path doubles as its object key. Two backends:
+
+  local  (STORAGE_BACKEND=local, the default) - DATA_DIR is a volume shared
+         by every process; publishing and localizing are no-ops.
+  s3     (STORAGE_BACKEND=s3) - objects live in an S3/MinIO bucket and
+         DATA_DIR is node-local scratch. Inputs are pulled through a
+         read-through LRU disk cache, results are pushed with streaming
+         multipart uploads, downloads use ranged GETs or presigned URLs.
+
+Objects are written once under job-unique keys, so cached copies never go
+stale. Task modules apply @with_storage between @celery_app.task and
+@instrument to localize their input paths and publish their result, and
+mark scratch files with intermediate(path) so they are removed when the
+task finishes, and files the result refers to with asset(path) so they
+are published with it.
+
+Settings (environment):
+    STORAGE_BACKEND          local | s3
+    STORAGE_BUCKET           bucket name (default "pdfsimple", created on first use)
+    STORAGE_ENDPOINT_URL     S3 endpoint (default http://minio:9000; empty for AWS)
+    STORAGE_PUBLIC_URL       endpoint clients reach for presigned URLs (default: STORAGE_ENDPOINT_URL)
+    STORAGE_REGION           default us-east-1
+    STORAGE_PART_SIZE        multipart part size in bytes (default 16 MiB)
+    STORAGE_CACHE_DIR        input cache (default DATA_DIR/.cache, same filesystem for hard links)
+    STORAGE_CACHE_BYTES      cache budget in bytes (default 2 GiB)
+    STORAGE_URL_EXPIRES      presigned URL lifetime in seconds (default 3600)
+Credentials come from the minio_root_user / minio_root_password secrets,
+falling back to boto3's default chain.
+"""
+import fcntl
+import functools
+import hashlib
+import os
+import re
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DATA_DIR = os.environ.get("DATA_DIR", "/data")
+CHUNK_SIZE = 256 * 1024
+
+_intermediates = ContextVar("pdfsimple_task_intermediates", default=None)
+_assets = ContextVar("pdfsimple_task_assets", default=None)
+
+
+def _secret(name):
+    # Same lookup as backend/utils.get_secret: Docker secret file, then env
+    path = f"/run/secrets/{name}"
+    if os.path.exists(path):
+        with open(path) as f:
+            return f.read().strip()
+    return os.environ.get(name.upper())
+
+
+def _natural_key(name):
+    # page_2.pdf before page_10.pdf
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+class LocalStorage:
+    """DATA_DIR is shared by the API and every worker."""
+
+    remote = False
+
+    def __init__(self, root=DATA_DIR):
+        self.root = root
+
+    def publish(self, path):
+        """Make a local file or directory visible to other nodes."""
+
+    def localize(self, path):
+        """Make the object at `path` available on local disk at `path`."""
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return path
+
+    def release(self, path):
+        """Drop the local scratch copy of `path` once it is published."""
+
+    def stat(self, path):
+        """
+        Returns:
+            dict with size, mtime and etag (None if not known cheaply) for a
+            file, {"dir": True} for a directory, or None if nothing is there
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if os.path.isdir(path):
+            return {"dir": True}
+        return {"size": st.st_size, "mtime": st.st_mtime, "etag": None}
+
+    def list(self, path):
+        """(relative name, size, mtime) of every file under a directory, in natural order."""
+        entries = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort(key=_natural_key)
+            for name in sorted(files, key=_natural_key):
+                full = os.path.join(root, name)
+                st = os.stat(full)
+                entries.append((os.path.relpath(full, path), st.st_size, st.st_mtime))
+        return entries
+
+    def iter_range(self, path, start=0, end=None, chunk_size=CHUNK_SIZE):
+        """Yield bytes [start, end] (inclusive; end=None reads to EOF)."""
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def presigned_url(self, path, method="GET", expires=None, filename=None):
+        """Direct URL for clients, or None when the backend has none."""
+        return None
+
+
+class S3Storage(LocalStorage):
+    """Objects in an S3/MinIO bucket; DATA_DIR is node-local scratch."""
+
+    remote = True
+
+    def __init__(self, root=DATA_DIR):
+        super().__init__(root)
+        self.bucket = os.environ.get("STORAGE_BUCKET", "pdfsimple")
+        self.endpoint_url = os.environ.get("STORAGE_ENDPOINT_URL", "http://minio:9000") or None
+        self.public_url = os.environ.get("STORAGE_PUBLIC_URL") or self.endpoint_url
+        self.region = os.environ.get("STORAGE_REGION", "us-east-1")
+        self.part_size = int(os.environ.get("STORAGE_PART_SIZE", 16 * 1024 * 1024))
+        self.url_expires = int(os.environ.get("STORAGE_URL_EXPIRES", 3600))
+        self.cache = InputCache(
+            os.environ.get("STORAGE_CACHE_DIR") or os.path.join(root, ".cache"),
+            int(os.environ.get("STORAGE_CACHE_BYTES", 2 * 1024 ** 3)),
+        )
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _client(self, endpoint_url=None):
+        # boto3 is imported on first use; clients are per process (prefork children)
+        key = (os.getpid(), endpoint_url or self.endpoint_url)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    import boto3
+                    from botocore.config import Config
+                    client = boto3.client(
+                        "s3",
+                        endpoint_url=key[1],
+                        region_name=self.region,
+                        aws_access_key_id=_secret("minio_root_user"),
+                        aws_secret_access_key=_secret("minio_root_password"),
+                        config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+                    )
+                    if endpoint_url is None:
+                        self._ensure_bucket(client)
+                    self._clients[key] = client
+        return client
+
+    def _ensure_bucket(self, client):
+        from botocore.exceptions import ClientError
+        try:
+            client.head_bucket(Bucket=self.bucket)
+        except ClientError:
+            try:
+                client.create_bucket(Bucket=self.bucket)
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                    raise
+
+    def key(self, path):
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+        if relative.startswith(".."):
+            raise ValueError(f"{path} is outside {self.root}")
+        return relative.replace(os.sep, "/")
+
+    def _transfer_config(self):
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(
+            multipart_threshold=self.part_size, multipart_chunksize=self.part_size, max_concurrency=4
+        )
+
+    def publish(self, path):
+        if os.path.isdir(path):
+            for name, _, _ in super().list(path):
+                self.publish(os.path.join(path, name))
+            return
+        # Streams the file from disk, in parallel parts above part_size
+        try:
+            self._client().upload_file(path, self.bucket, self.key(path), Config=self._transfer_config())
+        except Exception as e:
+            raise Exception(f"Upload of {path} failed: {str(e)}")
+
+    def localize(self, path):
+        if os.path.exists(path):
+            return path
+        key = self.key(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.cache.get(key, lambda tmp: self._download(key, tmp), link_to=path)
+        return path
+
+    def _download(self, key, target):
+        try:
+            self._client().download_file(self.bucket, key, target, Config=self._transfer_config())
+        except Exception as e:
+            raise Exception(f"Download of {key} failed: {str(e)}")
+
+    def release(self, path):
+        _remove(path)
+
+    def stat(self, path):
+        from botocore.exceptions import ClientError
+        client = self._client()
+        key = self.key(path)
+        try:
+            head = client.head_object(Bucket=self.bucket, Key=key)
+            return {
+                "size": head["ContentLength"],
+                "mtime": head["LastModified"].timestamp(),
+                "etag": head["ETag"],
+            }
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+                raise
+        listing = client.list_objects_v2(Bucket=self.bucket, Prefix=key.rstrip("/") + "/", MaxKeys=1)
+        return {"dir": True} if listing.get("KeyCount") else None
+
+    def list(self, path):
+        prefix = self.key(path).rstrip("/") + "/"
+        entries = []
+        paginator = self._client().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                entries.append((item["Key"][len(prefix):], item["Size"], item["LastModified"].timestamp()))
+        return sorted(entries, key=lambda entry: _natural_key(entry[0]))
+
+    def iter_range(self, path, start=0, end=None, chunk_size=CHUNK_SIZE):
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        response = self._client().get_object(Bucket=self.bucket, Key=self.key(path), Range=byte_range)
+        body = response["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def delete_prefix(self, prefix):
+        """
+        Delete every object whose key starts with `prefix` (e.g. a job id).
+
+        Returns:
+            Bytes deleted
+        """
+        client = self._client()
+        freed = 0
+        paginator = client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            contents = page.get("Contents", [])
+            if contents:
+                client.delete_objects(
+                    Bucket=self.bucket, Delete={"Objects": [{"Key": item["Key"]} for item in contents], "Quiet": True}
+                )
+                freed += sum(item["Size"] for item in contents)
+        return freed
+
+    def presigned_url(self, path, method="GET", expires=None, filename=None):
+        params = {"Bucket": self.bucket, "Key": self.key(path)}
+        if method == "GET" and filename:
+            params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+        operation = {"GET": "get_object", "PUT": "put_object"}[method]
+        self._client()  # creates the bucket on first use
+        # Signed for the endpoint clients reach, which may differ from ours
+        return self._client(self.public_url).generate_presigned_url(
+            operation, Params=params, ExpiresIn=expires or self.url_expires
+        )
+
+
+class InputCache:
+    """
+    Read-through LRU cache of downloaded objects on local disk.
+
+    Files are named by a hash of their key and shared by all worker
+    processes on the node; recency is the file's mtime. Eviction and
+    linking a cached file out hold an exclusive lock on LOCK_NAME in the
+    cache directory, so one process can't evict a file another is about
+    to link. Downloads run outside the lock.
+    """
+
+    LOCK_NAME = ".lock"
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        _, ext = os.path.splitext(key)
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ext)
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, self.LOCK_NAME), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _link(cached, target):
+        try:
+            os.link(cached, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Cache on another filesystem
+            shutil.copyfile(cached, target)
+
+    def get(self, key, fetch, link_to=None):
+        """
+        Path of the cached copy of `key`, calling fetch(tmp_path) to fill it on a miss.
+
+        With link_to, the cached copy is also hard-linked (or copied) there
+        before the lock is released.
+        """
+        path = self._path(key)
+        with self._locked():
+            if os.path.exists(path):
+                os.utime(path)
+                if link_to:
+                    self._link(path, link_to)
+                return path
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            fetch(tmp)
+            with self._locked():
+                os.replace(tmp, path)
+                if link_to:
+                    self._link(path, link_to)
+                self._evict(keep=path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return path
+
+    def evict(self, keep=None):
+        """Remove least recently used files until the cache fits its budget."""
+        with self._locked():
+            self._evict(keep)
+
+    def _evict(self, keep=None):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp") and entry.name != self.LOCK_NAME:
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def get_storage():
+    backend = os.environ.get("STORAGE_BACKEND", "local")
+    if backend == "s3":
+        return S3Storage()
+    if backend == "local":
+        return LocalStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+storage = get_storage()
+
+
+def _path_args(args):
+    paths = []
+    for arg in args:
+        if isinstance(arg, str) and arg.startswith(DATA_DIR + "/"):
+            paths.append(arg)
+        elif isinstance(arg, (list, tuple)):
+            paths.extend(p for p in arg if isinstance(p, str) and p.startswith(DATA_DIR + "/"))
+    return paths
+
+
+def intermediate(path):
+    """
+    Mark a file or directory the current task creates as scratch: it is
+    deleted when the task finishes unless it is the task's result. Returns path.
+    """
+    paths = _intermediates.get()
+    if paths is not None:
+        paths.append(path)
+    return path
+
+
+def asset(path):
+    """
+    Mark a file the current task creates that its result refers to (e.g. the
+    page images an HTML result links to): it is published with the result
+    and, with a remote backend, its local copy released. Returns path.
+    """
+    paths = _assets.get()
+    if paths is not None:
+        paths.append(path)
+    return path
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def with_storage(func):
+    """
+    Localize a task's input paths before it runs and publish its result after.
+
+    Apply between @celery_app.task and @instrument. Intermediates are removed
+    when the task finishes; with a remote backend, so are the node-local
+    copies of inputs, result and assets.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        inputs = _path_args(args)
+        output = None
+        scratch = []
+        assets = []
+        token = _intermediates.set(scratch)
+        assets_token = _assets.set(assets)
+        try:
+            for path in inputs:
+                storage.localize(path)
+            result = func(*args, **kwargs)
+            output = result.get("file_path") if isinstance(result, dict) else result
+            if isinstance(output, str) and output not in inputs and os.path.exists(output):
+                storage.publish(output)
+                for path in assets:
+                    storage.publish(path)
+            else:
+                output = None
+            return result
+        finally:
+            _intermediates.reset(token)
+            _assets.reset(assets_token)
+            result_path = os.path.abspath(output) if isinstance(output, str) else None
+            for path in scratch:
+                if os.path.abspath(path) != result_path:
+                    _remove(path)
+            if storage.remote:
+                for path in inputs + ([output] + assets if output else []):
+                    storage.release(path)
+    return wrapper
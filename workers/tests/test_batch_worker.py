@@ -0,0 +1,67 @@
+import os
+import tempfile
+import uuid
+import pytest
+from celery import states
+try:
+    from workers.batch_worker import run_batch
+    from workers.celery_app import celery_app
+    from workers import rotate_pages_worker  # noqa: F401 registers rotate_pages
+except ImportError:
+    from batch_worker import run_batch
+    from celery_app import celery_app
+    import rotate_pages_worker  # noqa: F401
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    from celery.backends.cache import CacheBackend
+
+    backend = CacheBackend(app=celery_app, url="memory://")
+    monkeypatch.setattr(type(celery_app), "backend", property(lambda app: backend))
+    return backend
+
+
+def _item(num_pages=2, missing=False):
+    import pikepdf
+    path = os.path.join(tempfile.mkdtemp(), "input.pdf")
+    if not missing:
+        pdf = pikepdf.Pdf.new()
+        for _ in range(num_pages):
+            pdf.add_blank_page()
+        pdf.save(path)
+        pdf.close()
+    job_id = str(uuid.uuid4())
+    return {"id": job_id, "args": [job_id, path, {"angle": 90}]}
+
+
+def test_each_job_gets_its_own_result(backend):
+    items = [_item(), _item(missing=True), _item(3)]
+
+    result = run_batch.apply(args=["rotate_pages", items]).get()
+
+    assert result["succeeded"] == 2 and result["failed"] == 1
+    assert [backend.get_state(item["id"]) for item in items] == [states.SUCCESS, states.FAILURE, states.SUCCESS]
+    assert os.path.exists(backend.get_result(items[2]["id"])["file_path"])
+    assert "No such file" in str(backend.get_result(items[1]["id"]))
+
+
+def test_redelivered_batch_skips_finished_jobs_and_fails_the_one_that_was_running(backend):
+    done, running, waiting = _item(), _item(), _item()
+    backend.store_result(done["id"], {"file_path": "/data/earlier/output.pdf"}, states.SUCCESS)
+    backend.store_result(running["id"], {"pid": 1, "hostname": "lost"}, states.STARTED)
+
+    result = run_batch.apply(args=["rotate_pages", [done, running, waiting]]).get()
+
+    assert result["succeeded"] == 1 and result["failed"] == 1
+    # Left as it was, not run a second time
+    assert backend.get_result(done["id"]) == {"file_path": "/data/earlier/output.pdf"}
+    assert backend.get_state(running["id"]) == states.FAILURE
+    assert "Worker lost" in str(backend.get_result(running["id"]))
+    assert backend.get_state(waiting["id"]) == states.SUCCESS
+
+
+def test_only_light_tasks_can_be_batched(backend):
+    outcome = run_batch.apply(args=["compress_pdf", [_item()]])
+    assert outcome.failed()
+    assert "cannot be batched" in str(outcome.result)
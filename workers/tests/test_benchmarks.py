@@ -0,0 +1,52 @@
+import os
+import tempfile
+try:
+    from workers.benchmarks import corpus
+    from workers.benchmarks.run import CASES, _machine, compare, run_case
+except ImportError:
+    from benchmarks import corpus
+    from benchmarks.run import CASES, _machine, compare, run_case
+
+
+def test_corpus_is_reproducible():
+    import pikepdf
+    tmp_dir = tempfile.mkdtemp()
+    first = corpus.build_pdf("mixed", 4, os.path.join(tmp_dir, "a.pdf"))
+    second = corpus.build_pdf("mixed", 4, os.path.join(tmp_dir, "b.pdf"))
+    with open(first, "rb") as a, open(second, "rb") as b:
+        assert a.read() == b.read()
+    with pikepdf.open(first) as pdf:
+        assert len(pdf.pages) == 4
+        assert "/XObject" in pdf.pages[1].Resources
+
+
+def test_run_case_records_metrics():
+    case = next(case for case in CASES if case.name == "rotate_pages")
+    metrics = run_case(case, 3, tempfile.mkdtemp())
+    assert metrics["pages"] == 3
+    assert metrics["wall_seconds"] > 0
+    assert metrics["peak_rss_bytes"] > 0
+    assert metrics["output_bytes"] > 0
+    assert "save" in metrics["stages"]
+
+
+def test_compare_flags_regressions_past_threshold():
+    baseline = {
+        "machine": _machine(),
+        "results": {"merge_pdfs/text-50": {"wall_seconds": 1.0, "peak_rss_bytes": 100, "output_bytes": 100}},
+    }
+    slower = {"merge_pdfs/text-50": {"wall_seconds": 1.5, "peak_rss_bytes": 110, "output_bytes": 100}}
+    same = {"merge_pdfs/text-50": {"wall_seconds": 1.1, "peak_rss_bytes": 100, "output_bytes": 105}}
+    assert len(compare(slower, baseline)) == 1
+    assert compare(same, baseline) == []
+
+
+def test_compare_other_machine_checks_output_size_only():
+    baseline = {
+        "machine": {"platform": "reference", "cpus": 64, "python": "3.11.7"},
+        "results": {"merge_pdfs/text-50": {"wall_seconds": 1.0, "peak_rss_bytes": 100, "output_bytes": 100}},
+    }
+    slower = {"merge_pdfs/text-50": {"wall_seconds": 3.0, "peak_rss_bytes": 300, "output_bytes": 100}}
+    larger = {"merge_pdfs/text-50": {"wall_seconds": 1.0, "peak_rss_bytes": 100, "output_bytes": 150}}
+    assert compare(slower, baseline) == []
+    assert len(compare(larger, baseline)) == 1
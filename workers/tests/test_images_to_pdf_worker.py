@@ -0,0 +1,91 @@
+import os
+import tempfile
+try:
+    from workers.images_to_pdf_worker import images_to_pdf
+except ImportError:
+    from images_to_pdf_worker import images_to_pdf
+
+
+def test_images_to_pdf_passthrough_keeps_jpeg_bytes():
+    import pikepdf
+    from PIL import Image
+    tmp_dir = tempfile.mkdtemp()
+    jpg_path = os.path.join(tmp_dir, "photo.jpg")
+    png_path = os.path.join(tmp_dir, "scan.png")
+    Image.new("RGB", (400, 300), (200, 10, 10)).save(jpg_path, quality=80)
+    Image.new("RGB", (300, 400), (10, 200, 10)).save(png_path)
+
+    result = images_to_pdf("testjob", [jpg_path, png_path], {"page_size": "A4", "orientation": "auto"})
+
+    with pikepdf.open(result["file_path"]) as pdf:
+        assert len(pdf.pages) == 2
+        # Landscape image on a landscape A4 page, portrait image on a portrait page
+        assert [float(v) for v in pdf.pages[0].MediaBox] == [0, 0, 842, 595]
+        assert [float(v) for v in pdf.pages[1].MediaBox] == [0, 0, 595, 842]
+
+        jpeg = next(iter(pdf.pages[0].images.values()))
+        assert jpeg.Filter == pikepdf.Name.DCTDecode
+        with open(jpg_path, "rb") as f:
+            assert jpeg.read_raw_bytes() == f.read()
+
+        png = next(iter(pdf.pages[1].images.values()))
+        assert png.Filter == pikepdf.Name.FlateDecode
+        assert png.DecodeParms.Predictor == 15
+
+
+def test_images_to_pdf_multipage_tiff_and_pixel_budget():
+    import pikepdf
+    from PIL import Image
+    tmp_dir = tempfile.mkdtemp()
+    fax_path = os.path.join(tmp_dir, "fax.tif")
+    big_path = os.path.join(tmp_dir, "big.tif")
+    frames = [Image.new("1", (800, 1000), color) for color in (0, 1, 0)]
+    frames[0].save(fax_path, save_all=True, append_images=frames[1:], compression="group4")
+    Image.new("RGB", (2000, 1500), (0, 0, 255)).save(big_path, compression=None)
+
+    result = images_to_pdf("testjob", [fax_path, big_path], {"page_size": "fit", "max_pixels": 100_000})
+
+    with pikepdf.open(result["file_path"]) as pdf:
+        assert len(pdf.pages) == 4
+        for page in pdf.pages[:3]:
+            for image in page.images.values():
+                assert image.Filter == pikepdf.Name.CCITTFaxDecode
+        big = next(iter(pdf.pages[3].images.values()))
+        assert big.Width * big.Height <= 100_000
+
+
+def test_images_to_pdf_strip_downsampling_matches_whole_decode():
+    import pikepdf
+    from PIL import Image, ImageChops
+    tmp_dir = tempfile.mkdtemp()
+    tif_path = os.path.join(tmp_dir, "noise.tif")
+    # Several strips' worth of rows, not a multiple of the reduce factor
+    Image.effect_noise((701, 1033), 80).save(tif_path, compression=None)
+
+    result = images_to_pdf("testjob", [tif_path], {"page_size": "fit", "max_pixels": 100_000})
+
+    with pikepdf.open(result["file_path"]) as pdf:
+        image = pikepdf.PdfImage(next(iter(pdf.pages[0].images.values()))).as_pil_image()
+    expected = Image.open(tif_path).reduce(3)
+    assert image.size == expected.size
+    assert ImageChops.difference(image, expected).getbbox() is None
+
+
+def test_images_to_pdf_passes_through_g4_scan_above_pillow_bomb_limit():
+    import pikepdf
+    from PIL import Image
+    tmp_dir = tempfile.mkdtemp()
+    scan_path = os.path.join(tmp_dir, "scan.tif")
+    # 182 MP, past the 2 * Image.MAX_IMAGE_PIXELS Pillow refuses to open
+    size = (14000, 13000)
+    assert size[0] * size[1] > 2 * Image.MAX_IMAGE_PIXELS
+    Image.new("1", size, 1).save(scan_path, compression="group4")
+
+    result = images_to_pdf("testjob", [scan_path], {"page_size": "fit"})
+
+    with pikepdf.open(result["file_path"]) as pdf:
+        (page,) = pdf.pages
+        images = list(page.images.values())
+        assert all(image.Filter == pikepdf.Name.CCITTFaxDecode for image in images)
+        assert sum(image.Height for image in images) == size[1]
+        assert {int(image.Width) for image in images} == {size[0]}
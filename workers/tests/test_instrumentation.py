@@ -0,0 +1,78 @@
+import os
+import tempfile
+try:
+    from workers.instrumentation import instrument, stage, STAGE_DURATION
+except ImportError:
+    from instrumentation import instrument, stage, STAGE_DURATION
+
+
+def test_instrument_attaches_timings_to_result():
+    import pikepdf
+    tmp_dir = tempfile.mkdtemp()
+    input_path = os.path.join(tmp_dir, "in.pdf")
+    output_path = os.path.join(tmp_dir, "out.pdf")
+    pdf = pikepdf.Pdf.new()
+    for _ in range(3):
+        pdf.add_blank_page()
+    pdf.save(input_path)
+    pdf.close()
+
+    @instrument("test_tool")
+    def task(job_id, input_path, params):
+        with stage("save"):
+            with pikepdf.open(input_path) as pdf:
+                pdf.save(output_path)
+        with stage("save"):
+            pass
+        return {"file_path": output_path}
+
+    result = task("testjob", input_path, {})
+
+    timings = result["timings"]
+    assert timings["pages"] == 3
+    assert timings["bytes_in"] == os.path.getsize(input_path)
+    assert timings["bytes_out"] == os.path.getsize(output_path)
+    assert set(timings["stages"]) == {"save"}
+    assert timings["stages"]["save"] <= timings["total"]
+    assert timings["peak_rss_bytes"] > 0
+    assert STAGE_DURATION.labels("test_tool", "save")._sum.get() > 0
+
+
+def test_stage_outside_task_is_noop():
+    with stage("render"):
+        value = 1
+    assert value == 1
+
+
+def test_instrument_uses_counted_pages_and_sums_output_directories(monkeypatch):
+    import pikepdf
+    try:
+        from workers import instrumentation
+        from workers.utils import count_pages
+    except ImportError:
+        import instrumentation
+        from utils import count_pages
+    tmp_dir = tempfile.mkdtemp()
+    input_path = os.path.join(tmp_dir, "in.pdf")
+    output_dir = os.path.join(tmp_dir, "pages")
+    pdf = pikepdf.Pdf.new()
+    for _ in range(4):
+        pdf.add_blank_page()
+    pdf.save(input_path)
+    pdf.close()
+
+    @instrument("test_split")
+    def task(job_id, input_path, params):
+        os.makedirs(output_dir)
+        for index in range(count_pages(input_path)):
+            with open(os.path.join(output_dir, f"page_{index + 1}.pdf"), "wb") as f:
+                f.write(b"x" * 100)
+        return {"file_path": output_dir}
+
+    # The input was counted by the task: it must not be opened again
+    reopened = []
+    monkeypatch.setattr(instrumentation, "_count_pages", lambda paths: reopened.extend(paths) or 0)
+    timings = task("testjob", input_path, {})["timings"]
+    assert timings["pages"] == 4
+    assert timings["bytes_out"] == 400
+    assert reopened == []
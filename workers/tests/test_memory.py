@@ -0,0 +1,57 @@
+import os
+import tempfile
+import pytest
+try:
+    from workers import memory
+except ImportError:
+    import memory
+
+MB = memory.MB
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_LIMIT", 1000 * MB)
+    monkeypatch.setattr(memory, "SOFT_LIMIT", 750 * MB)
+    rss = {"bytes": 100 * MB}
+    monkeypatch.setattr(memory, "current_rss", lambda: rss["bytes"])
+    return rss
+
+
+def test_page_bytes_follows_page_size_and_dpi():
+    import pikepdf
+
+    path = os.path.join(tempfile.mkdtemp(), "a4.pdf")
+    pdf = pikepdf.new()
+    pdf.add_blank_page(page_size=(595, 842))
+    pdf.add_blank_page(page_size=(612, 792))
+    pdf.save(path)
+
+    # Sized by the largest page: A4 at 150 DPI is 1239 x 1754 pixels
+    assert memory.page_bytes(path, 150) == 1239 * 1754 * 3
+    assert memory.page_bytes(path, 300, copies=2) == 2479 * 3508 * 3 * 2
+
+
+def test_batches_cover_every_page_and_shrink_as_memory_fills(limits):
+    batches = []
+    for start, end in memory.page_batches(30, 50 * MB, "test", max_pages=16):
+        batches.append((start, end))
+        limits["bytes"] += 150 * MB
+
+    # (750 - 100) MB free below the soft limit, then 500 MB, then 350 MB
+    assert batches == [(0, 13), (13, 23), (23, 30)]
+
+
+def test_one_page_at_a_time_past_soft_limit(limits):
+    limits["bytes"] = 800 * MB
+    assert list(memory.page_batches(3, 50 * MB, "test")) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_batches_are_capped(limits):
+    assert list(memory.page_batches(10, 1 * MB, "test", max_pages=4)) == [(0, 4), (4, 8), (8, 10)]
+
+
+def test_page_over_hard_limit_fails_clearly(limits):
+    limits["bytes"] = 900 * MB
+    with pytest.raises(memory.MemoryLimitExceeded, match="ocr_pdf needs about 200 MB per page"):
+        list(memory.page_batches(3, 200 * MB, "ocr_pdf"))
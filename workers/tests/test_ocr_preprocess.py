@@ -0,0 +1,81 @@
+import os
+import random
+import tempfile
+import pytest
+try:
+    from workers import ocr_preprocess
+    from workers.benchmarks import corpus
+except ImportError:
+    import ocr_preprocess
+    from benchmarks import corpus
+
+
+def _apply(matrix, x, y):
+    a, b, c, d, e, f = matrix
+    return round(a * x + c * y + e, 3), round(b * x + d * y + f, 3)
+
+
+def test_dpi_follows_text_size_and_scan_resolution():
+    # Text: small type needs more pixels, large type fewer
+    assert ocr_preprocess.choose_dpi([10] * 20, []) == 230
+    assert ocr_preprocess.choose_dpi([7] * 20, []) == 329
+    assert ocr_preprocess.choose_dpi([24] * 20, []) == ocr_preprocess.MIN_DPI
+    assert ocr_preprocess.choose_dpi([4] * 20, []) == ocr_preprocess.MAX_DPI
+    # A few footnotes count, a single stray glyph doesn't
+    assert ocr_preprocess.choose_dpi([12] * 16 + [8] * 4, []) == 288
+    assert ocr_preprocess.choose_dpi([12] * 99 + [3], []) == 192
+    # Scans: never above the scan's own resolution or what body text needs
+    assert ocr_preprocess.choose_dpi([], [200]) == 200
+    assert ocr_preprocess.choose_dpi([], [600]) == 230
+    assert ocr_preprocess.choose_dpi([], [96]) == ocr_preprocess.MIN_DPI
+    assert ocr_preprocess.choose_dpi([], []) == ocr_preprocess.DEFAULT_DPI
+
+
+def test_page_dpis_reads_text_and_images():
+    path = corpus.build_pdf("mixed", 4, os.path.join(tempfile.mkdtemp(), "mixed.pdf"))
+    # 11 pt text, a 1200 px photo 6.5 in wide, a 200 DPI scan, a 9 pt table
+    assert ocr_preprocess.page_dpis(path) == [209, 185, 200, 256]
+
+
+@pytest.mark.parametrize("skew", [-3.3, 0.0, 1.7])
+def test_preprocess_binarizes_and_deskews(skew):
+    np = pytest.importorskip("numpy")
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = random.Random(0)
+    page = Image.new("L", (1700, 2200), 230)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=30)
+    for y in range(150, 2000, 45):
+        draw.text((150, y), corpus._sentence(rng, 10), fill=40, font=font)
+
+    result, angle = ocr_preprocess.preprocess(page.rotate(skew, fillcolor=230))
+
+    assert result.mode == "L" and result.size == page.size
+    assert set(np.unique(np.asarray(result))) <= {0, 255}
+    assert angle == pytest.approx(-skew, abs=0.15)
+
+
+def test_blank_page_is_left_alone():
+    pytest.importorskip("numpy")
+    from PIL import Image
+
+    result, angle = ocr_preprocess.preprocess(Image.new("L", (800, 1000), 255))
+    assert angle == 0.0 and result.getextrema() == (255, 255)
+
+
+def test_text_layer_matrix_maps_layer_onto_page():
+    # Layer rendered from a 612 x 792 page at 150 DPI and back to points
+    assert _apply(ocr_preprocess.text_layer_matrix([0, 0, 612, 792], 0, (612, 792), 0), 100, 50) == (100, 50)
+    # Offset MediaBox and a slightly different layer size
+    matrix = ocr_preprocess.text_layer_matrix([10, 20, 622, 812], 0, (306, 396), 0)
+    assert _apply(matrix, 306, 396) == (622, 812)
+    # Rotated pages are rendered as viewed: the layer's bottom-left is the
+    # page corner that is displayed bottom-left
+    assert _apply(ocr_preprocess.text_layer_matrix([0, 0, 612, 792], 90, (792, 612), 0), 0, 0) == (612, 0)
+    assert _apply(ocr_preprocess.text_layer_matrix([0, 0, 612, 792], 180, (612, 792), 0), 0, 0) == (612, 792)
+    assert _apply(ocr_preprocess.text_layer_matrix([0, 0, 612, 792], 270, (792, 612), 0), 0, 0) == (0, 792)
+    # Deskewing turned the page about its centre: the centre stays, the rest turns back
+    matrix = ocr_preprocess.text_layer_matrix([0, 0, 612, 792], 0, (612, 792), 90)
+    assert _apply(matrix, 306, 396) == (306, 396)
+    assert _apply(matrix, 306, 496) == (406, 396)
@@ -0,0 +1,36 @@
+import os
+import re
+import tempfile
+try:
+    from workers.pdf_to_html_worker import pdf_to_html
+except ImportError:
+    from pdf_to_html_worker import pdf_to_html
+
+
+def _make_text_pdf(path, num_pages):
+    import pikepdf
+    pdf = pikepdf.Pdf.new()
+    font = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name.Helvetica
+    ))
+    for i in range(num_pages):
+        page = pdf.add_blank_page(page_size=(612, 792))
+        page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+        page.Contents = pdf.make_stream(f"BT /F1 24 Tf 72 700 Td (Hello page {i + 1}) Tj ET".encode())
+    pdf.save(path)
+    pdf.close()
+
+
+def test_pdf_to_html_writes_pages_in_order():
+    tmp_dir = tempfile.mkdtemp()
+    input_path = os.path.join(tmp_dir, "in.pdf")
+    _make_text_pdf(input_path, 30)
+
+    result = pdf_to_html("testjob", input_path, {"workers": 3, "chunk_pages": 4})
+
+    with open(result["file_path"], encoding="utf-8") as f:
+        html = f.read()
+    assert html.startswith("<!DOCTYPE html>")
+    assert html.endswith("</html>")
+    assert re.findall(r"<h1>Page (\d+)</h1>", html) == [str(i) for i in range(1, 31)]
+    assert "Hello page 30" in html
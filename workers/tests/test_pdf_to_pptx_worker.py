@@ -0,0 +1,95 @@
+import os
+import tempfile
+import pytest
+try:
+    from workers import pdf_to_pptx_worker
+except ImportError:
+    import pdf_to_pptx_worker
+
+
+def _make_pdf(path, page_sizes):
+    import pikepdf
+    pdf = pikepdf.Pdf.new()
+    for size in page_sizes:
+        pdf.add_blank_page(page_size=size)
+    pdf.save(path)
+    pdf.close()
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Render pages with PIL instead of Poppler, recording each requested range."""
+    pdf2image = pytest.importorskip("pdf2image")
+    pytest.importorskip("pptx")
+    import pikepdf
+    from PIL import Image
+
+    calls = []
+
+    def convert_from_path(path, dpi=200, first_page=None, last_page=None):
+        calls.append((first_page, last_page))
+        with pikepdf.open(path) as pdf:
+            boxes = [pdf.pages[i].mediabox for i in range(first_page - 1, last_page)]
+        return [
+            Image.new("RGB", (int(float(box[2]) * dpi / 72), int(float(box[3]) * dpi / 72)), (index * 40, 0, 0))
+            for index, box in enumerate(boxes, first_page)
+        ]
+
+    monkeypatch.setattr(pdf2image, "convert_from_path", convert_from_path)
+    return calls
+
+
+def _input(page_sizes):
+    input_path = os.path.join(tempfile.mkdtemp(), "input.pdf")
+    _make_pdf(input_path, page_sizes)
+    return input_path
+
+
+def test_pages_are_rendered_in_chunks_and_added_in_order(renders):
+    import io
+    from PIL import Image
+    from pptx import Presentation
+
+    result = pdf_to_pptx_worker.pdf_to_pptx("testjob", _input([(612, 792)] * 5), {"workers": 1, "chunk_pages": 2, "dpi": 36})
+
+    assert renders == [(1, 2), (3, 4), (5, 5)]
+    prs = Presentation(result["file_path"])
+    slides = list(prs.slides)
+    assert len(slides) == 6
+    assert slides[0].shapes.title.text == "PDF Presentation"
+    colors = []
+    for slide in slides[1:]:
+        (picture,) = slide.shapes
+        colors.append(Image.open(io.BytesIO(picture.image.blob)).convert("RGB").getpixel((0, 0))[0])
+    # Page n is drawn in red n * 40 (JPEG may shift it slightly)
+    assert [round(c / 40) for c in colors] == [1, 2, 3, 4, 5]
+
+
+def test_chunks_shrink_to_fit_memory(renders, monkeypatch):
+    # Room for three pages at a time, split across the chunks in flight
+    monkeypatch.setattr(pdf_to_pptx_worker, "batch_size", lambda bytes_per_page, tool, max_pages=None: min(3, max_pages))
+
+    pdf_to_pptx_worker.pdf_to_pptx("testjob", _input([(612, 792)] * 7), {"workers": 1, "chunk_pages": 4, "dpi": 36})
+
+    assert renders == [(1, 3), (4, 6), (7, 7)]
+
+
+def test_fit_to_page_sizes_slides_before_the_title_slide(renders):
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    # Wide first page: 12 x 6 in
+    result = pdf_to_pptx_worker.pdf_to_pptx(
+        "testjob", _input([(864, 432), (612, 792)]), {"workers": 1, "fit_to_page": True, "dpi": 36}
+    )
+
+    prs = Presentation(result["file_path"])
+    assert prs.slide_width == Inches(10)
+    assert prs.slide_height == Inches(5)
+    # The title slide's placeholders were laid out for the final size
+    for placeholder in prs.slides[0].placeholders:
+        assert placeholder.top + placeholder.height <= prs.slide_height
+    for slide in list(prs.slides)[1:]:
+        (picture,) = slide.shapes
+        assert picture.top >= 0 and picture.top + picture.height <= prs.slide_height
+        assert picture.left >= 0 and picture.left + picture.width <= prs.slide_width
@@ -0,0 +1,82 @@
+import csv
+import io
+import os
+import tempfile
+import zipfile
+try:
+    from workers.pdf_to_xlsx_worker import pdf_to_xlsx
+except ImportError:
+    from pdf_to_xlsx_worker import pdf_to_xlsx
+
+ROWS = [["Item", "Qty"], ["Apples", "3"], ["Pears", "5"]]
+
+
+def _make_table_pdf(path, num_pages):
+    """One ruled 3 x 2 table per page; the last cell carries the page number."""
+    import pikepdf
+    pdf = pikepdf.Pdf.new()
+    font = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name.Helvetica
+    ))
+    for i in range(num_pages):
+        rows = ROWS[:-1] + [["Pears", str(i + 1)]]
+        ops = ["1 w"]
+        for r in range(len(rows)):
+            for c in range(2):
+                x, y = 72 + c * 150, 700 - r * 30
+                ops.append(f"{x} {y} 150 30 re S")
+                ops.append(f"BT /F1 12 Tf {x + 5} {y + 10} Td ({rows[r][c]}) Tj ET")
+        page = pdf.add_blank_page(page_size=(612, 792))
+        page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+        page.Contents = pdf.make_stream("\n".join(ops).encode())
+    pdf.save(path)
+    pdf.close()
+
+
+def _input(num_pages):
+    input_path = os.path.join(tempfile.mkdtemp(), "input.pdf")
+    _make_table_pdf(input_path, num_pages)
+    return input_path
+
+
+def test_pdf_to_xlsx_streams_one_sheet_per_table_in_page_order():
+    from openpyxl import load_workbook
+
+    result = pdf_to_xlsx("testjob", _input(5), {"workers": 2, "chunk_pages": 2, "extract_text": True})
+
+    assert result["file_path"].endswith("output.xlsx")
+    wb = load_workbook(result["file_path"], read_only=True)
+    assert wb.sheetnames == [name for i in range(1, 6) for name in (f"Page{i}_Table1", f"Text_Page{i}")]
+    assert [list(row) for row in wb["Page4_Table1"].iter_rows(values_only=True)] == [
+        ["Item", "Qty"], ["Apples", "3"], ["Pears", "4"]
+    ]
+    assert "Apples" in next(wb["Text_Page4"].iter_rows(values_only=True))[0]
+    wb.close()
+
+
+def test_pdf_to_xlsx_without_tables_still_writes_a_valid_workbook():
+    import pikepdf
+    from openpyxl import load_workbook
+
+    input_path = os.path.join(tempfile.mkdtemp(), "input.pdf")
+    pdf = pikepdf.Pdf.new()
+    pdf.add_blank_page(page_size=(612, 792))
+    pdf.save(input_path)
+    pdf.close()
+
+    result = pdf_to_xlsx("testjob", input_path, {"workers": 1})
+
+    wb = load_workbook(result["file_path"], read_only=True)
+    assert wb.sheetnames == ["Sheet"]
+    wb.close()
+
+
+def test_pdf_to_xlsx_csv_option_writes_zip_of_tables():
+    result = pdf_to_xlsx("testjob", _input(3), {"output_format": "csv", "workers": 2, "chunk_pages": 1})
+
+    assert result["file_path"].endswith("output.zip")
+    with zipfile.ZipFile(result["file_path"]) as zipf:
+        assert zipf.namelist() == ["Page1_Table1.csv", "Page2_Table1.csv", "Page3_Table1.csv"]
+        with zipf.open("Page2_Table1.csv") as raw:
+            rows = list(csv.reader(io.TextIOWrapper(raw, encoding="utf-8", newline="")))
+    assert rows == [["Item", "Qty"], ["Apples", "3"], ["Pears", "2"]]
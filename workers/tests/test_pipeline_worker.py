@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import pytest
+try:
+    from workers.pipeline_worker import parse_steps, run_pipeline
+except ImportError:
+    from pipeline_worker import parse_steps, run_pipeline
+
+
+def _make_pdf(path, num_pages):
+    import pikepdf
+    pdf = pikepdf.Pdf.new()
+    for _ in range(num_pages):
+        pdf.add_blank_page()
+    pdf.save(path)
+    pdf.close()
+    return path
+
+
+def test_pipeline_runs_native_steps_in_memory():
+    import pikepdf
+    tmp_dir = tempfile.mkdtemp()
+    inputs = [_make_pdf(os.path.join(tmp_dir, f"{name}.pdf"), pages) for name, pages in (("a", 2), ("b", 3))]
+
+    result = run_pipeline("pipelinejob", inputs, {"steps": [
+        {"tool": "merge"},
+        {"tool": "rotate", "params": {"angle": 90, "pages": "1-2"}},
+        {"tool": "metadata", "params": {"title": "Report"}},
+        {"tool": "protect", "params": {"password": "secret"}},
+    ]})
+
+    assert result["steps"] == ["merge", "rotate", "metadata", "protect"]
+    # One open per input and a single write: no intermediate files
+    assert set(result["timings"]["stages"]) == {"open", "1_merge", "2_rotate", "3_metadata", "4_protect", "save"}
+    with pytest.raises(pikepdf.PasswordError):
+        pikepdf.open(result["file_path"])
+    with pikepdf.open(result["file_path"], password="secret") as pdf:
+        assert [int(page.get("/Rotate", 0)) for page in pdf.pages] == [90, 90, 0, 0, 0]
+        assert str(pdf.docinfo.Title) == "Report"
+
+
+@pytest.mark.skipif(not shutil.which("gs"), reason="Ghostscript not installed")
+def test_pipeline_hands_files_to_external_tools():
+    import pikepdf
+    input_path = _make_pdf(os.path.join(tempfile.mkdtemp(), "in.pdf"), 2)
+
+    result = run_pipeline("pipelinegs", [input_path], {"steps": [
+        {"tool": "rotate", "params": {"angle": 180}},
+        {"tool": "compress", "params": {"level": "high"}},
+    ]})
+
+    with pikepdf.open(result["file_path"]) as pdf:
+        assert [int(page.get("/Rotate", 0)) for page in pdf.pages] == [180, 180]
+    # Step files are cleaned up with the task
+    assert not [name for name in os.listdir("/data") if name.startswith("pipelinegs_step")]
+
+
+@pytest.mark.parametrize("steps, message", [
+    ([], "non-empty"),
+    ([{"tool": "split"}], "tool must be one of"),
+    ([{"tool": "rotate"}, {"tool": "merge"}], "must be the first step"),
+    ([{"tool": "protect", "params": {"password": "x"}}, {"tool": "rotate"}], "must be the last step"),
+])
+def test_parse_steps_rejects_invalid_pipelines(steps, message):
+    with pytest.raises(ValueError, match=message):
+        parse_steps({"steps": steps})
@@ -0,0 +1,46 @@
+import os
+import tempfile
+try:
+    from workers.rotate_pages_worker import rotate_pages
+except ImportError:
+    from rotate_pages_worker import rotate_pages
+
+
+def _make_pdf(path, num_pages, **save_kwargs):
+    import pikepdf
+    pdf = pikepdf.Pdf.new()
+    for _ in range(num_pages):
+        pdf.add_blank_page()
+    pdf.save(path, **save_kwargs)
+    pdf.close()
+
+
+def test_rotate_pages_appends_incremental_update():
+    import pikepdf
+    tmp_dir = tempfile.mkdtemp()
+    input_path = os.path.join(tmp_dir, "in.pdf")
+    _make_pdf(input_path, 20)
+    with open(input_path, "rb") as f:
+        original = f.read()
+
+    result = rotate_pages("testjob", input_path, {"angle": 90, "pages": "3"})
+
+    assert result["incremental"] is True
+    with open(result["file_path"], "rb") as f:
+        assert f.read().startswith(original)
+    with pikepdf.open(result["file_path"]) as pdf:
+        assert not pdf.get_warnings()
+        assert [int(page.get("/Rotate", 0)) for page in pdf.pages[:4]] == [0, 0, 90, 0]
+
+
+def test_rotate_pages_falls_back_to_full_save_for_encrypted_input():
+    import pikepdf
+    tmp_dir = tempfile.mkdtemp()
+    input_path = os.path.join(tmp_dir, "in.pdf")
+    _make_pdf(input_path, 2, encryption=pikepdf.Encryption(user="", owner="secret"))
+
+    result = rotate_pages("testjob", input_path, {"angle": 180})
+
+    assert result["incremental"] is False
+    with pikepdf.open(result["file_path"]) as pdf:
+        assert [int(page.Rotate) for page in pdf.pages] == [180, 180]
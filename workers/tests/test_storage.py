@@ -0,0 +1,191 @@
+import os
+import tempfile
+import pytest
+try:
+    from workers import storage as storage_module
+    from workers.storage import InputCache, LocalStorage, S3Storage, with_storage
+except ImportError:
+    import storage as storage_module
+    from storage import InputCache, LocalStorage, S3Storage, with_storage
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    pytest.importorskip("boto3")
+    server_module = pytest.importorskip("moto.server")
+    server = server_module.ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def s3(s3_endpoint, monkeypatch):
+    root = tempfile.mkdtemp()
+    monkeypatch.setenv("STORAGE_ENDPOINT_URL", s3_endpoint)
+    monkeypatch.setenv("STORAGE_BUCKET", f"test-{os.path.basename(root).lower().replace('_', '-')}")
+    monkeypatch.setenv("STORAGE_PART_SIZE", str(5 * 1024 * 1024))
+    monkeypatch.setenv("STORAGE_CACHE_DIR", os.path.join(root, ".cache"))
+    monkeypatch.setenv("MINIO_ROOT_USER", "test")
+    monkeypatch.setenv("MINIO_ROOT_PASSWORD", "test")
+    return S3Storage(root)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_local_storage_lists_and_reads_ranges():
+    root = tempfile.mkdtemp()
+    for name in ("page_10.pdf", "page_2.pdf", "page_1.pdf"):
+        _write(os.path.join(root, "job_split", name), name.encode())
+    local = LocalStorage(root)
+
+    assert [entry[0] for entry in local.list(os.path.join(root, "job_split"))] == [
+        "page_1.pdf", "page_2.pdf", "page_10.pdf"
+    ]
+    assert local.stat(os.path.join(root, "job_split")) == {"dir": True}
+    assert local.stat(os.path.join(root, "missing")) is None
+    path = os.path.join(root, "job_split", "page_10.pdf")
+    assert b"".join(local.iter_range(path, 2, 5)) == b"ge_1"
+    assert local.presigned_url(path) is None
+
+
+def test_s3_multipart_publish_stat_and_ranged_reads(s3):
+    data = os.urandom(12 * 1024 * 1024)  # three parts
+    path = _write(os.path.join(s3.root, "job", "input.pdf"), data)
+    s3.publish(path)
+
+    stat = s3.stat(path)
+    assert stat["size"] == len(data)
+    assert stat["etag"].endswith('-3"')  # multipart ETag
+    assert b"".join(s3.iter_range(path, 100, 199)) == data[100:200]
+
+    _write(os.path.join(s3.root, "job_split", "page_2.pdf"), b"two")
+    _write(os.path.join(s3.root, "job_split", "page_10.pdf"), b"ten")
+    s3.publish(os.path.join(s3.root, "job_split"))
+    assert s3.stat(os.path.join(s3.root, "job_split")) == {"dir": True}
+    assert [entry[0] for entry in s3.list(os.path.join(s3.root, "job_split"))] == ["page_2.pdf", "page_10.pdf"]
+    assert s3.stat(os.path.join(s3.root, "nothing")) is None
+
+
+def test_s3_localize_reads_through_cache(s3):
+    path = _write(os.path.join(s3.root, "job", "input.pdf"), b"%PDF-1.4 cached")
+    s3.publish(path)
+    s3.release(path)
+    assert not os.path.exists(path)
+
+    assert s3.localize(path) == path
+    with open(path, "rb") as f:
+        assert f.read() == b"%PDF-1.4 cached"
+    cached = s3.cache._path(s3.key(path))
+    assert os.path.exists(cached)
+
+    # A second localize is served from the cache, not the bucket
+    s3.release(path)
+    s3._download = None
+    assert s3.localize(path) == path
+
+
+def test_input_cache_evicts_least_recently_used():
+    cache = InputCache(tempfile.mkdtemp(), max_bytes=250)
+
+    def filler(size):
+        return lambda tmp: _write(tmp, b"x" * size)
+
+    first = cache.get("a.pdf", filler(100))
+    os.utime(first, (1, 1))
+    second = cache.get("b.pdf", filler(100))
+    os.utime(second, (2, 2))
+    third = cache.get("c.pdf", filler(100))
+
+    assert not os.path.exists(first)
+    assert os.path.exists(second) and os.path.exists(third)
+
+
+def test_presigned_put_and_get(s3):
+    import requests
+    path = os.path.join(s3.root, "upload", "direct.pdf")
+    resp = requests.put(s3.presigned_url(path, "PUT"), data=b"%PDF-1.4 direct")
+    assert resp.status_code == 200
+    assert s3.stat(path)["size"] == len(b"%PDF-1.4 direct")
+
+    resp = requests.get(s3.presigned_url(path, "GET", filename="direct.pdf"))
+    assert resp.content == b"%PDF-1.4 direct"
+    assert "direct.pdf" in resp.headers["Content-Disposition"]
+
+
+def test_with_storage_localizes_inputs_and_publishes_result(s3, monkeypatch):
+    monkeypatch.setattr(storage_module, "storage", s3)
+    monkeypatch.setattr(storage_module, "DATA_DIR", s3.root)
+    input_path = _write(os.path.join(s3.root, "job", "input.pdf"), b"input")
+    s3.publish(input_path)
+    s3.release(input_path)
+    output_path = os.path.join(s3.root, "job_out.pdf")
+
+    @with_storage
+    def task(job_id, input_path, params):
+        with open(input_path, "rb") as src:
+            _write(output_path, src.read().upper())
+        return {"file_path": output_path}
+
+    assert task("job", input_path, {}) == {"file_path": output_path}
+    # Node-local copies are gone; the result is in the bucket
+    assert not os.path.exists(input_path) and not os.path.exists(output_path)
+    assert b"".join(s3.iter_range(output_path)) == b"INPUT"
+
+
+def test_with_storage_removes_intermediates_but_keeps_result(monkeypatch):
+    root = tempfile.mkdtemp()
+    monkeypatch.setattr(storage_module, "storage", LocalStorage(root))
+    input_path = _write(os.path.join(root, "job", "input.pdf"), b"input")
+
+    @with_storage
+    def task(job_id, input_path, params):
+        attempts = [storage_module.intermediate(_write(os.path.join(root, f"job_try_{i}.pdf"), b"x")) for i in range(2)]
+        scratch_dir = storage_module.intermediate(os.path.join(root, "job_imgs"))
+        _write(os.path.join(scratch_dir, "page_1.png"), b"png")
+        return {"file_path": attempts[1]}
+
+    assert task("job", input_path, {}) == {"file_path": os.path.join(root, "job_try_1.pdf")}
+    assert sorted(os.listdir(root)) == ["job", "job_try_1.pdf"]
+
+
+def test_with_storage_publishes_assets_with_result(s3, monkeypatch):
+    monkeypatch.setattr(storage_module, "storage", s3)
+    monkeypatch.setattr(storage_module, "DATA_DIR", s3.root)
+    input_path = _write(os.path.join(s3.root, "job", "input.pdf"), b"input")
+    s3.publish(input_path)
+    s3.release(input_path)
+    output_path = os.path.join(s3.root, "job", "output.html")
+
+    @with_storage
+    def task(job_id, input_path, params):
+        image_path = storage_module.asset(_write(os.path.join(s3.root, "job", "page_1.png"), b"png"))
+        _write(output_path, f'<img src="{os.path.basename(image_path)}">'.encode())
+        return {"file_path": output_path}
+
+    task("job", input_path, {})
+    image_path = os.path.join(s3.root, "job", "page_1.png")
+    assert not os.path.exists(image_path)
+    assert b"".join(s3.iter_range(image_path)) == b"png"
+
+
+def test_input_cache_links_under_lock_and_keeps_lock_file():
+    directory = tempfile.mkdtemp()
+    cache = InputCache(directory, max_bytes=150)
+    target = os.path.join(tempfile.mkdtemp(), "input.pdf")
+
+    cached = cache.get("a.pdf", lambda tmp: _write(tmp, b"x" * 100), link_to=target)
+    assert os.path.samefile(cached, target)
+    cache.get("b.pdf", lambda tmp: _write(tmp, b"y" * 100))
+
+    # The linked copy survives eviction of the cached one; the lock file is never evicted
+    assert not os.path.exists(cached)
+    with open(target, "rb") as f:
+        assert f.read() == b"x" * 100
+    assert os.path.exists(os.path.join(directory, InputCache.LOCK_NAME))
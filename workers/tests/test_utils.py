@@ -0,0 +1,42 @@
+import os
+import time
+try:
+    from workers.utils import imap_ordered, parse_bool
+except ImportError:
+    from utils import imap_ordered, parse_bool
+
+
+def _pid_after(delay):
+    time.sleep(delay)
+    return delay, os.getpid()
+
+
+def _run_in_pool(queue):
+    results = list(imap_ordered(_pid_after, [0.2, 0.1, 0.0, 0.1, 0.2, 0.0], processes=3))
+    queue.put((os.getpid(), results))
+
+
+def test_imap_ordered_keeps_order():
+    results = list(imap_ordered(_pid_after, [0.1, 0.0, 0.05, 0.0], processes=2))
+    assert [delay for delay, _ in results] == [0.1, 0.0, 0.05, 0.0]
+
+
+def test_imap_ordered_parallelizes_inside_a_daemonic_process():
+    # Celery's prefork pool runs tasks in daemonic billiard processes
+    import billiard
+
+    queue = billiard.Queue()
+    child = billiard.Process(target=_run_in_pool, args=(queue,), daemon=True)
+    child.start()
+    child_pid, results = queue.get(timeout=30)
+    child.join(timeout=30)
+
+    assert [delay for delay, _ in results] == [0.2, 0.1, 0.0, 0.1, 0.2, 0.0]
+    pids = {pid for _, pid in results}
+    assert child_pid not in pids and len(pids) > 1
+
+
+def test_parse_bool_reads_json_and_string_flags():
+    assert parse_bool(True) and parse_bool("true") and parse_bool("1") and parse_bool(" Yes ")
+    assert not parse_bool(False) and not parse_bool("false") and not parse_bool("0") and not parse_bool("")
+    assert parse_bool(None) is False and parse_bool(None, default=True) is True
@@ -2,11 +2,14 @@
 Worker to unlock/remove password from PDF
 """
 from .celery_app import celery_app
+from .instrumentation import instrument, stage
+from .storage import with_storage
 import os
-import pikepdf
 
 
 @celery_app.task(name="unlock_pdf", bind=True)
+@with_storage
+@instrument("unlock_pdf")
 def unlock_pdf(self, job_id: str, input_path: str, params: dict = None) -> dict:
     """
     Unlock/remove password from PDF
@@ -20,6 +23,8 @@ def unlock_pdf(self, job_id: str, input_path: str, params: dict = None) -> dict:
     Returns:
         dict with file_path to unprotected PDF
     """
+    import pikepdf
+
     if params is None:
         params = {}
     
@@ -32,7 +37,8 @@ def unlock_pdf(self, job_id: str, input_path: str, params: dict = None) -> dict:
         # Open PDF with password
         with pikepdf.open(input_path, password=password) as pdf:
             # Save without encryption
-            pdf.save(output_path)
+            with stage("save"):
+                pdf.save(output_path)
         
         return {"file_path": output_path}
     
@@ -16,3 +16,85 @@ def get_secret(secret_name, default=None):
     
     # 2. Try Environment variable (Upper case)
     return os.environ.get(secret_name.upper(), default)
+
+
+def count_pages(input_path):
+    """
+    Return the number of pages in a PDF without parsing page contents.
+    The count is also noted for the task's instrumentation.
+    """
+    import pikepdf
+    from .instrumentation import note_pages
+
+    with pikepdf.open(input_path) as pdf:
+        pages = len(pdf.pages)
+    note_pages(input_path, pages)
+    return pages
+
+
+def page_ranges(total_pages, chunk_size):
+    """
+    Split [0, total_pages) into half-open (start, end) ranges of at most chunk_size pages.
+    """
+    chunk_size = max(1, int(chunk_size))
+    return [(start, min(start + chunk_size, total_pages)) for start in range(0, total_pages, chunk_size)]
+
+
+def parse_bool(value, default=False):
+    """
+    Read a boolean job param. Params arrive as JSON, so besides true/false
+    clients send strings such as "true", "false", "1" or "0".
+    """
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def pool_size(params=None):
+    """
+    Number of processes to use for page-parallel work.
+    Priority: params['workers'] > os.environ['PDF_POOL_PROCESSES'] > cpu count
+    """
+    params = params or {}
+    value = params.get("workers") or os.environ.get("PDF_POOL_PROCESSES") or os.cpu_count() or 1
+    return max(1, int(value))
+
+
+def imap_ordered(func, items, processes=1):
+    """
+    Yield func(item) for each item, in input order.
+
+    Runs on a process pool when more than one process is requested. Only a
+    bounded window of results is kept in flight, so callers can stream results
+    to disk without holding the whole document in memory. The pool is
+    billiard's (Celery's fork of multiprocessing), which unlike the standard
+    library lets the daemonic children of Celery's prefork pool start
+    processes of their own.
+    """
+    from collections import deque
+    from billiard import Pool
+
+    items = list(items)
+    if processes <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    processes = min(processes, len(items))
+    window = processes * 2
+    pool = Pool(processes)
+    try:
+        pending = deque()
+        for item in items:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) >= window:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        # On failure or an early stop only the window in flight is left to
+        # finish: billiard's terminate() can hang joining killed workers
+        pool.close()
+        pool.join()